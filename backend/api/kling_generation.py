@@ -19,14 +19,21 @@ import threading
 import traceback
 
 from pipeline_kling import KlingPipeline
-from utils.video_utils import extract_first_frame, extract_last_frame
+from utils.video_utils import extract_frames
+from utils.renditions import RENDITION_FORMATS
 from config import (
     KLING_ACCESS_KEY,
     KLING_SECRET_KEY,
     KLING_VIDEO_ACCESS_KEY,
     KLING_VIDEO_SECRET_KEY,
+    KLING_MAX_CONCURRENT_PIPELINES,
+    KLING_RESUME_ON_STARTUP,
 )
 import database as db  # 导入数据库模块
+from services.kling_latency_model import latency_model
+from services.kling_concurrency import concurrency_governor
+from services.kling_result_cache import result_cache
+from services.pipeline_journal import find_interrupted_journals, mark_journal_failed
 
 router = APIRouter(prefix="/api/kling", tags=["kling"])
 
@@ -69,7 +76,7 @@ _active_tasks = {}  # {pet_id: {"status": "running", "started_at": timestamp, "u
 _task_queue = []  # 等待队列
 
 # 并发限制配置
-MAX_CONCURRENT_TASKS = 1  # 最大同时运行的任务数（可灵API并发限制为3，保守设为1）
+MAX_CONCURRENT_TASKS = KLING_MAX_CONCURRENT_PIPELINES  # 最大同时运行的任务数（可灵API并发由 kling_concurrency 统一准入控制）
 MAX_QUEUE_SIZE = 10  # 最大排队数量
 TASK_TIMEOUT_SECONDS = 3600  # 任务超时时间（1小时）
 
@@ -670,7 +677,8 @@ async def init_pet_task(
     color: str = Form(...),
     species: str = Form(...),
     weight: str = Form(""),
-    birthday: str = Form("")
+    birthday: str = Form(""),
+    use_cache: bool = Form(True)
 ):
     """
     初始化宠物任务（必须上传原始图片）
@@ -682,6 +690,7 @@ async def init_pet_task(
         species: 物种（猫/犬）
         weight: 重量（可选，如：5kg）
         birthday: 生日（可选，如：2020-01-01）
+        use_cache: 是否复用相同请求的已生成结果（默认启用，传 false 强制重新生成）
 
     Returns:
         任务ID和初始状态
@@ -747,6 +756,7 @@ async def init_pet_task(
         "species": species,
         "weight": weight,
         "birthday": birthday,
+        "use_cache": use_cache,
         "current_step": 0,
         "validation_result": validation_result,  # 保存验证结果
         "validation_warnings": [w['message'] for w in warnings] if warnings else [],
@@ -896,6 +906,7 @@ async def step2_generate_base_image(
             use_v3_prompts=True,  # 启用v3.0智能提示词系统
             video_access_key=VIDEO_ACCESS_KEY,
             video_secret_key=VIDEO_SECRET_KEY,
+            use_cache=task.get("use_cache", True),
         )
 
         # 执行步骤2
@@ -944,7 +955,8 @@ def run_pipeline_in_background(
     weight: str = "",
     birthday: str = "",
     video_model_name: str = "kling-v2-1-master",
-    video_model_mode: str = "pro"
+    video_model_mode: str = "pro",
+    use_cache: bool = True
 ):
     """
     在后台线程中执行完整的生成流程
@@ -964,6 +976,7 @@ def run_pipeline_in_background(
         birthday: 生日
         video_model_name: 视频模型名称
         video_model_mode: 视频模型模式
+        use_cache: 是否复用相同请求的已生成结果
     """
     try:
         print(f"\n{'='*70}")
@@ -997,6 +1010,7 @@ def run_pipeline_in_background(
             video_model_mode=video_model_mode,
             video_access_key=VIDEO_ACCESS_KEY,
             video_secret_key=VIDEO_SECRET_KEY,
+            use_cache=use_cache,
         )
 
         # 解析weight为浮点数（用于v3.0智能分析）
@@ -1070,6 +1084,9 @@ def run_pipeline_in_background(
         task_status[pet_id]["message"] = f"❌ 生成失败: {error_msg}"
         task_status[pet_id]["error"] = error_trace
 
+        # 断点日志标记失败（服务重启时不再自动恢复）
+        mark_journal_failed(OUTPUT_DIR / pet_id, error_msg)
+
         # 同步到数据库
         db.update_task(pet_id, status='failed',
                        message=f'❌ 生成失败: {error_msg}')
@@ -1080,6 +1097,99 @@ def run_pipeline_in_background(
         print(f"🔓 任务 {pet_id} 已释放执行槽位，系统状态: {_get_system_status()}")
 
 
+RESUME_SLOT_WAIT_SECONDS = 30  # 恢复任务等待执行槽位的轮询间隔
+
+
+def _resume_pipelines_worker(interrupted: list):
+    """依次恢复中断的流程（按正常并发限制排队获取执行槽位）"""
+    for pet_id, journal in interrupted:
+        params = journal.get("params", {})
+        pet_dir = OUTPUT_DIR / pet_id
+
+        # 上传文件在系统临时目录，重新部署后通常已不存在，改用流程保存的原图
+        upload_path = params.get("uploaded_image", "")
+        if not upload_path or not os.path.exists(upload_path):
+            upload_path = str(pet_dir / "original.jpg")
+        if not os.path.exists(upload_path):
+            print(f"❌ 无法恢复 {pet_id}：原图不存在")
+            mark_journal_failed(pet_dir, "恢复失败：原图不存在")
+            continue
+
+        while True:
+            can_run, _, _ = _check_and_acquire_slot(pet_id, user_info="resume")
+            if can_run:
+                break
+            time.sleep(RESUME_SLOT_WAIT_SECONDS)
+        with _global_task_lock:
+            if pet_id in _task_queue:
+                _task_queue.remove(pet_id)
+
+        task_status[pet_id] = {
+            "status": "processing",
+            "progress": 0,
+            "message": "♻️ 服务重启，正在恢复中断的任务...",
+            "current_step": "resume",
+            "breed": params.get("breed", ""),
+            "color": params.get("color", ""),
+            "species": params.get("species", ""),
+            "weight": str(params.get("weight") or ""),
+            "birthday": params.get("birthday", ""),
+            "video_model_name": params.get("video_model_name"),
+            "video_model_mode": params.get("video_model_mode"),
+            "results": None,
+            "error": None,
+            "started_at": time.time(),
+            "resumed": True,
+        }
+        try:
+            db.update_task(pet_id, status='processing', message='♻️ 服务重启，正在恢复中断的任务...')
+        except Exception as e:
+            print(f"⚠️ 数据库操作失败: {str(e)}")
+
+        print(f"♻️ 恢复中断的任务: {pet_id}（已完成 {len(journal.get('artifacts', {}))} 个产物，"
+              f"{len(journal.get('tasks', {}))} 个在途任务）")
+        threading.Thread(
+            target=run_pipeline_in_background,
+            args=(pet_id, upload_path, params.get("breed", ""), params.get("color", ""),
+                  params.get("species", ""), str(params.get("weight") or ""), params.get("birthday", ""),
+                  params.get("video_model_name", "kling-v2-1-master"), params.get("video_model_mode", "pro"),
+                  params.get("use_cache", True)),
+            daemon=True
+        ).start()
+
+
+def resume_interrupted_pipelines() -> list:
+    """
+    服务启动时恢复被重启/重新部署中断的后台生成流程
+
+    读取每个宠物目录下的断点日志：已完成的产物直接跳过，在途的可灵任务直接接管，不重新提交。
+    只恢复完整流程（/generate）；多模型对比的子流程由调用方重新发起。
+
+    Returns:
+        将要恢复的 pet_id 列表
+    """
+    if not KLING_RESUME_ON_STARTUP:
+        return []
+
+    interrupted = []
+    for pet_id, journal in find_interrupted_journals(OUTPUT_DIR):
+        if journal.get("kind") == "full":
+            interrupted.append((pet_id, journal))
+        else:
+            print(f"⚠️ 跳过中断的{journal.get('kind')}流程: {pet_id}（需重新发起）")
+            mark_journal_failed(OUTPUT_DIR / pet_id, "服务重启中断")
+
+    if interrupted:
+        print(f"♻️ 发现 {len(interrupted)} 个中断的生成任务，开始恢复...")
+        threading.Thread(
+            target=_resume_pipelines_worker,
+            args=(interrupted,),
+            name="pipeline-resume",
+            daemon=True
+        ).start()
+    return [pet_id for pet_id, _ in interrupted]
+
+
 @router.get("/system-status")
 async def get_system_status():
     """
@@ -1093,10 +1203,16 @@ async def get_system_status():
         - max_queue: 最大排队数
         - active_task_ids: 正在运行的任务ID列表
         - queued_task_ids: 排队中的任务ID列表
+        - adaptive_polling: 各模型任务耗时分布，以及自适应轮询相对固定间隔节省的查询次数/检测延迟
+        - kling_concurrency: 各密钥图片/视频并发槽位占用、排队情况，以及 AIMD 学习到的并发上限和限流次数
+        - kling_result_cache: 生成结果缓存的命中/未命中/淘汰次数和占用空间
     """
     status = _get_system_status()
     status["available_slots"] = status["max_concurrent"] - status["running_tasks"]
     status["can_accept_new_task"] = status["running_tasks"] < status["max_concurrent"]
+    status["adaptive_polling"] = latency_model.get_report()
+    status["kling_concurrency"] = concurrency_governor.get_stats()
+    status["kling_result_cache"] = result_cache.get_stats()
     
     return JSONResponse(status)
 
@@ -1110,7 +1226,8 @@ async def generate_pet_animations(
     weight: str = Form(""),
     birthday: str = Form(""),
     video_model_name: str = Form("kling-v2-1-master"),
-    video_model_mode: str = Form("pro")
+    video_model_mode: str = Form("pro"),
+    use_cache: bool = Form(True)
 ):
     """
     生成宠物动画完整流程（后台执行，立即返回）
@@ -1124,6 +1241,7 @@ async def generate_pet_animations(
         birthday: 生日（可选，如：2020-01-01）
         video_model_name: 视频模型名称（默认：kling-v2-1-master）
         video_model_mode: 视频模型模式（默认：pro）
+        use_cache: 是否复用相同请求的已生成结果（默认启用，传 false 强制重新生成）
 
     Returns:
         任务ID和初始状态（任务在后台执行）
@@ -1300,7 +1418,7 @@ async def generate_pet_animations(
             thread = threading.Thread(
                 target=run_pipeline_in_background,
                 args=(pet_id, str(upload_path), breed, color, species, weight, birthday,
-                      video_model_name, video_model_mode),
+                      video_model_name, video_model_mode, use_cache),
                 daemon=True  # 守护线程，主进程退出时自动结束
             )
             thread.start()
@@ -1418,6 +1536,7 @@ async def step3_generate_initial_videos(
                 use_v3_prompts=True,  # 启用v3.0智能提示词系统
                 video_access_key=VIDEO_ACCESS_KEY,
                 video_secret_key=VIDEO_SECRET_KEY,
+                use_cache=task.get("use_cache", True),
             )
 
             # 执行步骤3
@@ -1507,6 +1626,7 @@ async def step4_generate_remaining_videos(pet_id: str):
             use_v3_prompts=True,  # 启用v3.0智能提示词系统
             video_access_key=VIDEO_ACCESS_KEY,
             video_secret_key=VIDEO_SECRET_KEY,
+            use_cache=task.get("use_cache", True),
         )
 
         # 执行步骤4
@@ -1560,6 +1680,7 @@ async def step5_generate_loop_videos(pet_id: str):
             use_v3_prompts=True,  # 启用v3.0智能提示词系统
             video_access_key=VIDEO_ACCESS_KEY,
             video_secret_key=VIDEO_SECRET_KEY,
+            use_cache=task.get("use_cache", True),
         )
 
         # 执行步骤5
@@ -1767,6 +1888,10 @@ async def download_file_simple(pet_id: str, filename: str):
         media_type = "video/mp4"
     elif suffix == '.gif':
         media_type = "image/gif"
+    elif suffix == '.webp':
+        media_type = "image/webp"
+    elif suffix == '.json':
+        media_type = "application/json"
     else:
         media_type = "application/octet-stream"
 
@@ -1812,6 +1937,10 @@ async def download_file(pet_id: str, file_type: str, filename: str):
         media_type = "video/mp4"
     elif suffix == '.gif':
         media_type = "image/gif"
+    elif suffix == '.webp':
+        media_type = "image/webp"
+    elif suffix == '.json':
+        media_type = "application/json"
     else:
         media_type = "application/octet-stream"
 
@@ -1824,18 +1953,29 @@ async def download_file(pet_id: str, file_type: str, filename: str):
     )
 
 
+def _parse_formats(formats: str) -> list:
+    """解析逗号分隔的动图格式列表（gif/webp/apng/mp4）"""
+    selected = [fmt.strip().lower() for fmt in formats.split(",") if fmt.strip()]
+    unknown = [fmt for fmt in selected if fmt not in RENDITION_FORMATS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"不支持的格式: {unknown}（可选 {list(RENDITION_FORMATS)}）")
+    return selected
+
+
 @router.get("/download-all/{pet_id}")
-async def get_all_download_links(pet_id: str, base_url: str = ""):
+async def get_all_download_links(pet_id: str, base_url: str = "", formats: str = "gif"):
     """
     获取所有可下载文件的链接列表（含GIF和拼接视频）
 
     Args:
         pet_id: 宠物ID
         base_url: 基础URL（可选，用于生成完整URL）
+        formats: 额外返回的动图格式，逗号分隔（如 gif,webp）；gif 以外的格式列在 renditions 中
 
     Returns:
         所有文件的下载链接，分类整理
     """
+    selected_formats = _parse_formats(formats)
     if pet_id not in task_status:
         raise HTTPException(status_code=404, detail="任务不存在")
 
@@ -1872,6 +2012,12 @@ async def get_all_download_links(pet_id: str, base_url: str = ""):
             "loops": [],                # 循环动图
         },
 
+        # 其他动图格式（按 formats 参数）: {"webp": {"transitions": [], "loops": []}}
+        "renditions": {},
+
+        # 精灵图集（所有动画打包成少数几张图集 + 帧矩形清单）
+        "sprite_atlas": None,
+
         # 拼接视频
         "concatenated_video": None,
 
@@ -1950,6 +2096,31 @@ async def get_all_download_links(pet_id: str, base_url: str = ""):
                 download_links["gifs"]["loops"].append(gif_info)
                 download_links["quick_download"]["all_gifs"].append(gif_info)
 
+    # ========== 其他动图格式 ==========
+    renditions_data = steps.get("renditions") or {}
+    for fmt in selected_formats:
+        if fmt == "gif":
+            continue
+        directory, ext = RENDITION_FORMATS[fmt]
+        download_links["renditions"][fmt] = {"transitions": [], "loops": []}
+        for category in ("transitions", "loops"):
+            for name in (renditions_data.get(fmt) or {}).get(category, {}):
+                download_links["renditions"][fmt][category].append({
+                    "name": name,
+                    "filename": f"{name}{ext}",
+                    "url": f"{api_prefix}/{directory}/{category}/{name}{ext}"
+                })
+
+    # ========== 精灵图集 ==========
+    manifest_path = steps.get("sprite_atlas")
+    if manifest_path and Path(manifest_path).exists():
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        download_links["sprite_atlas"] = {
+            "manifest": f"{api_prefix}/sprites/manifest.json",
+            "atlases": [f"{api_prefix}/sprites/{atlas['file']}" for atlas in manifest.get("atlases", [])],
+        }
+
     # ========== 拼接视频 ==========
     concat_video_path = steps.get("concatenated_video")
     if concat_video_path:
@@ -1968,23 +2139,27 @@ async def get_all_download_links(pet_id: str, base_url: str = ""):
         "total_transition_videos": len(download_links["transition_videos"]),
         "total_loop_videos": len(download_links["loop_videos"]),
         "total_gifs": len(download_links["quick_download"]["all_gifs"]),
+        "total_renditions": {fmt: sum(len(v) for v in items.values())
+                             for fmt, items in download_links["renditions"].items()},
         "has_concatenated_video": download_links["concatenated_video"] is not None,
+        "has_sprite_atlas": download_links["sprite_atlas"] is not None,
     }
 
     return JSONResponse(download_links)
 
 
 @router.get("/download-zip/{pet_id}")
-async def download_all_as_zip(pet_id: str, include: str = "gifs"):
+async def download_all_as_zip(pet_id: str, include: str = "gifs", formats: str = "gif"):
     """
     打包下载所有文件为ZIP
 
     Args:
         pet_id: 宠物ID
         include: 包含内容 (gifs/videos/all)
-            - gifs: 只包含GIF
+            - gifs: 只包含动图
             - videos: 只包含视频
             - all: 包含所有文件
+        formats: 动图格式，逗号分隔（gif/webp/apng/mp4，默认只有 gif）
 
     Returns:
         ZIP文件下载
@@ -1993,6 +2168,7 @@ async def download_all_as_zip(pet_id: str, include: str = "gifs"):
     import io
     from fastapi.responses import StreamingResponse
 
+    selected_formats = _parse_formats(formats)
     if pet_id not in task_status:
         raise HTTPException(status_code=404, detail="任务不存在")
 
@@ -2007,13 +2183,26 @@ async def download_all_as_zip(pet_id: str, include: str = "gifs"):
     with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
 
         if include in ["gifs", "all"]:
-            # 添加GIF文件
-            gifs_dir = base_dir / "gifs"
-            if gifs_dir.exists():
-                for gif_file in gifs_dir.rglob("*.gif"):
-                    arcname = f"gifs/{gif_file.relative_to(gifs_dir)}"
-                    zip_file.write(gif_file, arcname)
-                    print(f"  📦 添加: {arcname}")
+            # 添加动图文件（gifs/、webp/ 等目录）
+            for fmt in selected_formats:
+                directory, ext = RENDITION_FORMATS[fmt]
+                format_dir = base_dir / directory
+                if format_dir.exists():
+                    for anim_file in format_dir.rglob(f"*{ext}"):
+                        arcname = f"{directory}/{anim_file.relative_to(format_dir)}"
+                        zip_file.write(anim_file, arcname)
+                        print(f"  📦 添加: {arcname}")
+
+            # 添加精灵图集（清单 + 清单中列出的图集，目录里的其他文件不打包）
+            manifest_path = base_dir / "sprites" / "manifest.json"
+            if manifest_path.exists():
+                with open(manifest_path, "r", encoding="utf-8") as f:
+                    sprite_files = [atlas["file"] for atlas in json.load(f).get("atlases", [])]
+                for name in ["manifest.json"] + sprite_files:
+                    sprite_file = manifest_path.parent / name
+                    if sprite_file.is_file():
+                        zip_file.write(sprite_file, f"sprites/{name}")
+                        print(f"  📦 添加: sprites/{name}")
 
         if include in ["videos", "all"]:
             # 添加视频文件
@@ -2082,16 +2271,13 @@ async def extract_frames_from_video(
         output_dir = Path("output/kling_pipeline") / pet_id / "extracted_frames"
         output_dir.mkdir(parents=True, exist_ok=True)
 
-        # 提取首帧
+        # 提取首尾帧（一次解码）
         first_frame_filename = f"{Path(file.filename).stem}_first_frame.png"
         first_frame_path = str(output_dir / first_frame_filename)
-        extract_first_frame(str(video_path), first_frame_path)
-        print(f"✅ 首帧已提取: {first_frame_path}")
-
-        # 提取尾帧
         last_frame_filename = f"{Path(file.filename).stem}_last_frame.png"
         last_frame_path = str(output_dir / last_frame_filename)
-        extract_last_frame(str(video_path), last_frame_path)
+        extract_frames(str(video_path), outputs={0: first_frame_path, -1: last_frame_path})
+        print(f"✅ 首帧已提取: {first_frame_path}")
         print(f"✅ 尾帧已提取: {last_frame_path}")
 
         # 删除临时视频文件
@@ -2140,7 +2326,8 @@ def run_multi_model_pipeline_sequential(
     color: str,
     species: str,
     weight: str,
-    birthday: str
+    birthday: str,
+    use_cache: bool = True
 ):
     """
     顺序执行多个模型的生成任务（优化版）
@@ -2188,6 +2375,7 @@ def run_multi_model_pipeline_sequential(
             api_interval=BACKGROUND_API_INTERVAL,
             video_access_key=VIDEO_ACCESS_KEY,
             video_secret_key=VIDEO_SECRET_KEY,
+            use_cache=use_cache,
         )
 
         # 解析weight为浮点数
@@ -2276,6 +2464,7 @@ def run_multi_model_pipeline_sequential(
                 video_model_mode=mode,
                 video_access_key=VIDEO_ACCESS_KEY,
                 video_secret_key=VIDEO_SECRET_KEY,
+                use_cache=use_cache,
             )
 
             # 执行视频生成
@@ -2344,7 +2533,8 @@ async def generate_multi_model(
     color: str = Form(...),
     species: str = Form(...),
     weight: str = Form(""),
-    birthday: str = Form("")
+    birthday: str = Form(""),
+    use_cache: bool = Form(True)
 ):
     """
     使用多个模型顺序生成宠物动画（用于模型对比测试）
@@ -2358,6 +2548,7 @@ async def generate_multi_model(
         species: 物种
         weight: 重量（可选）
         birthday: 生日（可选）
+        use_cache: 是否复用相同请求的已生成结果（默认启用）
 
     Returns:
         包含4个任务ID的列表
@@ -2444,7 +2635,7 @@ async def generate_multi_model(
     # 启动一个后台线程顺序执行所有模型
     thread = threading.Thread(
         target=run_multi_model_pipeline_sequential,
-        args=(base_id, str(upload_path), breed, color, species, weight, birthday),
+        args=(base_id, str(upload_path), breed, color, species, weight, birthday, use_cache),
         daemon=True
     )
     thread.start()
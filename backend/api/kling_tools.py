@@ -5,13 +5,14 @@
 
 from fastapi import APIRouter, UploadFile, File, Form, HTTPException
 from fastapi.responses import FileResponse
+from fastapi.concurrency import run_in_threadpool
 from pathlib import Path
 import shutil
 import time
 import base64
 import tempfile
 
-from kling_api_helper import KlingAPI
+from kling_api_async import AsyncKlingAPI
 from config import (
     KLING_ACCESS_KEY,
     KLING_SECRET_KEY,
@@ -71,10 +72,10 @@ async def image_to_image(
             print(f"  负向提示词: {negative_prompt}")
         
         # 调用可灵AI（使用海外版 API）
-        kling = KlingAPI(ACCESS_KEY, SECRET_KEY, base_url=KLING_BASE_URL)
+        kling = AsyncKlingAPI(ACCESS_KEY, SECRET_KEY, base_url=KLING_BASE_URL)
 
         # 创建图生图任务
-        result = kling.image_to_image(
+        result = await kling.image_to_image(
             image_path=str(upload_path),
             prompt=prompt,
             negative_prompt=negative_prompt,
@@ -86,7 +87,7 @@ async def image_to_image(
         print(f"  任务ID: {task_id}")
         
         # 等待任务完成
-        task_data = kling.wait_for_task(task_id, max_wait_seconds=300)
+        task_data = await kling.wait_for_task(task_id, max_wait_seconds=300)
         
         # 提取图片URL
         image_url = None
@@ -102,7 +103,7 @@ async def image_to_image(
         
         # 下载图片
         output_path = OUTPUT_DIR / f"img2img_{timestamp}.png"
-        kling.download_image(image_url, str(output_path))
+        await kling.download_image(image_url, str(output_path))
         
         print(f"✅ 图生图完成: {output_path}")
         
@@ -152,10 +153,10 @@ async def image_to_video(
             print(f"  负向提示词: {negative_prompt}")
         
         # 调用可灵AI（使用海外版 API）
-        kling = KlingAPI(VIDEO_ACCESS_KEY, VIDEO_SECRET_KEY, base_url=KLING_BASE_URL)
+        kling = AsyncKlingAPI(VIDEO_ACCESS_KEY, VIDEO_SECRET_KEY, base_url=KLING_BASE_URL)
 
         # 创建图生视频任务
-        result = kling.image_to_video(
+        result = await kling.image_to_video(
             image_path=str(upload_path),
             prompt=prompt,
             negative_prompt=negative_prompt,
@@ -168,7 +169,7 @@ async def image_to_video(
         print(f"  任务ID: {task_id}")
         
         # 等待任务完成
-        task_data = kling.wait_for_video_task(task_id, max_wait_seconds=600)
+        task_data = await kling.wait_for_video_task(task_id, max_wait_seconds=600)
         
         # 提取视频URL
         video_url = None
@@ -184,7 +185,7 @@ async def image_to_video(
 
         # 下载视频
         output_path = OUTPUT_DIR / f"img2vid_{timestamp}.mp4"
-        kling.download_video(video_url, str(output_path))
+        await kling.download_video(video_url, str(output_path))
 
         print(f"✅ 图生视频完成: {output_path}")
 
@@ -234,11 +235,11 @@ async def frames_to_video(
         print(f"  尾帧: {last_frame_path}")
 
         # 调用可灵AI（使用海外版 API）
-        kling = KlingAPI(VIDEO_ACCESS_KEY, VIDEO_SECRET_KEY, base_url=KLING_BASE_URL)
+        kling = AsyncKlingAPI(VIDEO_ACCESS_KEY, VIDEO_SECRET_KEY, base_url=KLING_BASE_URL)
 
         # 创建图生视频任务
         prompt = "平滑过渡到目标姿态，自然流畅的动画效果"
-        result = kling.image_to_video(
+        result = await kling.image_to_video(
             image_path=str(first_frame_path),
             prompt=prompt,
             duration=5,
@@ -252,7 +253,7 @@ async def frames_to_video(
         print(f"  注意: 当前使用首帧生成视频，尾帧作为参考")
 
         # 等待任务完成
-        task_data = kling.wait_for_video_task(task_id, max_wait_seconds=600)
+        task_data = await kling.wait_for_video_task(task_id, max_wait_seconds=600)
 
         # 提取视频URL
         video_url = None
@@ -268,7 +269,7 @@ async def frames_to_video(
 
         # 下载视频
         output_path = OUTPUT_DIR / f"transition_{timestamp}.mp4"
-        kling.download_video(video_url, str(output_path))
+        await kling.download_video(video_url, str(output_path))
 
         print(f"✅ 过渡视频生成完成: {output_path}")
 
@@ -320,9 +321,10 @@ async def video_to_gif(
         # 导入视频工具
         from utils.video_utils import convert_mp4_to_gif
 
-        # 转换为GIF
+        # 转换为GIF（CPU密集，放到线程池，避免阻塞事件循环）
         output_path = OUTPUT_DIR / f"gif_{timestamp}.gif"
-        convert_mp4_to_gif(
+        await run_in_threadpool(
+            convert_mp4_to_gif,
             str(upload_path),
             str(output_path),
             fps_reduction=fps_reduction,
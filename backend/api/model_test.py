@@ -5,6 +5,7 @@
 
 from fastapi import APIRouter, UploadFile, File, Form, HTTPException
 from fastapi.responses import JSONResponse
+from fastapi.concurrency import run_in_threadpool
 from pathlib import Path
 import shutil
 import time
@@ -12,7 +13,8 @@ import base64
 import tempfile
 import traceback
 
-from kling_api_helper import KlingAPI
+from kling_api_helper import KlingAPI, extract_task_status, is_task_succeeded, is_task_failed
+from services.kling_concurrency import concurrency_governor
 from config import (
     KLING_ACCESS_KEY,
     KLING_SECRET_KEY,
@@ -228,8 +230,9 @@ async def test_video_model(
         # 构建请求payload - 使用幼年金毛的提示词
         prompt = "皮克斯风格3D卡通，可爱圆润的造型，大眼睛，一只幼年金毛犬，金色毛发，毛茸茸的质感，轻微呼吸动作，保持自然姿势，纯白色背景，柔和均匀的灯光"
         
-        # 调用API
-        result = kling.image_to_video(
+        # 调用API（可能需要排队等待并发槽位，放到线程池，避免阻塞事件循环）
+        result = await run_in_threadpool(
+            kling.image_to_video,
             image_path=str(first_frame_path),
             prompt=prompt,
             duration=5,
@@ -359,8 +362,9 @@ async def test_image_model(
         # 创建API实例
         kling = KlingAPI(ACCESS_KEY, SECRET_KEY)
         
-        # 调用图生图API
-        result = kling.image_to_image(
+        # 调用图生图API（同上，放到线程池）
+        result = await run_in_threadpool(
+            kling.image_to_image,
             image_path=str(upload_path),
             prompt=prompt,
             aspect_ratio="1:1",
@@ -423,6 +427,11 @@ async def get_task_status(task_id: str, task_type: str = "video"):
             task_data = kling.query_video_task(task_id)
         else:
             task_data = kling.query_task(task_id)
+
+        # 测试任务没有等待方，查询到结束状态时归还并发槽位
+        task_status = extract_task_status(task_data)
+        if is_task_succeeded(task_status) or is_task_failed(task_status):
+            concurrency_governor.release_task(task_id)
         
         # 提取状态
         status = "unknown"
@@ -3,19 +3,27 @@
 视频裁剪 API 端点
 """
 
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Query
+from fastapi.responses import FileResponse, Response
 from pathlib import Path
+from typing import Optional
 import uuid
 import shutil
 import sys
+import base64
+import hashlib
+import json
+import time
 from PIL import Image
 import io
 import tempfile
 
 # 添加项目根目录到路径
 sys.path.append(str(Path(__file__).parent.parent))
-from utils.video_utils import get_video_info
+import config
+from utils.video_utils import get_video_info, trim_video
+from utils.video_probe import video_probe
+from services.frame_cache import frame_cache
 
 # 导入你的视频裁剪函数
 import cv2
@@ -30,6 +38,18 @@ TEMP_DIR.mkdir(exist_ok=True, parents=True)
 OUTPUT_DIR = TEMP_DIR / "output"
 OUTPUT_DIR.mkdir(exist_ok=True, parents=True)
 
+# 批量取帧接口保留的上传视频（按内容哈希命名，后续请求用 video_id 引用，不必重新上传）
+FRAME_SOURCE_DIR = TEMP_DIR / "frame_sources"
+FRAME_SOURCE_DIR.mkdir(exist_ok=True, parents=True)
+
+# 生成流程的输出目录（按 pet_id 引用已生成的视频）
+PIPELINE_OUTPUT_DIR = Path("output/kling_pipeline")
+
+# 批量取帧：未指定帧时的默认帧数、单次请求的帧数上限、默认缩略图宽度
+DEFAULT_FRAME_COUNT = 16
+MAX_FRAMES_PER_REQUEST = 200
+DEFAULT_FRAME_WIDTH = 160
+
 
 @router.post("/info")
 async def get_video_information(
@@ -42,7 +62,7 @@ async def get_video_information(
         video: 上传的视频文件
     
     Returns:
-        视频信息（fps, 宽度, 高度, 总帧数, 时长）
+        视频信息（fps, 宽度, 高度, 总帧数, 时长）和首尾帧缩略图（data URL）
     """
     try:
         # 保存上传的视频
@@ -54,8 +74,9 @@ async def get_video_information(
         
         print(f"📤 收到视频: {video.filename}")
         
-        # 获取视频信息
+        # 获取视频信息（探测缓存同时生成首尾帧缩略图）
         info = get_video_info(str(temp_video_path))
+        first_thumbnail, last_thumbnail = video_probe.thumbnails(str(temp_video_path))
         
         print(f"✅ 视频信息: {info}")
         
@@ -65,7 +86,11 @@ async def get_video_information(
         return {
             "success": True,
             "filename": video.filename,
-            "info": info
+            "info": info,
+            "thumbnails": {
+                "first": "data:image/jpeg;base64," + base64.b64encode(first_thumbnail).decode("ascii"),
+                "last": "data:image/jpeg;base64," + base64.b64encode(last_thumbnail).decode("ascii"),
+            },
         }
         
     except Exception as e:
@@ -165,13 +190,13 @@ def cleanup_temp_files(input_path, output_path):
 
 def cut_video_by_frames(input_path, output_path, start_frame, end_frame):
     """
-    根据起始帧和终止帧剪切视频（从你的 cut_video_frames.py 复制）
+    根据起始帧和终止帧剪切视频（使用 utils.video_utils.trim_video：完整 GOP 直接复制，只重新编码首尾）
 
     Args:
         input_path (str): 输入视频文件路径
         output_path (str): 输出视频文件路径
         start_frame (int): 起始帧（从0开始计数）
-        end_frame (int): 终止帧（包含该帧）
+        end_frame (int): 终止帧（包含该帧，超出视频范围时调整为最后一帧）
     """
     # 检查输入视频文件是否存在
     if not os.path.exists(input_path):
@@ -187,88 +212,17 @@ def cut_video_by_frames(input_path, output_path, start_frame, end_frame):
         print(f"错误：终止帧({end_frame})必须大于起始帧({start_frame})")
         return False
 
-    # 打开输入视频
-    cap = cv2.VideoCapture(input_path)
-
-    if not cap.isOpened():
-        print(f"错误：无法打开视频文件 - {input_path}")
-        return False
-
-    # 获取视频属性
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-
-    print(f"原视频信息:")
-    print(f"  分辨率: {width}x{height}")
-    print(f"  帧率: {fps:.2f} FPS")
-    print(f"  总帧数: {total_frames}")
-    print(f"  原视频时长: {total_frames/fps:.2f}秒")
-
-    # 验证帧数范围
-    if start_frame >= total_frames:
-        print(f"错误：起始帧({start_frame})超出视频范围(0-{total_frames-1})")
-        cap.release()
-        return False
-
-    # 调整终止帧，不能超出视频范围
-    actual_end_frame = min(end_frame, total_frames - 1)
-    if actual_end_frame != end_frame:
-        print(f"警告：终止帧已调整为 {actual_end_frame}（原视频最大帧数为 {total_frames-1}）")
-
-    frames_to_extract = actual_end_frame - start_frame + 1
-
-    print(f"剪切设置:")
-    print(f"  起始帧: {start_frame}")
-    print(f"  终止帧: {actual_end_frame}")
-    print(f"  提取帧数: {frames_to_extract}")
-    print(f"  剪切片段时长: {frames_to_extract/fps:.2f}秒")
-
-    # 创建输出目录（如果不存在）
-    output_dir = os.path.dirname(output_path)
-    if output_dir and not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-
-    # 设置视频编码器
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-    out = cv2.VideoWriter(output_path, fourcc, fps, (width, height))
-
-    if not out.isOpened():
-        print(f"错误：无法创建输出视频文件 - {output_path}")
-        cap.release()
+    try:
+        total_frames = get_video_info(input_path)["total_frames"]
+        # 调整终止帧，不能超出视频范围
+        actual_end_frame = min(end_frame, total_frames - 1)
+        if actual_end_frame != end_frame:
+            print(f"警告：终止帧已调整为 {actual_end_frame}（原视频最大帧数为 {total_frames-1}）")
+        trim_video(input_path, output_path, start_frame, actual_end_frame)
+    except Exception as e:
+        print(f"错误：{e}")
         return False
 
-    # 跳转到起始帧
-    cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
-
-    # 读取并写入指定范围的帧
-    frame_count = 0
-    current_frame = start_frame
-
-    while current_frame <= actual_end_frame:
-        ret, frame = cap.read()
-
-        if not ret:
-            print(f"警告：在第 {current_frame} 帧处读取失败")
-            break
-
-        out.write(frame)
-        frame_count += 1
-        current_frame += 1
-
-        # 显示进度
-        if frame_count % 10 == 0 or current_frame > actual_end_frame:
-            progress = (frame_count / frames_to_extract) * 100
-            print(f"处理进度: {frame_count}/{frames_to_extract} 帧 ({progress:.1f}%)")
-
-    # 释放资源
-    cap.release()
-    out.release()
-
-    print(f"成功！剪切后的视频已保存到: {output_path}")
-    print(f"新视频包含 {frame_count} 帧")
-
     return True
 
 
@@ -284,15 +238,13 @@ def extract_frame(video_path: str, frame_index: int, output_path: str) -> bool:
     Returns:
         bool: 是否成功
     """
-    cap = cv2.VideoCapture(video_path)
-
-    if not cap.isOpened():
-        print(f"错误：无法打开视频文件 - {video_path}")
+    # 获取视频信息（实际帧数）
+    try:
+        total_frames = get_video_info(video_path)["total_frames"]
+    except Exception as e:
+        print(f"错误：无法打开视频文件 - {video_path}: {e}")
         return False
 
-    # 获取视频信息
-    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-
     # 处理负索引（-1表示最后一帧）
     if frame_index < 0:
         frame_index = total_frames + frame_index
@@ -300,7 +252,12 @@ def extract_frame(video_path: str, frame_index: int, output_path: str) -> bool:
     # 验证帧索引
     if frame_index < 0 or frame_index >= total_frames:
         print(f"错误：帧索引 {frame_index} 超出范围 (0-{total_frames-1})")
-        cap.release()
+        return False
+
+    cap = cv2.VideoCapture(video_path)
+
+    if not cap.isOpened():
+        print(f"错误：无法打开视频文件 - {video_path}")
         return False
 
     # 跳转到指定帧
@@ -388,6 +345,199 @@ async def extract_frame_endpoint(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# ============================================
+# 批量取帧（拖动条缩略图 / 联系表）
+# ============================================
+
+def _touch_frame_source(path: Path):
+    """
+    记录上传视频的最近使用时间（写入访问时间，修改时间保持不变：帧缓存和探测缓存以修改时间为键）
+    显式设置，不依赖文件系统的 atime 挂载选项
+    """
+    try:
+        os.utime(path, ns=(time.time_ns(), path.stat().st_mtime_ns))
+    except OSError:
+        pass
+
+
+def _save_frame_source(video: UploadFile) -> str:
+    """保存上传视频（按内容哈希去重），返回 video_id；顺便清理过期（超过 TTL 未使用）的上传视频"""
+    now = time.time()
+    for old_path in list(FRAME_SOURCE_DIR.glob("*.mp4")) + list(FRAME_SOURCE_DIR.glob("*.part")):
+        try:
+            stat = old_path.stat()
+            if now - max(stat.st_atime, stat.st_mtime) > config.FRAME_UPLOAD_TTL_SECONDS:
+                old_path.unlink()
+        except OSError:
+            pass
+
+    digest = hashlib.sha256()
+    temp_path = FRAME_SOURCE_DIR / f"{uuid.uuid4()}.part"
+    with open(temp_path, "wb") as f:
+        while True:
+            chunk = video.file.read(1024 * 1024)
+            if not chunk:
+                break
+            digest.update(chunk)
+            f.write(chunk)
+
+    video_id = digest.hexdigest()[:32]
+    source_path = FRAME_SOURCE_DIR / f"{video_id}.mp4"
+    if source_path.exists():
+        # 同一视频重复上传：保留原文件（修改时间不变，已缓存的帧继续有效），只刷新使用时间
+        temp_path.unlink()
+        _touch_frame_source(source_path)
+    else:
+        os.replace(temp_path, source_path)
+    return video_id
+
+
+def _resolve_frame_source(video_id: Optional[str], pet_id: Optional[str], video_path: Optional[str]) -> Path:
+    """video_id（之前上传的视频）或 pet_id + video_path（生成流程输出目录中的视频）对应的文件"""
+    if video_id:
+        if not all(c in "0123456789abcdef" for c in video_id):
+            raise HTTPException(status_code=400, detail=f"无效的 video_id: {video_id}")
+        path = FRAME_SOURCE_DIR / f"{video_id}.mp4"
+        if not path.exists():
+            raise HTTPException(status_code=404, detail=f"视频已过期或不存在，请重新上传: {video_id}")
+        _touch_frame_source(path)
+        return path
+
+    if pet_id and video_path:
+        root = PIPELINE_OUTPUT_DIR.resolve()
+        path = (PIPELINE_OUTPUT_DIR / pet_id / video_path).resolve()
+        if root not in path.parents:
+            raise HTTPException(status_code=400, detail=f"无效的视频路径: {pet_id}/{video_path}")
+        if not path.is_file():
+            raise HTTPException(status_code=404, detail=f"文件不存在: {pet_id}/{video_path}")
+        return path
+
+    raise HTTPException(status_code=400, detail="需要上传 video，或提供 video_id，或提供 pet_id 和 video_path")
+
+
+def _select_frame_indices(total_frames: int, count: int, indices: str) -> list:
+    """indices（逗号分隔，负数从末尾算）优先，否则取 count 个均匀间隔的帧（含首尾）"""
+    if indices:
+        try:
+            selected = [int(value) for value in indices.split(",") if value.strip()]
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"无效的帧索引: {indices}")
+        selected = [index + total_frames if index < 0 else index for index in selected]
+        invalid = [index for index in selected if index < 0 or index >= total_frames]
+        if invalid:
+            raise HTTPException(status_code=400, detail=f"帧索引超出范围: {invalid}（0-{total_frames-1}）")
+    else:
+        count = min(count or DEFAULT_FRAME_COUNT, total_frames)
+        if count == 1:
+            selected = [0]
+        else:
+            selected = [round(i * (total_frames - 1) / (count - 1)) for i in range(count)]
+
+    selected = sorted(set(selected))
+    if len(selected) > MAX_FRAMES_PER_REQUEST:
+        raise HTTPException(status_code=400, detail=f"单次最多 {MAX_FRAMES_PER_REQUEST} 帧（请求了 {len(selected)} 帧）")
+    return selected
+
+
+def _frames_response(source_path: Path, video_id: Optional[str], count: int, indices: str,
+                     width: int, sheet: bool, columns: int):
+    """按关键帧索引一次解码取出所有帧（已缓存的帧不再解码），返回 JSON 或联系表图片"""
+    probe = video_probe.probe(str(source_path))
+    if probe["total_frames"] <= 0:
+        raise HTTPException(status_code=400, detail="视频没有可读取的帧")
+    selected = _select_frame_indices(probe["total_frames"], count, indices)
+    fps = probe["fps"]
+
+    if sheet:
+        image, layout = frame_cache.contact_sheet(str(source_path), selected, width, columns)
+        layout["times"] = [round(index / fps, 3) if fps > 0 else 0 for index in selected]
+        headers = {"X-Frame-Layout": json.dumps(layout)}
+        if video_id:
+            headers["X-Video-Id"] = video_id
+        return Response(content=image, media_type="image/jpeg", headers=headers)
+
+    frames = frame_cache.get_frames(str(source_path), selected, width)
+    return {
+        "success": True,
+        "video_id": video_id,
+        "info": {key: probe[key] for key in ("fps", "width", "height", "total_frames", "duration", "codec")},
+        "keyframes": probe["keyframes"],
+        "frames": [
+            {
+                "index": index,
+                "time": round(index / fps, 3) if fps > 0 else 0,
+                "image": "data:image/jpeg;base64," + base64.b64encode(frames[index]).decode("ascii"),
+            }
+            for index in selected
+        ],
+    }
+
+
+@router.post("/frames")
+async def extract_frames_batch(
+    video: UploadFile = File(None),
+    video_id: str = Form(None),
+    pet_id: str = Form(None),
+    video_path: str = Form(None),
+    count: int = Form(0),
+    indices: str = Form(""),
+    width: int = Form(DEFAULT_FRAME_WIDTH),
+    sheet: bool = Form(False),
+    columns: int = Form(0),
+):
+    """
+    批量取帧：一次请求返回多帧缩略图或一张联系表
+
+    视频来源三选一：上传 video（返回 video_id，后续请求用 GET /frames?video_id=... 不必重新上传）、
+    之前上传返回的 video_id、或生成结果 pet_id + video_path（如 videos/transitions/sit2walk.mp4）。
+
+    Args:
+        count: 均匀间隔取帧的数量（含首尾，默认 16）
+        indices: 逗号分隔的帧索引（优先于 count，负数从末尾算）
+        width: 缩略图宽度（0 表示原尺寸）
+        sheet: true 时返回联系表 JPEG，布局在响应头 X-Frame-Layout 中
+        columns: 联系表列数（0 表示接近正方形）
+
+    Returns:
+        JSON {video_id, info, keyframes, frames: [{index, time, image(data URL)}]} 或联系表图片
+    """
+    try:
+        if video is not None:
+            video_id = _save_frame_source(video)
+            print(f"📤 收到视频: {video.filename} → video_id={video_id}")
+        source_path = _resolve_frame_source(video_id, pet_id, video_path)
+        return _frames_response(source_path, video_id, count, indices, width, sheet, columns)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"❌ 批量取帧失败: {e}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"批量取帧失败: {str(e)}")
+
+
+@router.get("/frames")
+async def get_frames_batch(
+    video_id: str = Query(None),
+    pet_id: str = Query(None),
+    video_path: str = Query(None),
+    count: int = Query(0),
+    indices: str = Query(""),
+    width: int = Query(DEFAULT_FRAME_WIDTH),
+    sheet: bool = Query(False),
+    columns: int = Query(0),
+):
+    """批量取帧（引用已上传的 video_id 或 pet_id + video_path，参数同 POST /frames）"""
+    try:
+        source_path = _resolve_frame_source(video_id, pet_id, video_path)
+        return _frames_response(source_path, video_id, count, indices, width, sheet, columns)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"❌ 批量取帧失败: {e}")
+        raise HTTPException(status_code=500, detail=f"批量取帧失败: {str(e)}")
+
+
 @router.get("/health")
 async def health_check():
     """健康检查"""
@@ -32,6 +32,61 @@ KLING_BASE_URL = os.getenv("KLING_BASE_URL", "https://api.klingai.com")
 # 向后兼容旧的环境变量名
 KLING_OVERSEAS_BASE_URL = os.getenv("KLING_OVERSEAS_BASE_URL", KLING_BASE_URL)
 
+# HTTP 连接池配置（所有 KlingAPI 实例按 base_url 共享连接池）
+KLING_HTTP_POOL_SIZE = int(os.getenv("KLING_HTTP_POOL_SIZE", "10"))         # 每个主机的最大保活连接数
+KLING_HTTP_MAX_RETRIES = int(os.getenv("KLING_HTTP_MAX_RETRIES", "3"))      # 传输层重试次数（连接失败/5xx）
+KLING_HTTP_KEEP_ALIVE = os.getenv("KLING_HTTP_KEEP_ALIVE", "true").lower() in ("true", "1", "yes")
+
+# 任务轮询配置（进程内共享一个批量轮询线程）
+KLING_BATCH_POLLING = os.getenv("KLING_BATCH_POLLING", "true").lower() in ("true", "1", "yes")
+KLING_POLL_INTERVAL = int(os.getenv("KLING_POLL_INTERVAL", "10"))           # 批量轮询基础间隔（秒）
+# 任务耗时分布（自适应轮询用），按 模型/模式 统计
+KLING_LATENCY_STATS_PATH = os.getenv("KLING_LATENCY_STATS_PATH", "output/kling_latency_stats.json")
+
+# 并发准入控制（每个密钥同时运行的任务数，进程内所有提交路径共享）
+KLING_IMAGE_CONCURRENCY = int(os.getenv("KLING_IMAGE_CONCURRENCY", "3"))
+KLING_VIDEO_CONCURRENCY = int(os.getenv("KLING_VIDEO_CONCURRENCY", "3"))
+KLING_SLOT_LEASE_SECONDS = int(os.getenv("KLING_SLOT_LEASE_SECONDS", "900"))   # 槽位租期，到期自动回收
+# 自适应并发（AIMD）：上面两个值是初始上限，运行中按限流情况自动调整，学到的上限持久化
+KLING_CONCURRENCY_MAX = int(os.getenv("KLING_CONCURRENCY_MAX", "10"))          # 自动提升的上限
+KLING_CONCURRENCY_STATS_PATH = os.getenv("KLING_CONCURRENCY_STATS_PATH", "output/kling_concurrency_limits.json")
+# 流程间隔节奏控制："bucket" 令牌桶（请求预算充足时不等待）/ "fixed" 每步固定等待
+KLING_PACING_MODE = os.getenv("KLING_PACING_MODE", "bucket").lower()
+KLING_PACER_BURST = int(os.getenv("KLING_PACER_BURST", "4"))                # 令牌桶容量（允许连续不等待的次数）
+# 同时运行的生成流程数（真正的可灵并发由准入控制保证，这里只限制后台流程数）
+KLING_MAX_CONCURRENT_PIPELINES = int(os.getenv("KLING_MAX_CONCURRENT_PIPELINES", "3"))
+# 16个视频按依赖图调度（关闭则回退到 步骤4 → 步骤5 → 步骤6 的分阶段执行）
+KLING_DAG_SCHEDULING = os.getenv("KLING_DAG_SCHEDULING", "true").lower() in ("true", "1", "yes")
+# 服务启动时按断点日志恢复中断的后台流程（输出目录需在持久化磁盘上）
+KLING_RESUME_ON_STARTUP = os.getenv("KLING_RESUME_ON_STARTUP", "true").lower() in ("true", "1", "yes")
+# 生成结果缓存（相同图片+提示词+模型+模式+时长直接复用已下载的结果，不再付费生成；可按请求关闭）
+KLING_RESULT_CACHE_ENABLED = os.getenv("KLING_RESULT_CACHE_ENABLED", "true").lower() in ("true", "1", "yes")
+KLING_RESULT_CACHE_DIR = os.getenv("KLING_RESULT_CACHE_DIR", "output/cache")
+KLING_RESULT_CACHE_MAX_MB = int(os.getenv("KLING_RESULT_CACHE_MAX_MB", "2048"))   # 超出后按 LRU 淘汰
+# 本地倒放模式：每对姿势只远程生成一个方向，反方向由本地倒放得到（质量检查不通过的仍远程生成）
+KLING_LOCAL_REVERSE = os.getenv("KLING_LOCAL_REVERSE", "false").lower() in ("true", "1", "yes")
+KLING_REVERSE_MAX_DIFF = float(os.getenv("KLING_REVERSE_MAX_DIFF", "0.08"))  # 倒放视频首尾帧与姿势图允许的最大差异
+# GIF 转换进程池大小（0 表示按可用 CPU 核数），所有流程共享
+GIF_CONVERT_WORKERS = int(os.getenv("GIF_CONVERT_WORKERS", "0"))
+# GIF 调色板："global" 抽样帧生成一个全局调色板（快、文件小、循环不闪烁）/ "per_frame" 每帧独立调色板
+GIF_PALETTE = os.getenv("GIF_PALETTE", "global").lower()
+GIF_DITHER = os.getenv("GIF_DITHER", "false").lower() in ("true", "1", "yes")   # 全局调色板时使用有序抖动
+# 与 GIF 并列生成的动图格式（逗号分隔：webp,apng,mp4；留空则只生成 GIF）
+RENDITION_FORMATS = [fmt.strip().lower() for fmt in os.getenv("RENDITION_FORMATS", "webp").split(",") if fmt.strip()]
+RENDITION_MAX_WIDTH = int(os.getenv("RENDITION_MAX_WIDTH", "480"))   # 输出宽度上限（像素）
+RENDITION_QUALITY = int(os.getenv("RENDITION_QUALITY", "75"))        # 0~100，WebP 质量 / MP4 映射为 crf
+# 精灵图集（步骤7后把所有动画的抽样帧打包成 sprites/atlas_N + manifest.json，供客户端一次下载播放）
+SPRITE_ATLAS_ENABLED = os.getenv("SPRITE_ATLAS_ENABLED", "true").lower() in ("true", "1", "yes")
+SPRITE_ATLAS_FORMAT = os.getenv("SPRITE_ATLAS_FORMAT", "webp").lower()        # webp（有损，使用 RENDITION_QUALITY）/ png
+SPRITE_FRAME_STEP = int(os.getenv("SPRITE_FRAME_STEP", "3"))                 # 每隔几帧取一帧（24fps → 8fps）
+SPRITE_FRAME_WIDTH = int(os.getenv("SPRITE_FRAME_WIDTH", "192"))             # 单帧宽度上限（像素）
+SPRITE_ATLAS_MAX_SIZE = int(os.getenv("SPRITE_ATLAS_MAX_SIZE", "4096"))      # 图集宽高上限（像素）
+# 视频元数据探测缓存（SQLite，与 pet_motion_lab.db 同目录；按 路径+大小+修改时间 失效）
+VIDEO_PROBE_DB = os.getenv("VIDEO_PROBE_DB", "output/video_probe.db")
+# 批量取帧接口的缩略图缓存（内存，按总大小 LRU 淘汰）与上传视频的保留时间（秒，从最近一次上传或使用算起）
+FRAME_CACHE_MAX_MB = int(os.getenv("FRAME_CACHE_MAX_MB", "64"))
+FRAME_UPLOAD_TTL_SECONDS = int(os.getenv("FRAME_UPLOAD_TTL_SECONDS", "3600"))
+
 if not KLING_ACCESS_KEY or not KLING_SECRET_KEY:
     print("⚠️ 警告: 未设置可灵AI密钥环境变量 (KLING_ACCESS_KEY, KLING_SECRET_KEY)")
     print("   请在环境变量中设置，或在本地开发时使用 .env 文件")
@@ -0,0 +1,419 @@
+#!/usr/bin/env python3
+"""
+可灵AI API 异步封装（asyncio）
+与 KlingAPI 接口一致（提交 / 查询 / 等待 / 流式下载），共用 JWT 缓存、响应解析和耗时模型；
+在 FastAPI 等事件循环中使用，等待任务时不占用工作线程。
+"""
+
+import asyncio
+import json
+import time
+from pathlib import Path
+
+import httpx
+
+import config
+from kling_api_helper import (
+    KlingAuthMixin,
+    DOWNLOAD_CHUNK_SIZE,
+    DOWNLOAD_MAX_ATTEMPTS,
+    RATE_LIMIT_MAX_ATTEMPTS,
+    RATE_LIMIT_BACKOFF_SECONDS,
+    KlingRateLimitError,
+    KlingTaskFailedError,
+    KlingTaskNotFoundError,
+    is_rate_limited_response,
+    extract_task_status,
+    extract_task_error,
+    is_task_succeeded,
+    is_task_failed,
+    get_task_meta,
+    record_task_completion,
+    parse_download_size,
+    finish_download,
+)
+from services.kling_latency_model import latency_model, latency_key
+from services.kling_concurrency import concurrency_governor
+
+
+RETRY_STATUS_CODES = (502, 503, 504)   # 查询类请求遇到这些状态码时重试
+
+
+# ============================================
+# 共享异步连接池（按 事件循环 + base_url 区分）
+# httpx.AsyncClient 绑定创建它的事件循环，不能跨循环复用
+# ============================================
+_async_clients = {}  # {(id(loop), base_url): httpx.AsyncClient}
+
+
+def get_async_client(base_url: str, pool_size: int = None, max_retries: int = None) -> httpx.AsyncClient:
+    """
+    获取当前事件循环中 base_url 对应的共享 AsyncClient（首次调用时创建）
+
+    Args:
+        base_url: API 根地址
+        pool_size: 最大保活连接数（仅首次创建时生效，默认 KLING_HTTP_POOL_SIZE）
+        max_retries: 建连失败重试次数（仅首次创建时生效，默认 KLING_HTTP_MAX_RETRIES）
+
+    Returns:
+        当前事件循环内共享的 httpx.AsyncClient
+    """
+    loop = asyncio.get_running_loop()
+    key = (id(loop), base_url)
+    client = _async_clients.get(key)
+    if client is None or client.is_closed:
+        pool_size = pool_size or config.KLING_HTTP_POOL_SIZE
+        limits = httpx.Limits(
+            max_connections=pool_size,
+            max_keepalive_connections=pool_size if config.KLING_HTTP_KEEP_ALIVE else 0,
+        )
+        # httpx 的传输层重试只覆盖建连失败（请求未发出），POST 提交不会重复创建计费任务
+        transport = httpx.AsyncHTTPTransport(
+            limits=limits,
+            retries=config.KLING_HTTP_MAX_RETRIES if max_retries is None else max_retries,
+        )
+        client = httpx.AsyncClient(transport=transport)
+        _async_clients[key] = client
+    return client
+
+
+async def aclose_async_clients():
+    """关闭当前事件循环创建的所有共享 AsyncClient（应用关闭时调用）"""
+    loop_id = id(asyncio.get_running_loop())
+    for key in [k for k in _async_clients if k[0] == loop_id]:
+        client = _async_clients.pop(key)
+        await client.aclose()
+
+
+class AsyncKlingAPI(KlingAuthMixin):
+    """可灵AI API异步封装类"""
+
+    def __init__(
+        self,
+        access_key: str,
+        secret_key: str,
+        base_url: str = None,
+        pool_size: int = None,
+        max_retries: int = None,
+    ):
+        self.access_key = access_key
+        self.secret_key = secret_key
+        # 默认使用海外版 API
+        self.base_url = base_url or "https://api.klingai.com"
+        self.pool_size = pool_size
+        self.max_retries = config.KLING_HTTP_MAX_RETRIES if max_retries is None else max_retries
+
+        if not self.access_key:
+            print("❌ 错误: access_key 为空！")
+        if not self.secret_key:
+            print("❌ 错误: secret_key 为空！")
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        return get_async_client(self.base_url, pool_size=self.pool_size, max_retries=self.max_retries)
+
+    async def _get(self, url: str, params: dict = None, timeout: int = 30) -> httpx.Response:
+        """幂等 GET：读超时 / 5xx 时指数退避重试（与同步版 Session 的重试策略一致）"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = await self.client.get(url, headers=self._get_auth_headers(), params=params, timeout=timeout)
+                if response.status_code not in RETRY_STATUS_CODES or attempt >= self.max_retries:
+                    return response
+            except (httpx.ReadTimeout, httpx.RemoteProtocolError):
+                if attempt >= self.max_retries:
+                    raise
+            await asyncio.sleep(2 ** attempt)
+
+    async def _submit(self, url: str, payload: dict, timeout: int, error_label: str) -> dict:
+        """提交任务（POST），仅在连接失败时重试，返回响应JSON"""
+        max_retries = 3
+        for attempt in range(max_retries):
+            try:
+                response = await self.client.post(url, headers=self._get_auth_headers(), json=payload, timeout=timeout)
+                if response.status_code == 200:
+                    return response.json()
+                if is_rate_limited_response(response.status_code, response.text):
+                    raise KlingRateLimitError(f"{error_label}: {response.status_code} - {response.text}")
+                raise Exception(f"{error_label}: {response.status_code} - {response.text}")
+            except httpx.ConnectError as e:
+                if attempt < max_retries - 1:
+                    wait_time = (attempt + 1) * 2  # 2秒, 4秒
+                    print(f"  ⚠️ 连接失败，{wait_time}秒后重试 (尝试 {attempt + 1}/{max_retries})...")
+                    await asyncio.sleep(wait_time)
+                else:
+                    raise Exception(f"连接失败，已重试{max_retries}次: {e}")
+
+    async def _submit_task(
+        self,
+        url: str,
+        payload: dict,
+        kind: str,
+        label: str,
+        timeout: int,
+        error_label: str,
+        model_name: str = None,
+        mode: str = None,
+    ) -> dict:
+        """占用并发槽位后提交任务，被限流时降级并重新排队（同 KlingAPI._submit_task）"""
+        for attempt in range(1, RATE_LIMIT_MAX_ATTEMPTS + 1):
+            async with concurrency_governor.slot_async(self.access_key, kind, label) as lease:
+                try:
+                    data = await self._submit(url, payload, timeout, error_label)
+                    return self._submitted(lease, data, kind, model_name, mode)
+                except KlingRateLimitError:
+                    concurrency_governor.report_rate_limited(lease, model_name)
+                    if attempt >= RATE_LIMIT_MAX_ATTEMPTS:
+                        raise
+            wait_time = RATE_LIMIT_BACKOFF_SECONDS * attempt
+            print(f"  ⚠️ {label} 被限流，{wait_time}秒后重新排队提交 (尝试 {attempt}/{RATE_LIMIT_MAX_ATTEMPTS})...")
+            await asyncio.sleep(wait_time)
+
+    # ==================== 提交任务 ====================
+
+    async def text_to_image(
+        self,
+        prompt: str,
+        negative_prompt: str = "",
+        aspect_ratio: str = "1:1",
+        image_count: int = 1,
+    ) -> dict:
+        """文生图API（参数同 KlingAPI.text_to_image），返回包含task_id的字典"""
+        payload = {
+            "prompt": prompt,
+            "negative_prompt": negative_prompt,
+            "aspect_ratio": aspect_ratio,
+            "image_count": image_count,
+        }
+        return await self._submit_task(f"{self.base_url}/v1/images/generations", payload, "image", "文生图", 30, "API请求失败")
+
+    async def image_to_image(
+        self,
+        image_path: str,
+        prompt: str,
+        negative_prompt: str = "",
+        aspect_ratio: str = "1:1",
+        image_count: int = 1,
+    ) -> dict:
+        """图生图API（参数同 KlingAPI.image_to_image），返回包含task_id的字典"""
+        # 读文件+base64编码放到线程里，避免阻塞事件循环
+        payload = await asyncio.to_thread(
+            self._build_image_to_image_payload, image_path, prompt, negative_prompt, aspect_ratio, image_count,
+        )
+        return await self._submit_task(
+            f"{self.base_url}/v1/images/generations", payload, "image", "图生图 kling-v2", 60, "API请求失败",
+            model_name="kling-v2",
+        )
+
+    async def image_to_video(
+        self,
+        image_path: str,
+        prompt: str,
+        negative_prompt: str = "",
+        duration: int = 5,
+        aspect_ratio: str = "16:9",
+        model_name: str = "kling-v2-1-master",
+        mode: str = "pro",
+        tail_image_path: str = None,
+    ) -> dict:
+        """图生视频API（参数同 KlingAPI.image_to_video），返回包含task_id的字典"""
+        payload = await asyncio.to_thread(
+            self._build_image_to_video_payload,
+            image_path, prompt, negative_prompt, duration, aspect_ratio, model_name, mode, tail_image_path,
+        )
+        return await self._submit_task(
+            f"{self.base_url}/v1/videos/image2video", payload, "video", f"图生视频 {model_name}", 120, "创建视频任务失败",
+            model_name=model_name, mode=mode,
+        )
+
+    # ==================== 查询任务 ====================
+
+    async def query_task(self, task_id: str) -> dict:
+        """查询图片任务状态"""
+        response = await self._get(f"{self.base_url}/v1/images/generations/{task_id}")
+        if response.status_code == 200:
+            return response.json()
+        if response.status_code == 404:
+            raise KlingTaskNotFoundError(f"任务不存在: {task_id}")
+        raise Exception(f"查询任务失败: {response.status_code} - {response.text}")
+
+    async def query_video_task(self, task_id: str) -> dict:
+        """查询视频任务状态"""
+        response = await self._get(f"{self.base_url}/v1/videos/image2video/{task_id}")
+        if response.status_code == 200:
+            return response.json()
+        if response.status_code == 404:
+            raise KlingTaskNotFoundError(f"视频任务不存在: {task_id}")
+        raise Exception(f"查询视频任务失败: {response.status_code} - {response.text}")
+
+    async def list_video_tasks(self, page_num: int = 1, page_size: int = 100) -> list:
+        """批量查询视频任务列表（参数同 KlingAPI.list_video_tasks）"""
+        return await self._list_tasks(f"{self.base_url}/v1/videos/image2video", page_num, page_size)
+
+    async def list_image_tasks(self, page_num: int = 1, page_size: int = 100) -> list:
+        """批量查询图片任务列表（参数同 KlingAPI.list_image_tasks）"""
+        return await self._list_tasks(f"{self.base_url}/v1/images/generations", page_num, page_size)
+
+    async def _list_tasks(self, url: str, page_num: int, page_size: int) -> list:
+        response = await self._get(url, params={"pageNum": page_num, "pageSize": page_size})
+        if response.status_code == 200:
+            data = response.json().get('data')
+            if not isinstance(data, list):
+                raise Exception(f"任务列表响应格式异常: {response.text[:200]}")
+            return data
+        raise Exception(f"查询任务列表失败: {response.status_code} - {response.text}")
+
+    # ==================== 等待任务 ====================
+
+    async def wait_for_task(self, task_id: str, max_wait_seconds: int = 300, poll_interval: int = None) -> dict:
+        """等待图片任务完成（参数同 KlingAPI.wait_for_task）"""
+        return await self._wait_until_done(
+            self.query_task, task_id, max_wait_seconds, poll_interval, "任务",
+            kind="image", base_interval=5,
+        )
+
+    async def wait_for_video_task(self, task_id: str, max_wait_seconds: int = 600, poll_interval: int = None) -> dict:
+        """等待视频任务完成（参数同 KlingAPI.wait_for_video_task）"""
+        return await self._wait_until_done(
+            self.query_video_task, task_id, max_wait_seconds, poll_interval, "视频任务",
+            kind="video", base_interval=10,
+        )
+
+    async def _wait_until_done(
+        self,
+        query_func,
+        task_id: str,
+        max_wait_seconds: int,
+        poll_interval: int,
+        label: str,
+        kind: str,
+        base_interval: int,
+    ) -> dict:
+        """轮询 query_func 直到任务成功/失败/超时（等待期间让出事件循环）"""
+        start_time = time.time()
+        retry_count = 0
+
+        meta = get_task_meta(task_id)
+        key = meta["key"] if meta else latency_key(kind)
+        submitted_at = meta["submitted_at"] if meta else start_time
+
+        def next_delay():
+            if poll_interval:
+                return poll_interval
+            return latency_model.next_poll_delay(key, time.time() - submitted_at, base_interval)
+
+        delay = 0 if poll_interval else next_delay()
+        while True:
+            remaining = max_wait_seconds - (time.time() - start_time)
+            if remaining <= 0:
+                break
+            if delay > 0:
+                await asyncio.sleep(min(delay, remaining))
+
+            retry_count += 1
+
+            task_data = await query_func(task_id)
+            status = extract_task_status(task_data)
+
+            print(f"  查询 #{retry_count}: 状态={status} (原始值)")
+
+            if is_task_succeeded(status):
+                print(f"  ✅ 任务成功完成: {status}")
+                # 写耗时统计文件，放到线程里执行
+                await asyncio.to_thread(
+                    record_task_completion, task_id, retry_count, fallback_key=key, fallback_start=submitted_at,
+                )
+                concurrency_governor.release_task(task_id)
+                return task_data
+            elif is_task_failed(status):
+                print(f"  📋 {label}失败，完整响应: {json.dumps(task_data, ensure_ascii=False, indent=2)}")
+                error_msg = extract_task_error(task_data)
+                print(f"  ❌ {label}失败: status={status}, 错误原因={error_msg}")
+                concurrency_governor.release_task(task_id)
+                raise KlingTaskFailedError(f"任务失败: {error_msg}")
+
+            delay = next_delay()
+
+        # 超时只归还槽位：远程任务可能仍在运行，调用方保留任务ID，之后查询状态后继续接管（不重新提交）
+        concurrency_governor.release_task(task_id)
+        raise Exception(f"任务超时（{max_wait_seconds}秒）")
+
+    # ==================== 下载 ====================
+
+    async def download_image(self, image_url: str, output_path: str, expected_sha256: str = None) -> str:
+        """下载图片（流式写入，断点续传，参数同 KlingAPI.download_image）"""
+        return await self._stream_download(image_url, output_path, "图片", read_timeout=60, expected_sha256=expected_sha256)
+
+    async def download_video(self, video_url: str, output_path: str, expected_sha256: str = None) -> str:
+        """下载视频（流式写入，断点续传，参数同 KlingAPI.download_video）"""
+        return await self._stream_download(video_url, output_path, "视频", read_timeout=120, expected_sha256=expected_sha256)
+
+    async def _stream_download(
+        self,
+        url: str,
+        output_path: str,
+        label: str,
+        read_timeout: int,
+        expected_sha256: str = None,
+        max_attempts: int = DOWNLOAD_MAX_ATTEMPTS,
+    ) -> str:
+        """分块下载到临时文件并支持 Range 续传（逻辑同 KlingAPI._stream_download），磁盘写入在线程中执行"""
+        output = Path(output_path)
+        output.parent.mkdir(parents=True, exist_ok=True)
+        part_path = output.with_name(output.name + ".part")
+        # 不同调用之间不续传（同一路径可能对应重新生成的另一个文件）
+        part_path.unlink(missing_ok=True)
+
+        timeout = httpx.Timeout(read_timeout, connect=10)
+        total_size = None
+        try:
+            for attempt in range(1, max_attempts + 1):
+                offset = part_path.stat().st_size if part_path.exists() else 0
+                headers = {"Range": f"bytes={offset}-"} if offset else {}
+
+                try:
+                    async with self.client.stream("GET", url, headers=headers, timeout=timeout,
+                                                  follow_redirects=True) as response:
+                        if response.status_code == 416 and total_size is not None and offset >= total_size:
+                            # 临时文件已完整
+                            break
+                        if response.status_code == 206:
+                            mode = 'ab'
+                        elif response.status_code == 200:
+                            # 服务器不支持 Range，从头开始
+                            mode = 'wb'
+                            offset = 0
+                        else:
+                            raise Exception(f"下载{label}失败: {response.status_code}")
+                        total_size = parse_download_size(response.status_code, response.headers, total_size)
+
+                        if offset:
+                            print(f"  ⏩ 从断点续传{label}: {offset} 字节")
+
+                        f = await asyncio.to_thread(open, part_path, mode)
+                        try:
+                            async for chunk in response.aiter_bytes(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                                await asyncio.to_thread(f.write, chunk)
+                        finally:
+                            await asyncio.to_thread(f.close)
+
+                    downloaded = part_path.stat().st_size
+                    if total_size is None or downloaded >= total_size:
+                        break
+                    raise httpx.RemoteProtocolError(f"连接提前结束 ({downloaded}/{total_size} 字节)")
+
+                except httpx.TransportError as e:
+                    if attempt >= max_attempts:
+                        raise Exception(f"下载{label}失败，已重试{max_attempts}次: {e}")
+                    if total_size is None:
+                        # 总大小未知（或响应经过压缩，已写入的是解压后的字节），无法按偏移续传，从头下载
+                        part_path.unlink(missing_ok=True)
+                    wait_time = attempt * 2
+                    print(f"  ⚠️ 下载{label}中断，{wait_time}秒后续传 (尝试 {attempt}/{max_attempts}): {str(e)[:100]}")
+                    await asyncio.sleep(wait_time)
+        except Exception:
+            # 不可恢复的错误（HTTP 错误、磁盘写满、重试耗尽等）：删除临时文件，不留下残缺的 .part
+            part_path.unlink(missing_ok=True)
+            raise
+
+        await asyncio.to_thread(finish_download, part_path, output, total_size, label, expected_sha256)
+        return output_path
@@ -5,50 +5,469 @@
 使用JWT认证方式
 """
 
+import os
+import base64
+import hashlib
 import requests
 import json
 import time
+import threading
 import jwt
 from pathlib import Path
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import config
+from services.kling_latency_model import latency_model, latency_key
+from services.kling_concurrency import concurrency_governor
+
+
+# ============================================
+# 共享 HTTP 连接池（按 base_url 区分，线程安全）
+# 所有 KlingAPI 实例复用同一批保活连接，避免每次轮询都重新 TCP+TLS 握手
+# ============================================
+_sessions = {}  # {base_url: requests.Session}
+_sessions_lock = threading.Lock()
+
+
+class _PooledAdapter(HTTPAdapter):
+    """带请求计数的连接池适配器，用于统计连接复用率"""
+
+    def __init__(self, *args, **kwargs):
+        self._count_lock = threading.Lock()
+        self.requests_sent = 0
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        with self._count_lock:
+            self.requests_sent += 1
+        return super().send(request, **kwargs)
+
+    def connection_stats(self) -> dict:
+        """汇总当前所有主机连接池的建连数/请求数（含传输层重试）"""
+        pools = self.poolmanager.pools
+        hosts = {}
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            hosts[f"{pool.scheme}://{pool.host}"] = {
+                "connections_opened": pool.num_connections,
+                "requests": pool.num_requests,
+            }
+        return hosts
+
+
+def _create_session(pool_size: int, max_retries: int, keep_alive: bool) -> requests.Session:
+    """创建带连接池和传输层重试的 Session"""
+    # 只对幂等请求（GET/HEAD）做读超时/5xx 重试；
+    # POST 提交任务仅在连接建立失败时重试（请求未发出），避免重复创建计费任务
+    retry = Retry(
+        total=max_retries,
+        connect=max_retries,
+        read=max_retries,
+        status=max_retries,
+        backoff_factor=1,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset(["GET", "HEAD"]),
+        raise_on_status=False,
+        respect_retry_after_header=True,
+    )
+    adapter = _PooledAdapter(
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    if not keep_alive:
+        session.headers["Connection"] = "close"
+    return session
+
+
+def get_shared_session(base_url: str, pool_size: int = None, max_retries: int = None) -> requests.Session:
+    """
+    获取 base_url 对应的共享 Session（首次调用时创建）
+
+    Args:
+        base_url: API 根地址
+        pool_size: 每个主机的最大连接数（仅首次创建时生效，默认 KLING_HTTP_POOL_SIZE）
+        max_retries: 传输层重试次数（仅首次创建时生效，默认 KLING_HTTP_MAX_RETRIES）
+
+    Returns:
+        线程间共享的 requests.Session
+    """
+    with _sessions_lock:
+        session = _sessions.get(base_url)
+        if session is None:
+            session = _create_session(
+                pool_size or config.KLING_HTTP_POOL_SIZE,
+                config.KLING_HTTP_MAX_RETRIES if max_retries is None else max_retries,
+                config.KLING_HTTP_KEEP_ALIVE,
+            )
+            _sessions[base_url] = session
+        return session
+
+
+def get_pool_stats() -> dict:
+    """
+    获取所有共享连接池的统计信息
+
+    Returns:
+        {base_url: {requests_sent, connections_opened, reuse_ratio, hosts}}
+        reuse_ratio = 1 - 建连数 / 底层请求数，越接近1说明保活连接复用越充分
+    """
+    with _sessions_lock:
+        sessions = dict(_sessions)
+
+    stats = {}
+    for base_url, session in sessions.items():
+        adapter = session.get_adapter(base_url)
+        hosts = adapter.connection_stats()
+        opened = sum(h["connections_opened"] for h in hosts.values())
+        pool_requests = sum(h["requests"] for h in hosts.values())
+        stats[base_url] = {
+            "requests_sent": adapter.requests_sent,
+            "connections_opened": opened,
+            "reuse_ratio": round(1 - opened / pool_requests, 3) if pool_requests else 0.0,
+            "hosts": hosts,
+        }
+    return stats
+
+
+# ============================================
+# JWT Token 缓存（按密钥共享，线程安全）
+# Token 有效期30分钟，轮询热路径上复用已签发的 Token
+# ============================================
+JWT_TTL_SECONDS = 1800              # Token 有效期（秒）
+JWT_REFRESH_MARGIN_SECONDS = 300    # 过期前5分钟刷新，避免请求途中过期
+
+_token_cache = {}  # {(access_key, secret_key): (token, exp)}
+_token_lock = threading.Lock()
+_token_stats = {"hits": 0, "refreshes": 0}
+
+
+def get_token_stats() -> dict:
+    """
+    获取JWT缓存统计
+
+    Returns:
+        {hits, refreshes, hit_ratio, cached_keys}
+    """
+    with _token_lock:
+        hits = _token_stats["hits"]
+        refreshes = _token_stats["refreshes"]
+        cached_keys = len(_token_cache)
+    total = hits + refreshes
+    return {
+        "hits": hits,
+        "refreshes": refreshes,
+        "hit_ratio": round(hits / total, 3) if total else 0.0,
+        "cached_keys": cached_keys,
+    }
+
+
+# ============================================
+# 文件下载配置
+# ============================================
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024   # 每次写入1MB
+DOWNLOAD_MAX_ATTEMPTS = 5           # 中断后最多续传次数
+
+
+def file_sha256(path: str) -> str:
+    """分块计算文件SHA256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def parse_download_size(status_code: int, headers, previous: int = None):
+    """
+    从下载响应头取文件总大小（206 读 Content-Range，200 读 Content-Length）
+    响应带 Content-Encoding（gzip 等）时客户端会自动解压，写入的字节数与头部大小对不上，返回 None 不校验大小
+    """
+    if headers.get("Content-Encoding", "identity").lower() != "identity":
+        return None
+    if status_code == 206:
+        # Content-Range: bytes start-end/total
+        content_range = headers.get("Content-Range", "")
+        if "/" in content_range and content_range.rsplit("/", 1)[1].isdigit():
+            return int(content_range.rsplit("/", 1)[1])
+        return previous
+    content_length = headers.get("Content-Length")
+    return int(content_length) if content_length and content_length.isdigit() else None
+
+
+def finish_download(part_path: Path, output: Path, total_size: int, label: str, expected_sha256: str = None):
+    """校验临时文件（大小/非空/可选SHA256）后原子重命名为目标文件，校验失败删除临时文件"""
+    downloaded = part_path.stat().st_size
+    if total_size is not None and downloaded != total_size:
+        part_path.unlink(missing_ok=True)
+        raise Exception(f"下载{label}大小不一致: {downloaded} != {total_size}")
+    if downloaded == 0:
+        part_path.unlink(missing_ok=True)
+        raise Exception(f"下载{label}失败: 文件为空")
+    if expected_sha256:
+        actual_sha256 = file_sha256(str(part_path))
+        if actual_sha256 != expected_sha256.lower():
+            part_path.unlink(missing_ok=True)
+            raise Exception(f"下载{label}校验失败: sha256={actual_sha256}")
+
+    os.replace(part_path, output)
+
+
+# ============================================
+# 任务响应解析（同步/批量轮询共用）
+# ============================================
+SUCCESS_STATUSES = ('succeed', 'completed', 'success', 'done', 'finished')
+FAILED_STATUSES = ('failed', 'error', 'failure')
+
+
+def extract_task_status(task_data: dict):
+    """从任务响应中提取状态（原始值）"""
+    if 'data' in task_data and isinstance(task_data['data'], dict) and 'task_status' in task_data['data']:
+        return task_data['data']['task_status']
+    elif 'status' in task_data:
+        return task_data['status']
+    return None
+
+
+def is_task_succeeded(status) -> bool:
+    """是否成功（不区分大小写，处理 SUCCEED vs succeed）"""
+    return bool(status) and status.lower() in SUCCESS_STATUSES
+
+
+def is_task_failed(status) -> bool:
+    """是否失败（不区分大小写）"""
+    return bool(status) and status.lower() in FAILED_STATUSES
+
+
+def extract_task_error(task_data: dict) -> str:
+    """从失败的任务响应中提取错误原因"""
+    # 获取错误信息（优先使用专门的错误字段）
+    data = task_data.get('data', {})
+    error_msg = (
+        data.get('task_status_msg') or  # 可灵API的任务状态消息
+        data.get('fail_reason') or       # 失败原因
+        data.get('error_msg') or         # 错误消息
+        task_data.get('msg') or          # 顶层消息
+        task_data.get('error') or
+        '未知错误'
+    )
+
+    # 如果错误信息看起来像是状态值，说明实际错误未知
+    if error_msg and error_msg.upper() in ['SUCCEED', 'SUCCESS', 'COMPLETED', 'DONE']:
+        error_msg = f"任务状态为failed，但未返回具体错误原因"
+
+    return error_msg
+
+
+# 可灵限流错误码：1302 请求过快，1303 并发/QPS 超出资源包限制
+RATE_LIMIT_CODES = (1302, 1303)
+# 没有错误码时只认明确表示限流的短语（"concurrency"、"并发" 等单词也会出现在普通参数校验错误里）
+RATE_LIMIT_PHRASES = ("too many requests", "rate limit", "queue is full", "请求过于频繁", "请求频率超限", "队列已满")
+RATE_LIMIT_MAX_ATTEMPTS = 4         # 被限流后最多重新排队提交的次数
+RATE_LIMIT_BACKOFF_SECONDS = 15     # 重新提交前的等待（按次数线性增加）
+
+
+class KlingRateLimitError(Exception):
+    """提交被可灵限流（429 / 并发超限 / 队列已满）"""
+
+
+class KlingTaskFailedError(Exception):
+    """远程任务本身失败（只有这种情况才需要重新提交；超时/查询/下载失败可以继续接管原任务）"""
+
+
+class KlingTaskNotFoundError(Exception):
+    """查询的任务在可灵侧不存在（任务ID无效或已过期），需要重新提交"""
+
+
+def is_rate_limited_response(status_code: int, body_text: str) -> bool:
+    """
+    判断提交失败是否属于限流（用于自适应并发降级）
+
+    HTTP 429、可灵限流错误码（RATE_LIMIT_CODES），或错误信息中含有明确的限流短语（RATE_LIMIT_PHRASES）；
+    JSON 响应只检查 message 字段，避免回显的请求参数误判
+    """
+    if status_code == 429:
+        return True
+    try:
+        body = json.loads(body_text)
+        code, message = body.get("code"), body.get("message")
+    except (ValueError, AttributeError, TypeError):
+        code, message = None, body_text
+    if code in RATE_LIMIT_CODES:
+        return True
+    text = str(message or "").lower()
+    return any(phrase in text for phrase in RATE_LIMIT_PHRASES)
 
 
-class KlingAPI:
-    """可灵AI API封装类"""
+def extract_task_id(data: dict) -> str:
+    """从创建任务的响应中提取task_id"""
+    if 'data' in data and 'task_id' in data['data']:
+        return data['data']['task_id']
+    elif 'task_id' in data:
+        return data['task_id']
+    raise Exception(f"响应中未找到task_id: {data}")
 
-    def __init__(self, access_key: str, secret_key: str, base_url: str = None):
-        self.access_key = access_key
-        self.secret_key = secret_key
-        # 默认使用海外版 API
-        self.base_url = base_url or "https://api.klingai.com"
 
-        # 调试信息
-        if not self.access_key:
-            print("❌ 错误: access_key 为空！")
-        else:
-            print(f"✅ access_key 已设置: {self.access_key[:10]}...")
+# ============================================
+# 已提交任务的元数据（用于自适应轮询的耗时统计）
+# ============================================
+_task_meta = {}  # {task_id: {"key": latency_key, "submitted_at": timestamp}}
+_task_meta_lock = threading.Lock()
+MAX_TRACKED_TASK_META = 1000
 
-        if not self.secret_key:
-            print("❌ 错误: secret_key 为空！")
-        else:
-            print(f"✅ secret_key 已设置: {self.secret_key[:10]}...")
 
-        print(f"✅ 使用API端点: {self.base_url}")
+def get_task_meta(task_id: str) -> dict:
+    """获取任务提交时记录的元数据（不存在返回None）"""
+    with _task_meta_lock:
+        return _task_meta.get(task_id)
 
-    def _encode_jwt_token(self) -> str:
-        """生成JWT Token（遵循可灵AI官方文档）"""
+
+def record_task_completion(task_id: str, polls: int, fallback_key: str = None, fallback_start: float = None):
+    """任务成功后记录耗时到耗时模型，并清理元数据"""
+    with _task_meta_lock:
+        meta = _task_meta.pop(task_id, None)
+    key = meta["key"] if meta else fallback_key
+    started_at = meta["submitted_at"] if meta else fallback_start
+    if key and started_at:
+        latency_model.record(key, time.time() - started_at, polls=polls)
+
+
+class KlingAuthMixin:
+    """JWT 认证与任务元数据记录（同步 KlingAPI / 异步 AsyncKlingAPI 共用）"""
+
+    access_key: str
+    secret_key: str
+    base_url: str
+
+    def _sign_jwt_token(self, now: int) -> tuple:
+        """签发新的JWT Token（遵循可灵AI官方文档），返回 (token, exp)"""
         headers = {
             "alg": "HS256",
             "typ": "JWT"
         }
+        exp = now + JWT_TTL_SECONDS
         payload = {
             "iss": self.access_key,
-            "exp": int(time.time()) + 1800,  # 有效时间：当前时间+1800s(30min)
-            "nbf": int(time.time()) - 5  # 开始生效的时间：当前时间-5秒
+            "exp": exp,  # 有效时间：当前时间+1800s(30min)
+            "nbf": now - 5  # 开始生效的时间：当前时间-5秒
         }
 
         # 生成 JWT Token（减少日志输出，避免日志过多）
         token = jwt.encode(payload, self.secret_key, headers=headers)
-        return token
+        return token, exp
+
+    def _encode_jwt_token(self) -> str:
+        """
+        获取JWT Token（带缓存）
+
+        同一密钥的所有实例共享缓存，在过期前 JWT_REFRESH_MARGIN_SECONDS 秒内才重新签发
+        """
+        cache_key = (self.access_key, self.secret_key)
+        now = int(time.time())
+
+        with _token_lock:
+            cached = _token_cache.get(cache_key)
+            if cached and now < cached[1] - JWT_REFRESH_MARGIN_SECONDS:
+                _token_stats["hits"] += 1
+                return cached[0]
+
+            token, exp = self._sign_jwt_token(now)
+            _token_cache[cache_key] = (token, exp)
+            _token_stats["refreshes"] += 1
+            return token
+
+    def _remember_task(self, task_id: str, kind: str, model_name: str = None, mode: str = None) -> str:
+        """记录任务的模型/模式和提交时间，供自适应轮询使用"""
+        with _task_meta_lock:
+            if len(_task_meta) >= MAX_TRACKED_TASK_META:
+                # 丢弃最早的记录（从未等待的任务）
+                _task_meta.pop(next(iter(_task_meta)))
+            _task_meta[task_id] = {
+                "key": latency_key(kind, model_name, mode),
+                "submitted_at": time.time(),
+            }
+        return task_id
+
+    def _submitted(self, lease, data: dict, kind: str, model_name: str = None, mode: str = None) -> dict:
+        """提交成功：记录任务元数据，并把并发槽位绑定到任务ID（任务结束时释放）"""
+        task_id = self._remember_task(extract_task_id(data), kind, model_name, mode)
+        concurrency_governor.attach(lease, task_id)
+        concurrency_governor.report_success(lease)
+        return {'task_id': task_id}
+
+    @staticmethod
+    def _encode_image_file(image_path: str) -> str:
+        """读取图片并转换为base64"""
+        with open(image_path, 'rb') as f:
+            return base64.b64encode(f.read()).decode('utf-8')
+
+    def _build_image_to_image_payload(
+        self,
+        image_path: str,
+        prompt: str,
+        negative_prompt: str,
+        aspect_ratio: str,
+        image_count: int,
+    ) -> dict:
+        """构造图生图请求体（kling-v2模型）"""
+        image_base64 = self._encode_image_file(image_path)
+        print(f"  📤 图片已编码为base64，大小: {len(image_base64)} 字符")
+
+        return {
+            "model_name": "kling-v2",
+            "image": image_base64,
+            "prompt": prompt,
+            "negative_prompt": negative_prompt,
+            "aspect_ratio": aspect_ratio,
+            "image_count": image_count,
+        }
+
+    def _build_image_to_video_payload(
+        self,
+        image_path: str,
+        prompt: str,
+        negative_prompt: str,
+        duration: int,
+        aspect_ratio: str,
+        model_name: str,
+        mode: str,
+        tail_image_path: str = None,
+    ) -> dict:
+        """构造图生视频请求体（支持首尾帧）"""
+        image_base64 = self._encode_image_file(image_path)
+        print(f"  📤 首帧图片已编码为base64，大小: {len(image_base64)} 字符")
+        print(f"  🎬 使用模型: {model_name} (模式: {mode})")
+
+        # 调试：打印当前使用的密钥信息（只显示部分，保护安全）
+        print(f"  🔑 视频API调试信息:")
+        print(f"     Access Key: {self.access_key[:8]}..." if self.access_key else "     Access Key: 未设置")
+        print(f"     Secret Key: {self.secret_key[:8]}..." if self.secret_key else "     Secret Key: 未设置")
+        print(f"     API URL: {self.base_url}/v1/videos/image2video")
+
+        payload = {
+            "model_name": model_name,
+            "mode": mode,
+            "image": image_base64,
+            "prompt": prompt,
+            "negative_prompt": negative_prompt,
+            "duration": duration,
+            "aspect_ratio": aspect_ratio,
+        }
+
+        # 添加尾帧图片（首尾帧模式）
+        if tail_image_path:
+            tail_image_base64 = self._encode_image_file(tail_image_path)
+            payload["image_tail"] = tail_image_base64
+            print(f"  📤 尾帧图片已编码为base64，大小: {len(tail_image_base64)} 字符")
+            print(f"  🎯 启用首尾帧模式：视频将从首帧过渡到尾帧")
+
+        return payload
 
     def _get_auth_headers(self) -> dict:
         """获取认证头"""
@@ -57,7 +476,39 @@ class KlingAPI:
             'Content-Type': 'application/json',
             'Authorization': f'Bearer {api_token}'
         }
-    
+
+
+class KlingAPI(KlingAuthMixin):
+    """可灵AI API封装类"""
+
+    def __init__(
+        self,
+        access_key: str,
+        secret_key: str,
+        base_url: str = None,
+        pool_size: int = None,
+        max_retries: int = None,
+    ):
+        self.access_key = access_key
+        self.secret_key = secret_key
+        # 默认使用海外版 API
+        self.base_url = base_url or "https://api.klingai.com"
+        # 共享连接池（同一 base_url 的所有实例复用）
+        self.session = get_shared_session(self.base_url, pool_size=pool_size, max_retries=max_retries)
+
+        # 调试信息
+        if not self.access_key:
+            print("❌ 错误: access_key 为空！")
+        else:
+            print(f"✅ access_key 已设置: {self.access_key[:10]}...")
+
+        if not self.secret_key:
+            print("❌ 错误: secret_key 为空！")
+        else:
+            print(f"✅ secret_key 已设置: {self.secret_key[:10]}...")
+
+        print(f"✅ 使用API端点: {self.base_url}")
+
     def text_to_image(
         self,
         prompt: str,
@@ -78,28 +529,15 @@ class KlingAPI:
             包含task_id的字典
         """
         url = f"{self.base_url}/v1/images/generations"
-        headers = self._get_auth_headers()
-        
+
         payload = {
             "prompt": prompt,
             "negative_prompt": negative_prompt,
             "aspect_ratio": aspect_ratio,
             "image_count": image_count,
         }
-        
-        response = requests.post(url, headers=headers, json=payload, timeout=30)
-        
-        if response.status_code == 200:
-            data = response.json()
-            # 提取task_id
-            if 'data' in data and 'task_id' in data['data']:
-                return {'task_id': data['data']['task_id']}
-            elif 'task_id' in data:
-                return {'task_id': data['task_id']}
-            else:
-                raise Exception(f"响应中未找到task_id: {data}")
-        else:
-            raise Exception(f"API请求失败: {response.status_code} - {response.text}")
+
+        return self._submit_task(url, payload, "image", "文生图", timeout=30, error_label="API请求失败", max_retries=1)
     
     def query_task(self, task_id: str) -> dict:
         """
@@ -114,74 +552,88 @@ class KlingAPI:
         url = f"{self.base_url}/v1/images/generations/{task_id}"
         headers = self._get_auth_headers()
         
-        response = requests.get(url, headers=headers, timeout=30)
+        response = self.session.get(url, headers=headers, timeout=30)
         
         if response.status_code == 200:
             return response.json()
+        elif response.status_code == 404:
+            raise KlingTaskNotFoundError(f"任务不存在: {task_id}")
         else:
             raise Exception(f"查询任务失败: {response.status_code} - {response.text}")
     
-    def wait_for_task(self, task_id: str, max_wait_seconds: int = 300, poll_interval: int = 5) -> dict:
+    def wait_for_task(self, task_id: str, max_wait_seconds: int = 300, poll_interval: int = None) -> dict:
         """
         等待任务完成
 
         Args:
             task_id: 任务ID
             max_wait_seconds: 最大等待时间（秒）
-            poll_interval: 轮询间隔（秒）
+            poll_interval: 轮询间隔（秒），None 表示根据历史耗时自适应（基础间隔5秒）
 
         Returns:
             完成的任务信息
         """
+        return self._wait_until_done(
+            self.query_task, task_id, max_wait_seconds, poll_interval, "任务",
+            kind="image", base_interval=5,
+        )
+
+    def _wait_until_done(
+        self,
+        query_func,
+        task_id: str,
+        max_wait_seconds: int,
+        poll_interval: int,
+        label: str,
+        kind: str,
+        base_interval: int,
+    ) -> dict:
+        """轮询 query_func 直到任务成功/失败/超时"""
         start_time = time.time()
         retry_count = 0
 
-        while time.time() - start_time < max_wait_seconds:
-            retry_count += 1
+        meta = get_task_meta(task_id)
+        key = meta["key"] if meta else latency_key(kind)
+        submitted_at = meta["submitted_at"] if meta else start_time
 
-            task_data = self.query_task(task_id)
+        def next_delay():
+            if poll_interval:
+                return poll_interval
+            return latency_model.next_poll_delay(key, time.time() - submitted_at, base_interval)
 
-            # 提取状态
-            status = None
-            if 'data' in task_data and 'task_status' in task_data['data']:
-                status = task_data['data']['task_status']
-            elif 'status' in task_data:
-                status = task_data['status']
+        delay = 0 if poll_interval else next_delay()
+        while True:
+            remaining = max_wait_seconds - (time.time() - start_time)
+            if remaining <= 0:
+                break
+            if delay > 0:
+                time.sleep(min(delay, remaining))
 
-            # 统一转换为小写进行比较（处理大小写不一致问题，如 SUCCEED vs succeed）
-            status_lower = status.lower() if status else None
+            retry_count += 1
+
+            task_data = query_func(task_id)
+            status = extract_task_status(task_data)
 
             print(f"  查询 #{retry_count}: 状态={status} (原始值)")
 
-            # 检查是否完成（不区分大小写）
-            if status_lower in ['succeed', 'completed', 'success', 'done', 'finished']:
+            if is_task_succeeded(status):
                 print(f"  ✅ 任务成功完成: {status}")
+                record_task_completion(task_id, retry_count, fallback_key=key, fallback_start=submitted_at)
+                concurrency_governor.release_task(task_id)
                 return task_data
-            elif status_lower in ['failed', 'error', 'failure']:
+            elif is_task_failed(status):
                 # 打印完整响应用于调试
-                print(f"  📋 任务失败，完整响应: {json.dumps(task_data, ensure_ascii=False, indent=2)}")
-                
-                # 获取错误信息（优先使用专门的错误字段）
-                data = task_data.get('data', {})
-                error_msg = (
-                    data.get('task_status_msg') or  # 可灵API的任务状态消息
-                    data.get('fail_reason') or       # 失败原因
-                    data.get('error_msg') or         # 错误消息
-                    task_data.get('msg') or          # 顶层消息
-                    task_data.get('error') or
-                    '未知错误'
-                )
-                
-                # 如果错误信息看起来像是状态值，说明实际错误未知
-                if error_msg and error_msg.upper() in ['SUCCEED', 'SUCCESS', 'COMPLETED', 'DONE']:
-                    error_msg = f"任务状态为failed，但未返回具体错误原因"
-                
-                print(f"  ❌ 任务失败: status={status}, 错误原因={error_msg}")
-                raise Exception(f"任务失败: {error_msg}")
+                print(f"  📋 {label}失败，完整响应: {json.dumps(task_data, ensure_ascii=False, indent=2)}")
+                error_msg = extract_task_error(task_data)
+                print(f"  ❌ {label}失败: status={status}, 错误原因={error_msg}")
+                concurrency_governor.release_task(task_id)
+                raise KlingTaskFailedError(f"任务失败: {error_msg}")
 
             # 等待后继续轮询
-            time.sleep(poll_interval)
+            delay = next_delay()
 
+        # 超时只归还槽位：远程任务可能仍在运行，调用方保留任务ID，之后查询状态后继续接管（不重新提交）
+        concurrency_governor.release_task(task_id)
         raise Exception(f"任务超时（{max_wait_seconds}秒）")
 
     def image_to_image(
@@ -205,51 +657,13 @@ class KlingAPI:
         Returns:
             包含task_id的字典
         """
+        payload = self._build_image_to_image_payload(image_path, prompt, negative_prompt, aspect_ratio, image_count)
+
         # 创建图生图任务（kling-v2模型）
         url = f"{self.base_url}/v1/images/generations"
-        headers = self._get_auth_headers()
-
-        # 读取图片并转换为base64
-        import base64
-        with open(image_path, 'rb') as f:
-            image_data = f.read()
-            image_base64 = base64.b64encode(image_data).decode('utf-8')
-
-        print(f"  📤 图片已编码为base64，大小: {len(image_base64)} 字符")
-
-        payload = {
-            "model_name": "kling-v2",
-            "image": image_base64,
-            "prompt": prompt,
-            "negative_prompt": negative_prompt,
-            "aspect_ratio": aspect_ratio,
-            "image_count": image_count,
-        }
-
-        # 添加重试机制
-        max_retries = 3
-        for attempt in range(max_retries):
-            try:
-                response = requests.post(url, headers=headers, json=payload, timeout=60)
-
-                if response.status_code == 200:
-                    data = response.json()
-                    # 提取task_id
-                    if 'data' in data and 'task_id' in data['data']:
-                        return {'task_id': data['data']['task_id']}
-                    elif 'task_id' in data:
-                        return {'task_id': data['task_id']}
-                    else:
-                        raise Exception(f"响应中未找到task_id: {data}")
-                else:
-                    raise Exception(f"API请求失败: {response.status_code} - {response.text}")
-            except (requests.exceptions.ConnectionError, ConnectionResetError) as e:
-                if attempt < max_retries - 1:
-                    wait_time = (attempt + 1) * 2  # 2秒, 4秒, 6秒
-                    print(f"  ⚠️ 连接失败，{wait_time}秒后重试 (尝试 {attempt + 1}/{max_retries})...")
-                    time.sleep(wait_time)
-                else:
-                    raise Exception(f"连接失败，已重试{max_retries}次: {e}")
+        return self._submit_task(
+            url, payload, "image", "图生图 kling-v2", timeout=60, error_label="API请求失败", model_name="kling-v2",
+        )
 
     def image_to_video(
         self,
@@ -278,66 +692,67 @@ class KlingAPI:
         Returns:
             包含task_id的字典
         """
-        # 读取图片并转换为base64
-        import base64
-        with open(image_path, 'rb') as f:
-            image_data = f.read()
-            image_base64 = base64.b64encode(image_data).decode('utf-8')
+        payload = self._build_image_to_video_payload(
+            image_path, prompt, negative_prompt, duration, aspect_ratio, model_name, mode, tail_image_path,
+        )
 
-        print(f"  📤 首帧图片已编码为base64，大小: {len(image_base64)} 字符")
-        print(f"  🎬 使用模型: {model_name} (模式: {mode})")
-
-        # 创建视频生成任务
+        # 创建视频生成任务（增加超时时间到120秒，因为视频生成需要较长时间）
         video_url = f"{self.base_url}/v1/videos/image2video"
-        headers = self._get_auth_headers()
-
-        # 调试：打印当前使用的密钥信息（只显示部分，保护安全）
-        print(f"  🔑 视频API调试信息:")
-        print(f"     Access Key: {self.access_key[:8]}..." if self.access_key else "     Access Key: 未设置")
-        print(f"     Secret Key: {self.secret_key[:8]}..." if self.secret_key else "     Secret Key: 未设置")
-        print(f"     API URL: {video_url}")
-
-        payload = {
-            "model_name": model_name,
-            "mode": mode,
-            "image": image_base64,
-            "prompt": prompt,
-            "negative_prompt": negative_prompt,
-            "duration": duration,
-            "aspect_ratio": aspect_ratio,
-        }
+        return self._submit_task(
+            video_url, payload, "video", f"图生视频 {model_name}", timeout=120, error_label="创建视频任务失败",
+            model_name=model_name, mode=mode,
+        )
 
-        # 添加尾帧图片（首尾帧模式）
-        if tail_image_path:
-            with open(tail_image_path, 'rb') as f:
-                tail_image_data = f.read()
-                tail_image_base64 = base64.b64encode(tail_image_data).decode('utf-8')
-            payload["image_tail"] = tail_image_base64
-            print(f"  📤 尾帧图片已编码为base64，大小: {len(tail_image_base64)} 字符")
-            print(f"  🎯 启用首尾帧模式：视频将从首帧过渡到尾帧")
+    def _submit_task(
+        self,
+        url: str,
+        payload: dict,
+        kind: str,
+        label: str,
+        timeout: int,
+        error_label: str,
+        model_name: str = None,
+        mode: str = None,
+        max_retries: int = 3,
+    ) -> dict:
+        """
+        占用并发槽位后提交任务；被限流时归还槽位、降低并发上限，等待后重新排队提交
 
-        # 添加重试机制
-        max_retries = 3
+        Returns:
+            包含task_id的字典
+        """
+        for attempt in range(1, RATE_LIMIT_MAX_ATTEMPTS + 1):
+            with concurrency_governor.slot(self.access_key, kind, label) as lease:
+                try:
+                    data = self._post_task(url, payload, timeout, error_label, max_retries)
+                    return self._submitted(lease, data, kind, model_name, mode)
+                except KlingRateLimitError:
+                    concurrency_governor.report_rate_limited(lease, model_name)
+                    if attempt >= RATE_LIMIT_MAX_ATTEMPTS:
+                        raise
+            wait_time = RATE_LIMIT_BACKOFF_SECONDS * attempt
+            print(f"  ⚠️ {label} 被限流，{wait_time}秒后重新排队提交 (尝试 {attempt}/{RATE_LIMIT_MAX_ATTEMPTS})...")
+            time.sleep(wait_time)
+
+    def _post_task(self, url: str, payload: dict, timeout: int, error_label: str, max_retries: int = 3) -> dict:
+        """提交任务（POST），连接失败时重试，返回响应JSON"""
         for attempt in range(max_retries):
             try:
-                # 增加超时时间到120秒，因为视频生成需要较长时间
-                video_response = requests.post(video_url, headers=headers, json=payload, timeout=120)
-
-                if video_response.status_code == 200:
-                    data = video_response.json()
-                    if 'data' in data and 'task_id' in data['data']:
-                        return {'task_id': data['data']['task_id']}
-                    elif 'task_id' in data:
-                        return {'task_id': data['task_id']}
-                    else:
-                        raise Exception(f"响应中未找到task_id: {data}")
+                response = self.session.post(url, headers=self._get_auth_headers(), json=payload, timeout=timeout)
+
+                if response.status_code == 200:
+                    return response.json()
+                elif is_rate_limited_response(response.status_code, response.text):
+                    raise KlingRateLimitError(f"{error_label}: {response.status_code} - {response.text}")
                 else:
-                    raise Exception(f"创建视频任务失败: {video_response.status_code} - {video_response.text}")
+                    raise Exception(f"{error_label}: {response.status_code} - {response.text}")
             except (requests.exceptions.ConnectionError, ConnectionResetError) as e:
                 if attempt < max_retries - 1:
                     wait_time = (attempt + 1) * 2  # 2秒, 4秒, 6秒
                     print(f"  ⚠️ 连接失败，{wait_time}秒后重试 (尝试 {attempt + 1}/{max_retries})...")
                     time.sleep(wait_time)
+                elif max_retries == 1:
+                    raise
                 else:
                     raise Exception(f"连接失败，已重试{max_retries}次: {e}")
 
@@ -354,121 +769,162 @@ class KlingAPI:
         url = f"{self.base_url}/v1/videos/image2video/{task_id}"
         headers = self._get_auth_headers()
 
-        response = requests.get(url, headers=headers, timeout=30)
+        response = self.session.get(url, headers=headers, timeout=30)
 
         if response.status_code == 200:
             return response.json()
+        elif response.status_code == 404:
+            raise KlingTaskNotFoundError(f"视频任务不存在: {task_id}")
         else:
             raise Exception(f"查询视频任务失败: {response.status_code} - {response.text}")
 
-    def wait_for_video_task(self, task_id: str, max_wait_seconds: int = 600, poll_interval: int = 10) -> dict:
+    def list_video_tasks(self, page_num: int = 1, page_size: int = 100) -> list:
         """
-        等待视频任务完成
+        批量查询视频任务列表（一次请求返回多个任务的状态）
 
         Args:
-            task_id: 任务ID
-            max_wait_seconds: 最大等待时间（秒）
-            poll_interval: 轮询间隔（秒）
+            page_num: 页码（从1开始）
+            page_size: 每页数量（最大500）
 
         Returns:
-            完成的任务信息
+            任务列表，每项包含 task_id / task_status / task_result 等字段
         """
-        start_time = time.time()
-        retry_count = 0
+        url = f"{self.base_url}/v1/videos/image2video"
+        return self._list_tasks(url, page_num, page_size)
 
-        while time.time() - start_time < max_wait_seconds:
-            retry_count += 1
-
-            task_data = self.query_video_task(task_id)
+    def list_image_tasks(self, page_num: int = 1, page_size: int = 100) -> list:
+        """批量查询图片任务列表（参数同 list_video_tasks）"""
+        url = f"{self.base_url}/v1/images/generations"
+        return self._list_tasks(url, page_num, page_size)
 
-            # 提取状态
-            status = None
-            if 'data' in task_data and 'task_status' in task_data['data']:
-                status = task_data['data']['task_status']
-            elif 'status' in task_data:
-                status = task_data['status']
+    def _list_tasks(self, url: str, page_num: int, page_size: int) -> list:
+        headers = self._get_auth_headers()
+        params = {"pageNum": page_num, "pageSize": page_size}
 
-            # 统一转换为小写进行比较（处理大小写不一致问题，如 SUCCEED vs succeed）
-            status_lower = status.lower() if status else None
+        response = self.session.get(url, headers=headers, params=params, timeout=30)
 
-            print(f"  查询 #{retry_count}: 状态={status} (原始值)")
+        if response.status_code == 200:
+            data = response.json().get('data')
+            if not isinstance(data, list):
+                raise Exception(f"任务列表响应格式异常: {response.text[:200]}")
+            return data
+        else:
+            raise Exception(f"查询任务列表失败: {response.status_code} - {response.text}")
 
-            # 检查是否完成（不区分大小写）
-            if status_lower in ['succeed', 'completed', 'success', 'done', 'finished']:
-                print(f"  ✅ 任务成功完成: {status}")
-                return task_data
-            elif status_lower in ['failed', 'error', 'failure']:
-                # 打印完整响应用于调试
-                print(f"  📋 视频任务失败，完整响应: {json.dumps(task_data, ensure_ascii=False, indent=2)}")
-                
-                # 获取错误信息（优先使用专门的错误字段）
-                data = task_data.get('data', {})
-                error_msg = (
-                    data.get('task_status_msg') or  # 可灵API的任务状态消息
-                    data.get('fail_reason') or       # 失败原因
-                    data.get('error_msg') or         # 错误消息
-                    task_data.get('msg') or          # 顶层消息
-                    task_data.get('error') or
-                    '未知错误'
-                )
-                
-                # 如果错误信息看起来像是状态值，说明实际错误未知
-                if error_msg and error_msg.upper() in ['SUCCEED', 'SUCCESS', 'COMPLETED', 'DONE']:
-                    error_msg = f"任务状态为failed，但未返回具体错误原因"
-                
-                print(f"  ❌ 视频任务失败: status={status}, 错误原因={error_msg}")
-                raise Exception(f"任务失败: {error_msg}")
+    def wait_for_video_task(self, task_id: str, max_wait_seconds: int = 600, poll_interval: int = None) -> dict:
+        """
+        等待视频任务完成
 
-            # 等待后继续轮询
-            time.sleep(poll_interval)
+        Args:
+            task_id: 任务ID
+            max_wait_seconds: 最大等待时间（秒）
+            poll_interval: 轮询间隔（秒），None 表示根据历史耗时自适应（基础间隔10秒）
 
-        raise Exception(f"任务超时（{max_wait_seconds}秒）")
+        Returns:
+            完成的任务信息
+        """
+        return self._wait_until_done(
+            self.query_video_task, task_id, max_wait_seconds, poll_interval, "视频任务",
+            kind="video", base_interval=10,
+        )
 
-    def download_image(self, image_url: str, output_path: str) -> str:
+    def download_image(self, image_url: str, output_path: str, expected_sha256: str = None) -> str:
         """
-        下载图片
+        下载图片（流式写入，断点续传）
 
         Args:
             image_url: 图片URL
             output_path: 输出路径
+            expected_sha256: 期望的SHA256（可选，提供时校验）
 
         Returns:
             保存的文件路径
         """
-        response = requests.get(image_url, timeout=60)
+        return self._stream_download(image_url, output_path, "图片", read_timeout=60, expected_sha256=expected_sha256)
 
-        if response.status_code == 200:
-            # 确保输出目录存在
-            Path(output_path).parent.mkdir(parents=True, exist_ok=True)
-
-            with open(output_path, 'wb') as f:
-                f.write(response.content)
-
-            return output_path
-        else:
-            raise Exception(f"下载图片失败: {response.status_code}")
-
-    def download_video(self, video_url: str, output_path: str) -> str:
+    def download_video(self, video_url: str, output_path: str, expected_sha256: str = None) -> str:
         """
-        下载视频
+        下载视频（流式写入，断点续传）
 
         Args:
             video_url: 视频URL
             output_path: 输出路径
+            expected_sha256: 期望的SHA256（可选，提供时校验）
 
         Returns:
             保存的文件路径
         """
-        response = requests.get(video_url, timeout=120)
-
-        if response.status_code == 200:
-            # 确保输出目录存在
-            Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+        return self._stream_download(video_url, output_path, "视频", read_timeout=120, expected_sha256=expected_sha256)
 
-            with open(output_path, 'wb') as f:
-                f.write(response.content)
-
-            return output_path
-        else:
-            raise Exception(f"下载视频失败: {response.status_code}")
+    def _stream_download(
+        self,
+        url: str,
+        output_path: str,
+        label: str,
+        read_timeout: int,
+        expected_sha256: str = None,
+        max_attempts: int = DOWNLOAD_MAX_ATTEMPTS,
+    ) -> str:
+        """
+        分块下载到临时文件，连接中断时用 HTTP Range 从断点继续，
+        校验大小（及可选的SHA256）后原子重命名为目标文件。
+        内存占用只有一个分块大小，与文件大小和并发下载数无关。
+        """
+        output = Path(output_path)
+        output.parent.mkdir(parents=True, exist_ok=True)
+        part_path = output.with_name(output.name + ".part")
+        # 不同调用之间不续传（同一路径可能对应重新生成的另一个文件）
+        part_path.unlink(missing_ok=True)
+
+        total_size = None
+        try:
+            for attempt in range(1, max_attempts + 1):
+                offset = part_path.stat().st_size if part_path.exists() else 0
+                headers = {"Range": f"bytes={offset}-"} if offset else {}
+
+                try:
+                    with self.session.get(url, headers=headers, stream=True, timeout=(10, read_timeout)) as response:
+                        if response.status_code == 416 and total_size is not None and offset >= total_size:
+                            # 临时文件已完整
+                            break
+                        if response.status_code == 206:
+                            mode = 'ab'
+                        elif response.status_code == 200:
+                            # 服务器不支持 Range，从头开始
+                            mode = 'wb'
+                            offset = 0
+                        else:
+                            raise Exception(f"下载{label}失败: {response.status_code}")
+                        total_size = parse_download_size(response.status_code, response.headers, total_size)
+
+                        if offset:
+                            print(f"  ⏩ 从断点续传{label}: {offset} 字节")
+
+                        with open(part_path, mode) as f:
+                            for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                                if chunk:
+                                    f.write(chunk)
+
+                    downloaded = part_path.stat().st_size
+                    if total_size is None or downloaded >= total_size:
+                        break
+                    raise requests.exceptions.ChunkedEncodingError(f"连接提前结束 ({downloaded}/{total_size} 字节)")
+
+                except (requests.exceptions.ConnectionError,
+                        requests.exceptions.ChunkedEncodingError,
+                        requests.exceptions.Timeout) as e:
+                    if attempt >= max_attempts:
+                        raise Exception(f"下载{label}失败，已重试{max_attempts}次: {e}")
+                    if total_size is None:
+                        # 总大小未知（或响应经过压缩，已写入的是解压后的字节），无法按偏移续传，从头下载
+                        part_path.unlink(missing_ok=True)
+                    wait_time = attempt * 2
+                    print(f"  ⚠️ 下载{label}中断，{wait_time}秒后续传 (尝试 {attempt}/{max_attempts}): {str(e)[:100]}")
+                    time.sleep(wait_time)
+        except Exception:
+            # 不可恢复的错误（HTTP 错误、磁盘写满、重试耗尽等）：删除临时文件，不留下残缺的 .part
+            part_path.unlink(missing_ok=True)
+            raise
 
+        finish_download(part_path, output, total_size, label, expected_sha256)
+        return output_path
@@ -10,11 +10,12 @@ from fastapi.staticfiles import StaticFiles
 from pathlib import Path
 import uvicorn
 
-from api.kling_generation import router as kling_router
+from api.kling_generation import router as kling_router, resume_interrupted_pipelines
 from api.kling_tools import router as kling_tools_router
 from api.background_removal import router as background_router
 from api.video_trimming import router as video_router
 from api.model_test import router as model_test_router
+from kling_api_async import aclose_async_clients
 
 # 创建 FastAPI 应用
 app = FastAPI(
@@ -45,6 +46,18 @@ output_dir.mkdir(exist_ok=True)
 app.mount("/output", StaticFiles(directory="output"), name="output")
 
 
+@app.on_event("startup")
+async def resume_pipelines():
+    """恢复被重启/重新部署中断的后台生成流程"""
+    resume_interrupted_pipelines()
+
+
+@app.on_event("shutdown")
+async def close_kling_clients():
+    """关闭可灵AI异步连接池"""
+    await aclose_async_clients()
+
+
 @app.get("/")
 async def root():
     """根路径"""
@@ -84,6 +97,13 @@ async def health_check():
         KLING_VIDEO_SECRET_KEY,
         KLING_BASE_URL,
     )
+    from kling_api_helper import get_pool_stats, get_token_stats
+    from services.kling_task_poller import task_poller
+    from services.kling_concurrency import concurrency_governor
+    from services.kling_result_cache import result_cache
+    from services.gif_converter import gif_converter
+    from utils.video_probe import video_probe
+    from services.frame_cache import frame_cache
 
     return {
         "status": "healthy",
@@ -104,7 +124,23 @@ async def health_check():
             "image_secret_key": f"{KLING_SECRET_KEY[:8]}..." if KLING_SECRET_KEY else "NOT_SET",
             "video_access_key": f"{KLING_VIDEO_ACCESS_KEY[:8]}..." if KLING_VIDEO_ACCESS_KEY else "NOT_SET",
             "video_secret_key": f"{KLING_VIDEO_SECRET_KEY[:8]}..." if KLING_VIDEO_SECRET_KEY else "NOT_SET",
-        }
+        },
+        # 可灵AI HTTP 连接池统计（连接复用率）
+        "kling_http_pool": get_pool_stats(),
+        # 可灵AI JWT Token 缓存统计（刷新次数）
+        "kling_jwt_cache": get_token_stats(),
+        # 可灵AI批量任务轮询统计
+        "kling_task_poller": task_poller.get_stats(),
+        # 可灵AI并发槽位（按密钥/任务类型）
+        "kling_concurrency": concurrency_governor.get_stats(),
+        # 可灵生成结果缓存（命中/未命中/淘汰次数、占用空间）
+        "kling_result_cache": result_cache.get_stats(),
+        # GIF 转换进程池（进程数、已提交/完成/失败/回退次数）
+        "gif_converter": gif_converter.get_stats(),
+        # 视频元数据探测缓存（内存/数据库命中、实际探测次数）
+        "video_probe": video_probe.get_stats(),
+        # 批量取帧缩略图缓存（命中/未命中/解码次数、占用空间）
+        "frame_cache": frame_cache.get_stats(),
     }
 
 
@@ -15,15 +15,38 @@ from datetime import datetime
 from typing import Dict, List, Optional, Callable, Any
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import threading
-from kling_api_helper import KlingAPI
+from kling_api_helper import (
+    KlingAPI,
+    KlingTaskFailedError,
+    KlingTaskNotFoundError,
+    extract_task_status,
+    is_task_failed,
+    is_task_succeeded,
+)
 import config
+from services.kling_task_poller import task_poller
+from services.kling_concurrency import concurrency_governor
+from services.kling_pacer import request_pacer, PacingReport
+from services.pipeline_journal import PipelineJournal, SubmissionReport
+from services.kling_result_cache import result_cache
+from services.video_task_graph import VideoTask, VideoTaskScheduler, build_video_task_graph, critical_path
+from services.gif_converter import GifConversionBatch
+from utils.renditions import RENDITION_FORMATS, rendition_path
+from utils.video_probe import video_probe
+from utils.sprite_atlas import build_sprite_atlases
 from prompt_config.prompts import (
     FIRST_TRANSITIONS,
     POSES,
+    REVERSE_TRANSITIONS,
     get_all_transitions,
 )
 from utils.image_utils import remove_background, ensure_square
-from utils.video_utils import extract_first_frame, extract_last_frame, convert_mp4_to_gif, concatenate_videos
+from utils.video_utils import (
+    extract_frames,
+    concatenate_videos,
+    reverse_video,
+    reversal_quality,
+)
 
 
 # ============================================
@@ -120,6 +143,12 @@ class KlingPipeline:
         # 视频 API 密钥（可选，如果不传则与图片 API 相同）
         video_access_key: str = None,
         video_secret_key: str = None,
+        # 间隔模式："bucket" 令牌桶（默认，预算充足时不等待）或 "fixed" 固定等待
+        pacing_mode: str = None,
+        # 是否复用相同请求的已生成结果（默认 KLING_RESULT_CACHE_ENABLED）
+        use_cache: bool = None,
+        # 反向过渡本地倒放（默认 KLING_LOCAL_REVERSE）
+        local_reverse: bool = None,
     ):
         # 图片 API 实例 - 统一使用海外版
         self.kling = KlingAPI(
@@ -149,6 +178,12 @@ class KlingPipeline:
         self.retry_delay = retry_delay
         self.step_interval = step_interval
         self.api_interval = api_interval
+        self.pacing_mode = pacing_mode or config.KLING_PACING_MODE
+        self.pacing = PacingReport(self.pacing_mode)
+        self.submissions = SubmissionReport()
+        self.use_cache = config.KLING_RESULT_CACHE_ENABLED if use_cache is None else use_cache
+        self.local_reverse = config.KLING_LOCAL_REVERSE if local_reverse is None else local_reverse
+        self.reverse_report = {}  # {过渡: 倒放质量检查结果}
 
         # 状态回调（用于更新任务状态）
         self.status_callback = status_callback
@@ -178,6 +213,17 @@ class KlingPipeline:
         self.videos_dir = None
         self.gifs_dir = None
 
+        # 断点日志（setup_pet_directories 时创建）
+        self.journal = None
+
+        # 视频下载完成即提交的 GIF 转换（完整流程生成视频前创建，步骤7收集）
+        self.gif_batch = None
+        # 与 GIF 并列的其他动图格式（config.RENDITION_FORMATS），步骤7后为 {fmt: {"transitions": {}, "loops": {}}}
+        self.rendition_formats = [fmt for fmt in config.RENDITION_FORMATS if fmt in RENDITION_FORMATS and fmt != "gif"]
+        self.renditions = {}
+        # 精灵图集清单（步骤7后生成，未启用或失败时为 None）
+        self.sprite_atlas = None
+
     def _update_status(self, progress: int, message: str, step: str = None):
         """更新任务状态"""
         print(f"📊 [{progress}%] {message}")
@@ -185,10 +231,40 @@ class KlingPipeline:
             self.status_callback(progress, message, step)
 
     def _wait_interval(self, seconds: int = None, message: str = "步骤间隔"):
-        """等待间隔"""
+        """
+        步骤/API调用间隔
+
+        fixed 模式下固定等待 seconds 秒；令牌桶模式下步骤之间不等待（请求预算在提交可灵任务时消耗，
+        见 _pace_submit），只记录固定模式下本应等待的时间，用于节奏统计对比。
+        """
         wait_time = seconds or self.step_interval
-        print(f"⏳ {message}，等待 {wait_time} 秒...")
-        time.sleep(wait_time)
+        if self.pacing_mode == "fixed":
+            print(f"⏳ {message}，等待 {wait_time} 秒...")
+            time.sleep(wait_time)
+            self.pacing.add(wait_time, wait_time)
+        else:
+            self.pacing.add(0.0, wait_time)
+
+    def _pace_submit(self, client: KlingAPI, label: str):
+        """令牌桶模式：提交可灵任务前消耗该密钥的一个令牌（进程内所有 Pipeline 按密钥共享预算）"""
+        if self.pacing_mode == "fixed":
+            return
+        waited = request_pacer.pace(client.access_key, self.api_interval)
+        if waited > 0:
+            print(f"    ⏳ [{label}] 请求过密，等待 {waited:.1f} 秒后提交...")
+        self.pacing.add(waited, 0.0)
+
+    def _finish_pacing_report(self, results: Dict):
+        """把本次运行的节奏统计、提交统计写入结果"""
+        report = self.pacing.to_dict()
+        results["pacing"] = report
+        print(f"⏱️ 间隔等待: {report['waited_seconds']}s（固定间隔需 {report['fixed_interval_seconds']}s，"
+              f"节省 {report['saved_seconds']}s，模式: {report['mode']}）")
+
+        submissions = self.submissions.to_dict()
+        results["submissions"] = submissions
+        print(f"📮 可灵任务提交: 新提交 {submissions['submitted']} 次，接管已有任务 {submissions['reattached']} 次"
+              f"（避免重复提交），命中结果缓存 {submissions['cache_hits']} 次，远程任务失败 {submissions['remote_failures']} 次")
 
     def _retry_operation(self, operation: Callable, operation_name: str) -> Any:
         """
@@ -215,6 +291,18 @@ class KlingPipeline:
             on_retry=on_retry
         )
     
+    def _wait_for_video_task(self, task_id: str, max_wait_seconds: int = 600) -> dict:
+        """等待视频任务完成（默认交给进程级批量轮询器，不再每个任务各自轮询）"""
+        if config.KLING_BATCH_POLLING:
+            return task_poller.wait(self.kling_video, task_id, kind="video", max_wait_seconds=max_wait_seconds)
+        return self.kling_video.wait_for_video_task(task_id, max_wait_seconds=max_wait_seconds)
+
+    def _wait_for_image_task(self, task_id: str, max_wait_seconds: int = 300) -> dict:
+        """等待图片任务完成（同上）"""
+        if config.KLING_BATCH_POLLING:
+            return task_poller.wait(self.kling, task_id, kind="image", max_wait_seconds=max_wait_seconds)
+        return self.kling.wait_for_task(task_id, max_wait_seconds=max_wait_seconds)
+
     def setup_pet_directories(self, pet_id: str):
         """设置宠物输出目录"""
         self.pet_dir = self.output_dir / pet_id
@@ -227,7 +315,151 @@ class KlingPipeline:
         (self.videos_dir / "loops").mkdir(parents=True, exist_ok=True)
         (self.gifs_dir / "transitions").mkdir(parents=True, exist_ok=True)
         (self.gifs_dir / "loops").mkdir(parents=True, exist_ok=True)
-    
+        self.journal = PipelineJournal(self.pet_dir)
+
+    def _run_kling_task(self, output_path: str, api: str, request: dict, kind: str, label: str) -> str:
+        """
+        提交可灵任务 → 等待完成 → 下载到 output_path，提交和等待分开记录到断点日志
+
+        Args:
+            output_path: 结果保存路径
+            api: KlingAPI 方法名（image_to_image / image_to_video）
+            request: 调用参数（同时作为结果缓存的键）
+            kind: "image" 或 "video"
+            label: 日志标签
+
+        - 产物已在日志中且文件存在：直接返回，不调用API
+        - 结果缓存中有完全相同的请求：复制缓存结果，不调用API
+        - 已有提交过的任务（之前的重试或上次进程中断时遗留）：先查询远程状态，已成功直接下载，
+          仍在处理中则接管等待（重新占用并发槽位），不重新提交
+        - 等待超时、查询出错、下载失败：任务ID保留，外层重试时继续接管同一个任务
+        - 只有远程任务本身失败（KlingTaskFailedError）或查询不到（KlingTaskNotFoundError）才清除记录并重新提交
+        """
+        done = self.journal.completed_artifact(output_path)
+        if done:
+            print(f"    ⏭️ [{label}] 已生成，跳过: {done}")
+            if kind == "video":
+                self._schedule_gif(done)
+            return done
+
+        client = self.kling if kind == "image" else self.kling_video
+        cache_key = result_cache.make_key(api, request) if self.use_cache else None
+        if cache_key:
+            cached = result_cache.get(cache_key, output_path)
+            if cached is not None:
+                self.submissions.add("cache_hits")
+                print(f"    💾 [{label}] 命中结果缓存（原任务 {cached.get('task_id')}），跳过生成")
+                self.journal.mark_artifact(output_path, cached.get("task_id"))
+                if kind == "video":
+                    self._schedule_gif(output_path)
+                return output_path
+
+        task_id = self.journal.pending_task(output_path)
+        task_data = None
+        if task_id:
+            task_id, task_data = self._check_pending_task(client, output_path, task_id, kind, label)
+        if task_id is None:
+            self._pace_submit(client, label)
+            task_id = getattr(client, api)(**request)['task_id']
+            self.submissions.add("submitted")
+            print(f"    [{label}] 任务ID: {task_id}")
+            self.journal.record_task(output_path, task_id, kind)
+
+        if task_data is None:
+            try:
+                if kind == "image":
+                    task_data = self._wait_for_image_task(task_id)
+                else:
+                    task_data = self._wait_for_video_task(task_id)
+            except KlingTaskFailedError:
+                self.journal.clear_task(output_path)
+                self.submissions.add("remote_failures")
+                raise
+
+        if kind == "image":
+            self.kling.download_image(self._extract_image_url(task_data), output_path)
+        else:
+            self.kling_video.download_video(self._extract_video_url(task_data), output_path)
+
+        # 结果已下载（已付费）：之后的记录失败只打日志，不能抛出让外层重试重新生成
+        try:
+            self.journal.mark_artifact(output_path, task_id)
+        except Exception as e:
+            print(f"    ⚠️ [{label}] 已下载，写入断点日志失败（不影响结果）: {e}")
+        if kind == "video":
+            self._schedule_gif(output_path)
+        if cache_key:
+            request_info = {k: v for k, v in request.items() if k not in ("image_path", "tail_image_path")}
+            try:
+                result_cache.put(cache_key, output_path, {"task_id": task_id, "api": api, "request": request_info})
+            except Exception as e:
+                print(f"    ⚠️ [{label}] 写入结果缓存失败（不影响结果）: {e}")
+        return output_path
+
+    def _check_pending_task(self, client: KlingAPI, output_path: str, task_id: str, kind: str, label: str):
+        """
+        接管断点日志中的任务前先查询远程状态
+
+        Returns:
+            (task_id, task_data)：已成功时 task_data 为查询结果（直接下载，不占并发槽位）；
+            仍在处理中（或查询出错，无法确认）时 task_data 为 None，已重新占用槽位，调用方继续等待；
+            远程任务失败或不存在时清除记录，返回 (None, None)，调用方重新提交
+        """
+        try:
+            if kind == "image":
+                task_data = client.query_task(task_id)
+            else:
+                task_data = client.query_video_task(task_id)
+            status = extract_task_status(task_data)
+        except KlingTaskNotFoundError:
+            print(f"    ⚠️ [{label}] 已提交的任务在可灵侧不存在，重新提交: {task_id}")
+            self.journal.clear_task(output_path)
+            return None, None
+        except Exception as e:
+            print(f"    ⚠️ [{label}] 查询已提交任务的状态失败，继续等待: {e}")
+            task_data, status = None, None
+
+        if is_task_succeeded(status):
+            self.submissions.add("reattached")
+            print(f"    ♻️ [{label}] 已提交的任务已完成，直接下载（避免重复提交）: {task_id}")
+            return task_id, task_data
+        if is_task_failed(status):
+            print(f"    ⚠️ [{label}] 已提交的任务远程失败，重新提交: {task_id}")
+            self.journal.clear_task(output_path)
+            self.submissions.add("remote_failures")
+            return None, None
+
+        # 任务仍在可灵侧运行，重新占用并发槽位并绑定到任务ID（等待结束时由轮询器按ID释放）
+        lease = concurrency_governor.acquire(client.access_key, kind, label)
+        concurrency_governor.attach(lease, task_id)
+        self.submissions.add("reattached")
+        print(f"    ♻️ [{label}] 接管已提交的任务（避免重复提交）: {task_id}")
+        return task_id, None
+
+    def _gif_path_for(self, video_path: str) -> str:
+        """视频对应的 GIF 路径（videos/transitions/x.mp4 → gifs/transitions/x.gif）"""
+        video_path = Path(video_path)
+        return str(self.gifs_dir / video_path.parent.name / f"{video_path.stem}.gif")
+
+    def _rendition_path_for(self, video_path: str, fmt: str) -> str:
+        """视频对应的其他格式路径（videos/transitions/x.mp4 → webp/transitions/x.webp）"""
+        video_path = Path(video_path)
+        return str(rendition_path(self.pet_dir, fmt, video_path.parent.name, video_path.stem))
+
+    def _schedule_gif(self, video_path: str, batch: GifConversionBatch = None):
+        """
+        视频就绪后立即提交 GIF 及其他格式的转换（仅完整流程，分步接口不转换）
+        提交失败只打日志：视频本身已生成，不能因为转换排队失败而被当作生成失败重试
+        """
+        batch = batch or self.gif_batch
+        if batch is not None:
+            try:
+                batch.schedule(str(video_path), self._gif_path_for(video_path))
+                for fmt in self.rendition_formats:
+                    batch.schedule(str(video_path), self._rendition_path_for(video_path, fmt), fmt=fmt)
+            except Exception as e:
+                print(f"    ⚠️ 提交格式转换失败（视频已生成）: {video_path}: {e}")
+
     def step1_remove_background(self, uploaded_image: str, pet_id: str) -> str:
         """
         步骤1: 去除背景
@@ -382,9 +614,24 @@ class KlingPipeline:
         print(f"📁 输出目录: {self.pet_dir}")
         print(f"🔧 背景去除: {'启用' if remove_background_flag else '跳过'}")
         print(f"🔄 重试次数: {self.max_retries}, 重试间隔: {self.retry_delay}s")
-        print(f"⏳ 步骤间隔: {self.step_interval}s, API间隔: {self.api_interval}s")
+        print(f"⏳ 步骤间隔: {self.step_interval}s, API间隔: {self.api_interval}s, 间隔模式: {self.pacing_mode}")
         print("=" * 70)
 
+        self.journal.start("full", {
+            "uploaded_image": str(uploaded_image),
+            "breed": breed,
+            "color": color,
+            "species": species,
+            "remove_background_flag": remove_background_flag,
+            "weight": weight,
+            "gender": gender,
+            "birthday": birthday,
+            "video_model_name": self.video_model_name,
+            "video_model_mode": self.video_model_mode,
+            "use_cache": self.use_cache,
+        })
+        self.pacing = PacingReport(self.pacing_mode)
+        self.submissions = SubmissionReport()
         results = {
             "pet_id": pet_id,
             "breed": breed,
@@ -399,9 +646,13 @@ class KlingPipeline:
         self._update_status(5, "步骤1: 保存原图...", "step1")
         print("\n📤 步骤1: 保存原图")
         original_path = self.pet_dir / "original.jpg"
-        shutil.copy(uploaded_image, original_path)
+        if self.journal.step_done("step1") and original_path.exists():
+            print(f"⏭️ 原图已保存，跳过")
+        else:
+            shutil.copy(uploaded_image, original_path)
+            self.journal.mark_step("step1", str(original_path))
+            print(f"✅ 原图已保存: {original_path}")
         results["steps"]["original"] = str(original_path)
-        print(f"✅ 原图已保存: {original_path}")
 
         self._wait_interval(self.step_interval, "步骤1完成")
 
@@ -410,13 +661,17 @@ class KlingPipeline:
         print("\n🎨 步骤2: 去除背景（生成sit前）")
         transparent_path = self.pet_dir / "transparent.png"
 
-        if remove_background_flag:
+        if self.journal.step_done("step2") and transparent_path.exists():
+            print(f"⏭️ 背景已去除，跳过")
+        elif remove_background_flag:
             # 背景去除（不需要重试，Remove.bg API很稳定）
             remove_background(str(original_path), str(transparent_path))
+            self.journal.mark_step("step2", str(transparent_path))
             print(f"✅ 背景已去除: {transparent_path}")
         else:
             print(f"⚠️  跳过背景去除，直接使用原图")
             shutil.copy(str(original_path), transparent_path)
+            self.journal.mark_step("step2", str(transparent_path))
             print(f"✅ 已复制原图到: {transparent_path}")
 
         results["steps"]["transparent"] = str(transparent_path)
@@ -436,12 +691,15 @@ class KlingPipeline:
         print("\n🎨 步骤3.5: 去除sit图片的背景")
         sit_image_clean = str(self.images_dir / "sit_clean.png")
 
-        if remove_background_flag:
+        if self.journal.step_done("step3.5"):
+            print(f"⏭️ sit图片背景已去除，跳过")
+        elif remove_background_flag:
             # 背景去除（不需要重试，Remove.bg API很稳定）
             remove_background(sit_image_raw, sit_image_clean)
             print(f"✅ sit图片背景已去除: {sit_image_clean}")
             # 覆盖原sit.png
             shutil.copy(sit_image_clean, sit_image_raw)
+            self.journal.mark_step("step3.5", sit_image_raw)
             print(f"✅ 已更新sit.png为去背景版本")
         else:
             print(f"⚠️  跳过sit图片背景去除")
@@ -451,43 +709,16 @@ class KlingPipeline:
 
         self._wait_interval(self.step_interval, "步骤3.5完成")
 
-        # ==================== 步骤4: 生成前3个过渡视频 + 提取首尾帧 ====================
-        self._update_status(35, "步骤4: 生成初始过渡视频 + 提取首尾帧...", "step4")
-        print("\n🎬 步骤4: 生成前3个过渡视频 + 提取首尾帧")
-        print("  📌 视频: sit→walk, sit→rest, rest→sleep")
-        print("  📌 提取尾帧作为其他姿势基础图: walk.png, rest.png, sleep.png")
-        first_videos, other_poses, first_frames, last_frames = self._generate_first_transitions(sit_image)
-        results["steps"]["first_transitions"] = first_videos
-        results["steps"]["other_base_images"] = other_poses
-        results["steps"]["first_frames"] = first_frames
-        results["steps"]["last_frames"] = last_frames
-
-        self._update_status(50, "步骤4完成: 3个过渡视频 + 首尾帧已提取", "step4_done")
-        self._wait_interval(self.step_interval, "步骤4完成")
-
-        # ==================== 步骤5: 并发生成剩余过渡视频 ====================
-        self._update_status(55, "步骤5: 并发生成剩余过渡视频（并发数：3）...", "step5")
-        print("\n🎬 步骤5: 并发生成剩余过渡视频")
-        print("  📌 可灵API支持并发3，将同时生成多个视频以加速")
-        remaining_videos = self._generate_remaining_transitions()
-        results["steps"]["remaining_transitions"] = remaining_videos
-
-        self._wait_interval(self.step_interval, "步骤5完成")
-
-        # ==================== 步骤6: 并发生成循环视频 ====================
-        self._update_status(75, "步骤6: 并发生成循环视频（并发数：3）...", "step6")
-        print("\n🔄 步骤6: 并发生成循环视频")
-        print("  📌 4个循环视频将并发生成")
-        loop_videos = self._generate_loop_videos()
-        results["steps"]["loop_videos"] = loop_videos
-
-        self._wait_interval(self.step_interval, "步骤6完成")
+        # ==================== 步骤4-6: 生成16个视频 ====================
+        self._generate_all_videos(sit_image, results)
 
         # ==================== 步骤7: 转换为GIF ====================
         self._update_status(90, "步骤7: 转换视频为GIF...", "step7")
         print("\n🎞️  步骤7: 转换所有视频为GIF")
         gifs = self._convert_all_to_gif()
         results["steps"]["gifs"] = gifs
+        results["steps"]["renditions"] = self.renditions
+        results["steps"]["sprite_atlas"] = self.sprite_atlas
 
         self._wait_interval(self.step_interval, "步骤7完成")
 
@@ -497,11 +728,14 @@ class KlingPipeline:
         concatenated_video = self._concatenate_transition_videos()
         results["steps"]["concatenated_video"] = concatenated_video
 
+        self._finish_pacing_report(results)
+
         # 保存元数据
         metadata_path = self.pet_dir / "metadata.json"
         with open(metadata_path, 'w', encoding='utf-8') as f:
             json.dump(results, f, ensure_ascii=False, indent=2)
 
+        self.journal.finish("completed")
         self._update_status(100, "✅ 完整流程完成！", "completed")
         print("\n" + "=" * 70)
         print("✅ 完整流程完成！")
@@ -580,6 +814,8 @@ class KlingPipeline:
         print(f"📁 输出目录: {self.pet_dir}")
         print("=" * 70)
 
+        self.pacing = PacingReport(self.pacing_mode)
+        self.submissions = SubmissionReport()
         results = {
             "pet_id": pet_id,
             "breed": breed,
@@ -639,6 +875,8 @@ class KlingPipeline:
         sit_image = sit_image_raw
         results["steps"]["base_sit"] = sit_image
 
+        self._finish_pacing_report(results)
+
         self._update_status(30, "✅ 图片生成完成！", "image_done")
         print("\n" + "=" * 70)
         print("✅ 图片生成流程完成！")
@@ -686,6 +924,16 @@ class KlingPipeline:
         print(f"📷 使用坐姿图: {sit_image}")
         print("=" * 70)
 
+        self.journal.start("video_only", {
+            "sit_image": str(sit_image),
+            "breed": breed,
+            "color": color,
+            "species": species,
+            "video_model_name": self.video_model_name,
+            "video_model_mode": self.video_model_mode,
+        })
+        self.pacing = PacingReport(self.pacing_mode)
+        self.submissions = SubmissionReport()
         results = {
             "pet_id": pet_id,
             "breed": breed,
@@ -702,43 +950,16 @@ class KlingPipeline:
         results["steps"]["base_sit"] = local_sit_image
         print(f"📷 已复制坐姿图到: {local_sit_image}")
 
-        # ==================== 步骤4: 生成前3个过渡视频 + 提取首尾帧 ====================
-        self._update_status(35, "步骤4: 生成初始过渡视频 + 提取首尾帧...", "step4")
-        print("\n🎬 步骤4: 生成前3个过渡视频 + 提取首尾帧")
-        print("  📌 视频: sit→walk, sit→rest, rest→sleep")
-        print("  📌 提取尾帧作为其他姿势基础图: walk.png, rest.png, sleep.png")
-        first_videos, other_poses, first_frames, last_frames = self._generate_first_transitions(local_sit_image)
-        results["steps"]["first_transitions"] = first_videos
-        results["steps"]["other_base_images"] = other_poses
-        results["steps"]["first_frames"] = first_frames
-        results["steps"]["last_frames"] = last_frames
-
-        self._update_status(50, "步骤4完成: 3个过渡视频 + 首尾帧已提取", "step4_done")
-        self._wait_interval(self.step_interval, "步骤4完成")
-
-        # ==================== 步骤5: 并发生成剩余过渡视频 ====================
-        self._update_status(55, "步骤5: 并发生成剩余过渡视频（并发数：3）...", "step5")
-        print("\n🎬 步骤5: 并发生成剩余过渡视频")
-        print("  📌 可灵API支持并发3，将同时生成多个视频以加速")
-        remaining_videos = self._generate_remaining_transitions()
-        results["steps"]["remaining_transitions"] = remaining_videos
-
-        self._wait_interval(self.step_interval, "步骤5完成")
-
-        # ==================== 步骤6: 并发生成循环视频 ====================
-        self._update_status(75, "步骤6: 并发生成循环视频（并发数：3）...", "step6")
-        print("\n🔄 步骤6: 并发生成循环视频")
-        print("  📌 4个循环视频将并发生成")
-        loop_videos = self._generate_loop_videos()
-        results["steps"]["loop_videos"] = loop_videos
-
-        self._wait_interval(self.step_interval, "步骤6完成")
+        # ==================== 步骤4-6: 生成16个视频 ====================
+        self._generate_all_videos(local_sit_image, results)
 
         # ==================== 步骤7: 转换为GIF ====================
         self._update_status(90, "步骤7: 转换视频为GIF...", "step7")
         print("\n🎞️  步骤7: 转换所有视频为GIF")
         gifs = self._convert_all_to_gif()
         results["steps"]["gifs"] = gifs
+        results["steps"]["renditions"] = self.renditions
+        results["steps"]["sprite_atlas"] = self.sprite_atlas
 
         self._wait_interval(self.step_interval, "步骤7完成")
 
@@ -748,11 +969,14 @@ class KlingPipeline:
         concatenated_video = self._concatenate_transition_videos()
         results["steps"]["concatenated_video"] = concatenated_video
 
+        self._finish_pacing_report(results)
+
         # 保存元数据
         metadata_path = self.pet_dir / "metadata.json"
         with open(metadata_path, 'w', encoding='utf-8') as f:
             json.dump(results, f, ensure_ascii=False, indent=2)
 
+        self.journal.finish("completed")
         self._update_status(100, "✅ 视频生成完成！", "completed")
         print("\n" + "=" * 70)
         print("✅ 视频生成流程完成！")
@@ -777,29 +1001,20 @@ class KlingPipeline:
 
         def do_generate():
             # 使用图生图API
-            result = self.kling.image_to_image(
-                image_path=transparent_image,
-                prompt=prompt,
-                negative_prompt=negative_prompt,
-                aspect_ratio="1:1",
-                image_count=1
+            return self._run_kling_task(
+                str(self.images_dir / f"{pose}.png"),
+                "image_to_image",
+                dict(
+                    image_path=transparent_image,
+                    prompt=prompt,
+                    negative_prompt=negative_prompt,
+                    aspect_ratio="1:1",
+                    image_count=1
+                ),
+                kind="image",
+                label=f"{pose}.png",
             )
 
-            task_id = result['task_id']
-            print(f"  任务ID: {task_id}")
-
-            # 等待完成
-            task_data = self.kling.wait_for_task(task_id, max_wait_seconds=300)
-
-            # 提取图片URL
-            image_url = self._extract_image_url(task_data)
-
-            # 下载图片
-            output_path = str(self.images_dir / f"{pose}.png")
-            self.kling.download_image(image_url, output_path)
-
-            return output_path
-
         # 带重试执行
         output_path = self._retry_operation(do_generate, f"生成{pose}图片")
 
@@ -810,6 +1025,186 @@ class KlingPipeline:
 
         return output_path
 
+    def _generate_all_videos(self, sit_image: str, results: Dict):
+        """步骤4-6: 生成12个过渡视频 + 4个循环视频，结果写入 results["steps"]（每个视频就绪即开始转换GIF）"""
+        self.gif_batch = GifConversionBatch()
+        if config.KLING_DAG_SCHEDULING:
+            self._generate_videos_by_graph(sit_image, results)
+        else:
+            self._generate_videos_by_phase(sit_image, results)
+
+    def _generate_videos_by_phase(self, sit_image: str, results: Dict):
+        """分阶段生成：步骤4（前3个过渡）→ 步骤5（剩余过渡）→ 步骤6（循环视频），每阶段全部完成才进入下一阶段"""
+        # ==================== 步骤4: 生成前3个过渡视频 + 提取首尾帧 ====================
+        self._update_status(35, "步骤4: 生成初始过渡视频 + 提取首尾帧...", "step4")
+        print("\n🎬 步骤4: 生成前3个过渡视频 + 提取首尾帧")
+        print("  📌 视频: sit→walk, sit→rest, rest→sleep")
+        print("  📌 提取尾帧作为其他姿势基础图: walk.png, rest.png, sleep.png")
+        first_videos, other_poses, first_frames, last_frames = self._generate_first_transitions(sit_image)
+        results["steps"]["first_transitions"] = first_videos
+        results["steps"]["other_base_images"] = other_poses
+        results["steps"]["first_frames"] = first_frames
+        results["steps"]["last_frames"] = last_frames
+
+        self._update_status(50, "步骤4完成: 3个过渡视频 + 首尾帧已提取", "step4_done")
+        self._wait_interval(self.step_interval, "步骤4完成")
+
+        # ==================== 步骤5: 并发生成剩余过渡视频 ====================
+        self._update_status(55, "步骤5: 并发生成剩余过渡视频（自适应并发）...", "step5")
+        print("\n🎬 步骤5: 并发生成剩余过渡视频")
+        print("  📌 可灵API支持并发3，将同时生成多个视频以加速")
+        remaining_videos = self._generate_remaining_transitions()
+        results["steps"]["remaining_transitions"] = remaining_videos
+
+        self._wait_interval(self.step_interval, "步骤5完成")
+
+        # ==================== 步骤6: 并发生成循环视频 ====================
+        self._update_status(75, "步骤6: 并发生成循环视频（自适应并发）...", "step6")
+        print("\n🔄 步骤6: 并发生成循环视频")
+        print("  📌 4个循环视频将并发生成")
+        loop_videos = self._generate_loop_videos()
+        results["steps"]["loop_videos"] = loop_videos
+        if self.reverse_report:
+            results["steps"]["reversed_transitions"] = self.reverse_report
+
+        self._wait_interval(self.step_interval, "步骤6完成")
+
+    def _generate_videos_by_graph(self, sit_image: str, results: Dict):
+        """
+        按依赖图生成16个视频
+
+        每个视频只依赖起始姿势图片：sit 相关的视频立即开始，sit2walk / sit2rest / rest2sleep
+        完成并提取尾帧后，对应姿势的视频马上加入队列，不再等整个阶段结束。
+        关键路径 sit2rest → rest2sleep → sleep2* 优先派发，总耗时约为 3 个视频串行生成的时间。
+        """
+        self._update_status(35, "步骤4-6: 按依赖图并发生成16个视频（自适应并发）...", "step4")
+        reverse_sources = REVERSE_TRANSITIONS if self.local_reverse else None
+        tasks = build_video_task_graph(get_all_transitions(), POSES, FIRST_TRANSITIONS, reverse_sources)
+        print(f"\n🎬 步骤4-6: 按依赖图生成 {len(tasks)} 个视频")
+        if reverse_sources:
+            print(f"  📌 本地倒放: {sum(1 for t in tasks.values() if t.kind == 'reverse')} 个反向过渡")
+        print(f"  📌 关键路径: {' → '.join(critical_path(tasks))}")
+
+        first_videos = {}
+        other_poses = {}
+        first_frames = {}
+        last_frames = {}
+        remaining_videos = {}
+        loop_videos = {}
+        access_key = self.kling_video.access_key
+
+        def run_task(task: VideoTask) -> str:
+            start_image = sit_image if task.start_pose == "sit" else other_poses[task.start_pose]
+            if task.kind == "loop":
+                return self._generate_loop_video_no_wait(task.name, start_image)
+            if task.kind == "reverse":
+                # 质量不合格时返回 None，调度器把任务改为远程生成重新排队（占用可灵并发名额）
+                return self._derive_reverse_transition(task.name, task.source)
+            return self._generate_transition_video_no_wait(task.name, start_image)
+
+        def on_success(task: VideoTask, video_path: str):
+            if task.kind == "loop":
+                loop_videos[task.name] = video_path
+                return
+            if task.name not in FIRST_TRANSITIONS:
+                remaining_videos[task.name] = video_path
+                return
+            # 首批过渡：提取首尾帧，尾帧作为下一个姿势的基础图（抛异常会按失败重试）
+            first_frame, end_image, last_frame = self._extract_transition_frames(task.name, video_path)
+            first_videos[task.name] = video_path
+            first_frames[task.name] = first_frame
+            last_frames[task.name] = last_frame
+            other_poses[task.produces] = end_image
+            print(f"  ✅ {task.produces}.png 已提取，解锁 {task.produces} 相关视频")
+
+        def on_progress(done: int, total: int, task: VideoTask, success: bool):
+            label = f"{task.name}_loop" if task.kind == "loop" else task.name
+            mark = "✅" if success else "❌"
+            self._update_status(35 + int(done / total * 53), f"依赖图生成中 ({done}/{total}): {label} {mark}")
+
+        scheduler = VideoTaskScheduler(
+            tasks,
+            run_task=run_task,
+            max_concurrent=lambda: concurrency_governor.get_limit(access_key, "video"),
+            on_success=on_success,
+            on_progress=on_progress,
+        )
+        _, failed = scheduler.run()
+        if failed:
+            print(f"\n  ⚠️ 警告: {len(failed)} 个视频生成失败: {list(failed)}")
+
+        results["steps"]["first_transitions"] = first_videos
+        results["steps"]["other_base_images"] = other_poses
+        results["steps"]["first_frames"] = first_frames
+        results["steps"]["last_frames"] = last_frames
+        results["steps"]["remaining_transitions"] = remaining_videos
+        results["steps"]["loop_videos"] = loop_videos
+        if self.reverse_report:
+            results["steps"]["reversed_transitions"] = self.reverse_report
+
+        self._wait_interval(self.step_interval, "步骤4-6完成")
+
+    def _extract_transition_frames(self, transition: str, video_path: str) -> tuple:
+        """
+        提取过渡视频的首尾帧
+
+        Returns:
+            (首帧路径, 结束姿势基础图路径, 尾帧路径)
+        """
+        end_pose = transition.split("2")[1]
+        first_frame_path = str(self.images_dir / f"{transition}_first_frame.png")
+        end_image_path = str(self.images_dir / f"{end_pose}.png")
+        last_frame_path = str(self.images_dir / f"{transition}_last_frame.png")
+        # 一次解码同时写出首帧和尾帧（尾帧同时作为结束姿势的基础图）
+        extract_frames(video_path, outputs={0: first_frame_path, -1: [end_image_path, last_frame_path]})
+        return first_frame_path, end_image_path, last_frame_path
+
+    def _derive_reverse_transition(self, transition: str, source: str) -> Optional[str]:
+        """
+        由源过渡倒放得到反向过渡（如 sit2walk → walk2sit），不调用可灵API
+
+        倒放结果的首尾帧需与两端姿势图足够接近且没有突变帧，否则返回 None，由调用方改为远程生成。
+
+        Returns:
+            视频路径，质量检查不通过时返回 None
+        """
+        output_path = str(self.videos_dir / "transitions" / f"{transition}.mp4")
+        done = self.journal.completed_artifact(output_path) if self.journal else None
+        if done:
+            print(f"    [{transition}] ♻️ 已倒放（断点日志），跳过")
+            self._schedule_gif(done)
+            return done
+
+        source_path = self.videos_dir / "transitions" / f"{source}.mp4"
+        start_pose, end_pose = transition.split("2")
+        start_image = self.images_dir / f"{start_pose}.png"
+        end_image = self.images_dir / f"{end_pose}.png"
+        if not (source_path.exists() and start_image.exists() and end_image.exists()):
+            self.reverse_report[transition] = {"source": source, "passed": False, "reason": "源视频或姿势图不存在"}
+            return None
+
+        tmp_path = f"{output_path[:-4]}.reversed.mp4"
+        try:
+            reverse_video(str(source_path), tmp_path)
+            quality = reversal_quality(tmp_path, str(start_image), str(end_image),
+                                       max_endpoint_diff=config.KLING_REVERSE_MAX_DIFF)
+        except Exception as e:
+            quality = {"passed": False, "reason": f"倒放失败: {e}"}
+        self.reverse_report[transition] = dict(quality, source=source)
+
+        if not quality["passed"]:
+            print(f"    [{transition}] ⚠️ 倒放 {source} 质量不合格（{quality['reason']}），改为远程生成")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return None
+
+        os.replace(tmp_path, output_path)
+        if self.journal:
+            self.journal.mark_artifact(output_path)
+        self._schedule_gif(output_path)
+        print(f"    [{transition}] 🔁 由 {source} 倒放生成（首帧差异 {quality['start_diff']}，尾帧差异 {quality['end_diff']}）")
+        return output_path
+
     def _generate_first_transitions(self, sit_image: str) -> tuple:
         """
         生成前3个过渡视频并提取首尾帧（优化版：部分并发）
@@ -854,7 +1249,7 @@ class KlingPipeline:
         parallel_results = {}
         failed_transitions = []
         
-        with ThreadPoolExecutor(max_workers=2) as executor:
+        with ThreadPoolExecutor(max_workers=len(parallel_transitions)) as executor:
             future_to_task = {
                 executor.submit(generate_with_retry, t, sit_image, max_retries): t
                 for t in parallel_transitions
@@ -871,17 +1266,9 @@ class KlingPipeline:
                         
                         # 提取首尾帧
                         end_pose = transition.split("2")[1]
-                        
-                        # 提取首帧
-                        first_frame_path = str(self.images_dir / f"{transition}_first_frame.png")
-                        extract_first_frame(video_path, first_frame_path)
+                        first_frame_path, end_image_path, last_frame_path = \
+                            self._extract_transition_frames(transition, video_path)
                         first_frames[transition] = first_frame_path
-                        
-                        # 提取尾帧
-                        end_image_path = str(self.images_dir / f"{end_pose}.png")
-                        last_frame_path = str(self.images_dir / f"{transition}_last_frame.png")
-                        extract_last_frame(video_path, end_image_path)
-                        extract_last_frame(video_path, last_frame_path)
                         other_poses[end_pose] = end_image_path
                         last_frames[transition] = last_frame_path
                         print(f"  ✅ {end_pose}.png 已提取")
@@ -911,14 +1298,9 @@ class KlingPipeline:
             videos["rest2sleep"] = video_path
             
             # 提取首尾帧
-            first_frame_path = str(self.images_dir / "rest2sleep_first_frame.png")
-            extract_first_frame(video_path, first_frame_path)
+            first_frame_path, end_image_path, last_frame_path = \
+                self._extract_transition_frames("rest2sleep", video_path)
             first_frames["rest2sleep"] = first_frame_path
-            
-            end_image_path = str(self.images_dir / "sleep.png")
-            last_frame_path = str(self.images_dir / "rest2sleep_last_frame.png")
-            extract_last_frame(video_path, end_image_path)
-            extract_last_frame(video_path, last_frame_path)
             other_poses["sleep"] = end_image_path
             last_frames["rest2sleep"] = last_frame_path
             print(f"  ✅ sleep.png 已提取")
@@ -966,18 +1348,11 @@ class KlingPipeline:
             end_pose = transition.split("2")[1]
             self._update_status(frame_progress, f"提取首尾帧 ({idx+1}/{total}): {transition} → {end_pose}.png")
 
-            # 提取首帧
-            start_pose = transition.split("2")[0]
-            first_frame_path = str(self.images_dir / f"{transition}_first_frame.png")
-            extract_first_frame(video_path, first_frame_path)
+            # 提取首尾帧（一次解码）
+            first_frame_path, end_image_path, last_frame_path = \
+                self._extract_transition_frames(transition, video_path)
             first_frames[transition] = first_frame_path
             print(f"  ✅ {transition}_first_frame.png 已提取")
-
-            # 提取尾帧
-            end_image_path = str(self.images_dir / f"{end_pose}.png")
-            last_frame_path = str(self.images_dir / f"{transition}_last_frame.png")
-            extract_last_frame(video_path, end_image_path)
-            extract_last_frame(video_path, last_frame_path)
             other_poses[end_pose] = end_image_path
             last_frames[transition] = last_frame_path
             print(f"  ✅ {end_pose}.png 已提取（作为后续视频的起始图）")
@@ -1010,31 +1385,22 @@ class KlingPipeline:
 
         def do_generate():
             # 调用可灵AI图生视频（使用视频专用 API）
-            result = self.kling_video.image_to_video(
-                image_path=start_image,
-                prompt=prompt,
-                negative_prompt=negative_prompt,
-                duration=5,
-                aspect_ratio="16:9",
-                model_name=self.video_model_name,
-                mode=self.video_model_mode
+            return self._run_kling_task(
+                str(self.videos_dir / "transitions" / f"{transition}.mp4"),
+                "image_to_video",
+                dict(
+                    image_path=start_image,
+                    prompt=prompt,
+                    negative_prompt=negative_prompt,
+                    duration=5,
+                    aspect_ratio="16:9",
+                    model_name=self.video_model_name,
+                    mode=self.video_model_mode
+                ),
+                kind="video",
+                label=transition,
             )
 
-            task_id = result['task_id']
-            print(f"    任务ID: {task_id}")
-
-            # 等待完成
-            task_data = self.kling_video.wait_for_video_task(task_id, max_wait_seconds=600)
-
-            # 提取视频URL
-            video_url = self._extract_video_url(task_data)
-
-            # 下载视频
-            output_path = str(self.videos_dir / "transitions" / f"{transition}.mp4")
-            self.kling_video.download_video(video_url, output_path)
-
-            return output_path
-
         # 带重试执行
         output_path = self._retry_operation(do_generate, f"生成过渡视频 {transition}")
 
@@ -1049,7 +1415,7 @@ class KlingPipeline:
         self,
         tasks: List[Dict],
         task_type: str,
-        max_concurrent: int = 3,
+        max_concurrent: int = None,
         base_progress: int = 50,
         progress_range: int = 20,
         max_retries: int = 3,
@@ -1064,7 +1430,8 @@ class KlingPipeline:
                 - transition: 过渡名称 (如 "walk2sit") 或 pose: 姿势名称 (如 "sit")
                 - start_image: 起始图片路径
             task_type: 任务类型 ("transition" 或 "loop")
-            max_concurrent: 最大并发数（默认3，可灵API限制）
+            max_concurrent: 工作线程数（默认每个任务一个线程，上限 KLING_CONCURRENCY_MAX；
+                            实际提交并发由进程级 concurrency_governor 按限流情况自适应控制）
             base_progress: 基础进度百分比
             progress_range: 进度范围
             max_retries: 单个任务最大重试次数（默认3）
@@ -1081,8 +1448,11 @@ class KlingPipeline:
         
         if total == 0:
             return results
+        max_concurrent = max_concurrent or min(total, config.KLING_CONCURRENCY_MAX)
+        access_key = self.kling_video.access_key
             
-        print(f"\n🚀 并发任务启动: {total} 个任务，最大并发数 {max_concurrent}")
+        print(f"\n🚀 并发任务启动: {total} 个任务，工作线程 {max_concurrent}，"
+              f"当前可灵视频并发上限 {concurrency_governor.get_limit(access_key, 'video')}")
         print(f"  🔄 重试配置: 最多 {max_retries} 次，间隔 {retry_delay} 秒")
         
         def generate_single_task(task_info, attempt=1):
@@ -1118,12 +1488,12 @@ class KlingPipeline:
                     print(f"  ⚠️ {name}_loop 第{attempt}次尝试失败: {error_msg[:50]}...")
                     return (name, None, error_msg, task_info)
         
-        def run_batch(batch_tasks, attempt=1):
+        def run_batch(batch_tasks, attempt=1, workers=max_concurrent):
             """执行一批任务"""
             batch_results = {}
             batch_failed = []
             
-            with ThreadPoolExecutor(max_workers=max_concurrent) as executor:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
                 future_to_task = {
                     executor.submit(generate_single_task, task, attempt): task 
                     for task in batch_tasks
@@ -1156,11 +1526,11 @@ class KlingPipeline:
             print(f"  ⏳ 等待 {retry_delay} 秒后重试...")
             time.sleep(retry_delay)
             
-            # 重试时降低并发数，减少压力
-            retry_concurrent = max(1, max_concurrent - 1)
+            # 重试时降低并发数，减少压力（以自适应后的上限为准，被限流过会更低）
+            retry_concurrent = max(1, min(max_concurrent, concurrency_governor.get_limit(access_key, "video")) - 1)
             print(f"  📦 重试并发数: {retry_concurrent}")
             
-            retry_results, still_failed = run_batch(failed_tasks, attempt=current_attempt)
+            retry_results, still_failed = run_batch(failed_tasks, attempt=current_attempt, workers=retry_concurrent)
             results.update(retry_results)
             failed_tasks = still_failed
             current_attempt += 1
@@ -1201,27 +1571,22 @@ class KlingPipeline:
         print(f"    [{transition}] 负向: {negative_prompt[:40]}...")
 
         def do_generate():
-            result = self.kling_video.image_to_video(
-                image_path=start_image,
-                prompt=prompt,
-                negative_prompt=negative_prompt,
-                duration=5,
-                aspect_ratio="16:9",
-                model_name=self.video_model_name,
-                mode=self.video_model_mode
+            return self._run_kling_task(
+                str(self.videos_dir / "transitions" / f"{transition}.mp4"),
+                "image_to_video",
+                dict(
+                    image_path=start_image,
+                    prompt=prompt,
+                    negative_prompt=negative_prompt,
+                    duration=5,
+                    aspect_ratio="16:9",
+                    model_name=self.video_model_name,
+                    mode=self.video_model_mode
+                ),
+                kind="video",
+                label=transition,
             )
 
-            task_id = result['task_id']
-            print(f"    [{transition}] 任务ID: {task_id}")
-
-            task_data = self.kling_video.wait_for_video_task(task_id, max_wait_seconds=600)
-            video_url = self._extract_video_url(task_data)
-
-            output_path = str(self.videos_dir / "transitions" / f"{transition}.mp4")
-            self.kling_video.download_video(video_url, output_path)
-
-            return output_path
-
         return self._retry_operation(do_generate, f"生成过渡视频 {transition}")
 
     def _generate_loop_video_no_wait(self, pose: str, pose_image: str) -> str:
@@ -1245,36 +1610,36 @@ class KlingPipeline:
         print(f"    [{pose}_loop] 负向: {negative_prompt[:40]}...")
 
         def do_generate():
-            result = self.kling_video.image_to_video(
-                image_path=pose_image,
-                prompt=prompt,
-                negative_prompt=negative_prompt,
-                duration=5,
-                aspect_ratio="16:9",
-                model_name=self.video_model_name,
-                mode=self.video_model_mode
+            return self._run_kling_task(
+                str(self.videos_dir / "loops" / f"{pose}_loop.mp4"),
+                "image_to_video",
+                dict(
+                    image_path=pose_image,
+                    prompt=prompt,
+                    negative_prompt=negative_prompt,
+                    duration=5,
+                    aspect_ratio="16:9",
+                    model_name=self.video_model_name,
+                    mode=self.video_model_mode
+                ),
+                kind="video",
+                label=f"{pose}_loop",
             )
 
-            task_id = result['task_id']
-            print(f"    [{pose}_loop] 任务ID: {task_id}")
-
-            task_data = self.kling_video.wait_for_video_task(task_id, max_wait_seconds=600)
-            video_url = self._extract_video_url(task_data)
-
-            output_path = str(self.videos_dir / "loops" / f"{pose}_loop.mp4")
-            self.kling_video.download_video(video_url, output_path)
-
-            return output_path
-
         return self._retry_operation(do_generate, f"生成循环视频 {pose}_loop")
 
     def _generate_remaining_transitions(self) -> Dict:
-        """生成剩余9个过渡视频（并发版本，最多3个并发）"""
+        """生成剩余9个过渡视频（并发版本，并发数由 concurrency_governor 自适应控制）"""
         all_transitions = get_all_transitions()
         remaining = [t for t in all_transitions if t not in FIRST_TRANSITIONS]
+        # 本地倒放模式：先远程生成源方向，反方向在源完成后倒放
+        derived = {}
+        if self.local_reverse:
+            derived = {t: s for t, s in REVERSE_TRANSITIONS.items() if t in remaining and s in all_transitions}
+            remaining = [t for t in remaining if t not in derived]
 
         total = len(remaining)
-        print(f"\n📦 并发生成剩余 {total} 个过渡视频（并发数：3）")
+        print(f"\n📦 并发生成剩余 {total} 个过渡视频（自适应并发）")
 
         # 准备任务列表
         tasks = []
@@ -1295,11 +1660,37 @@ class KlingPipeline:
         videos = self._run_video_tasks_concurrent(
             tasks=tasks,
             task_type="transition",
-            max_concurrent=3,
             base_progress=55,
             progress_range=17
         )
 
+        if derived:
+            videos.update(self._derive_reverse_transitions(derived))
+
+        return videos
+
+    def _derive_reverse_transitions(self, derived: Dict[str, str]) -> Dict:
+        """分阶段模式：倒放得到反向过渡，质量不合格或源视频缺失的改为远程生成"""
+        print(f"\n🔁 本地倒放 {len(derived)} 个反向过渡")
+        videos = {}
+        fallback = []
+        for transition, source in derived.items():
+            video_path = self._derive_reverse_transition(transition, source)
+            if video_path:
+                videos[transition] = video_path
+                continue
+            start_image = str(self.images_dir / f"{transition.split('2')[0]}.png")
+            if os.path.exists(start_image):
+                fallback.append({"transition": transition, "start_image": start_image})
+
+        if fallback:
+            print(f"  ⚠️ {len(fallback)} 个反向过渡改为远程生成")
+            videos.update(self._run_video_tasks_concurrent(
+                tasks=fallback,
+                task_type="transition",
+                base_progress=72,
+                progress_range=3
+            ))
         return videos
 
     def _generate_remaining_transitions_sequential(self) -> Dict:
@@ -1331,8 +1722,8 @@ class KlingPipeline:
         return videos
 
     def _generate_loop_videos(self) -> Dict:
-        """生成4个循环视频（并发版本，最多3个并发）"""
-        print(f"\n📦 并发生成 {len(POSES)} 个循环视频（并发数：3）")
+        """生成4个循环视频（并发版本，并发数由 concurrency_governor 自适应控制）"""
+        print(f"\n📦 并发生成 {len(POSES)} 个循环视频（自适应并发）")
 
         # 准备任务列表
         tasks = []
@@ -1351,7 +1742,6 @@ class KlingPipeline:
         videos = self._run_video_tasks_concurrent(
             tasks=tasks,
             task_type="loop",
-            max_concurrent=3,
             base_progress=75,
             progress_range=13
         )
@@ -1399,31 +1789,22 @@ class KlingPipeline:
 
             def do_generate(p=pose, pi=pose_image, pr=prompt, neg=negative_prompt):
                 # 调用可灵AI图生视频（使用视频专用 API）
-                result = self.kling_video.image_to_video(
-                    image_path=pi,
-                    prompt=pr,
-                    negative_prompt=neg,
-                    duration=5,
-                    aspect_ratio="16:9",
-                    model_name=self.video_model_name,
-                    mode=self.video_model_mode
+                return self._run_kling_task(
+                    str(self.videos_dir / "loops" / f"{p}.mp4"),
+                    "image_to_video",
+                    dict(
+                        image_path=pi,
+                        prompt=pr,
+                        negative_prompt=neg,
+                        duration=5,
+                        aspect_ratio="16:9",
+                        model_name=self.video_model_name,
+                        mode=self.video_model_mode
+                    ),
+                    kind="video",
+                    label=f"{p}_loop",
                 )
 
-                task_id = result['task_id']
-                print(f"    任务ID: {task_id}")
-
-                # 等待完成
-                task_data = self.kling_video.wait_for_video_task(task_id, max_wait_seconds=600)
-
-                # 提取视频URL
-                video_url = self._extract_video_url(task_data)
-
-                # 下载视频
-                output_path = str(self.videos_dir / "loops" / f"{p}.mp4")
-                self.kling_video.download_video(video_url, output_path)
-
-                return output_path
-
             # 带重试执行
             try:
                 output_path = self._retry_operation(
@@ -1442,27 +1823,69 @@ class KlingPipeline:
         return videos
 
     def _convert_all_to_gif(self) -> Dict:
-        """转换所有视频为GIF"""
-        gifs = {"transitions": {}, "loops": {}}
+        """
+        转换所有视频为GIF（进程池并行）
 
-        # 转换过渡视频
-        transitions_dir = self.videos_dir / "transitions"
-        if transitions_dir.exists():
-            for video_file in transitions_dir.glob("*.mp4"):
-                gif_path = str(self.gifs_dir / "transitions" / f"{video_file.stem}.gif")
-                convert_mp4_to_gif(str(video_file), gif_path, fps_reduction=2, max_width=480)
-                gifs["transitions"][video_file.stem] = gif_path
-
-        # 转换循环视频
-        loops_dir = self.videos_dir / "loops"
-        if loops_dir.exists():
-            for video_file in loops_dir.glob("*.mp4"):
-                gif_path = str(self.gifs_dir / "loops" / f"{video_file.stem}.gif")
-                convert_mp4_to_gif(str(video_file), gif_path, fps_reduction=2, max_width=480)
-                gifs["loops"][video_file.stem] = gif_path
+        生成阶段每个视频下载完成时已提交转换，这里补交遗漏的视频（如之前就存在的文件），然后等待全部完成。
+        其他格式（WebP 等）一并转换，结果保存在 self.renditions
+        """
+        gifs = {"transitions": {}, "loops": {}}
+        batch = self.gif_batch or GifConversionBatch()
+        self.gif_batch = None
+
+        videos = []
+        for category in ("transitions", "loops"):
+            video_dir = self.videos_dir / category
+            if video_dir.exists():
+                videos += [(category, video_file) for video_file in sorted(video_dir.glob("*.mp4"))]
+        for _, video_file in videos:
+            self._schedule_gif(video_file, batch)
+
+        start_time = time.time()
+        errors = batch.wait(
+            on_progress=lambda done, total: self._update_status(90 + int(done / total * 4), f"GIF转换 ({done}/{total})")
+        )
+        for category, video_file in videos:
+            gif_path = self._gif_path_for(video_file)
+            if errors.get(gif_path) is None:
+                gifs[category][video_file.stem] = gif_path
+        self.renditions = {fmt: {"transitions": {}, "loops": {}} for fmt in self.rendition_formats}
+        for fmt, outputs in self.renditions.items():
+            for category, video_file in videos:
+                output_path = self._rendition_path_for(video_file, fmt)
+                if errors.get(output_path) is None:
+                    outputs[category][video_file.stem] = output_path
+        print(f"  ✅ GIF 转换完成: {sum(len(v) for v in gifs.values())}/{len(videos)}，"
+              f"步骤7等待 {time.time() - start_time:.1f}秒")
+        for fmt, outputs in self.renditions.items():
+            print(f"  ✅ {fmt.upper()} 转换完成: {sum(len(v) for v in outputs.values())}/{len(videos)}")
+
+        self.sprite_atlas = self._build_sprite_atlas(videos) if config.SPRITE_ATLAS_ENABLED else None
 
         return gifs
 
+    def _build_sprite_atlas(self, videos: list) -> Optional[str]:
+        """把所有过渡/循环视频的抽样帧打包成精灵图集（sprites/），返回清单路径，失败不影响流程"""
+        if not videos:
+            return None
+        start_time = time.time()
+        try:
+            manifest = build_sprite_atlases(
+                [(category, video_file.stem, str(video_file)) for category, video_file in videos],
+                str(self.pet_dir / "sprites"),
+                frame_step=config.SPRITE_FRAME_STEP,
+                max_frame_width=config.SPRITE_FRAME_WIDTH,
+                max_atlas_size=config.SPRITE_ATLAS_MAX_SIZE,
+                fmt=config.SPRITE_ATLAS_FORMAT,
+                quality=config.RENDITION_QUALITY,
+            )
+        except Exception as e:
+            print(f"  ⚠️  精灵图集生成失败: {e}")
+            traceback.print_exc()
+            return None
+        print(f"  ✅ 精灵图集完成: {len(manifest['atlases'])} 张图集，耗时 {time.time() - start_time:.1f}秒")
+        return manifest["manifest_path"]
+
     def _concatenate_transition_videos(self) -> str:
         """拼接所有过渡视频为一个长视频"""
         try:
@@ -1479,6 +1902,8 @@ class KlingPipeline:
                 print("  ⚠️  没有找到过渡视频，跳过拼接")
                 return None
 
+            video_files = self._exclude_unmatched_reversals(video_files)
+
             # 智能排序：尝试形成连贯的动作序列
             ordered_videos = self._sort_videos_by_transition(video_files)
 
@@ -1508,6 +1933,27 @@ class KlingPipeline:
             traceback.print_exc()
             return None
     
+    def _exclude_unmatched_reversals(self, video_files: list) -> list:
+        """
+        去掉编码与可灵视频不同的本地倒放过渡
+
+        本地倒放用 OpenCV 写出（mp4v、无音轨），可灵视频是 H.264 + AAC，混在一起无法直接拼接容器，
+        会导致全部视频解码重编码。倒放视频与源过渡画面相同，长视频中不包含它们。
+        """
+        codecs = {}
+        for video in video_files:
+            try:
+                codecs[video] = video_probe.probe(str(video))["codec"]
+            except Exception:
+                codecs[video] = None
+        reference = {codecs[v] for v in video_files if v.stem not in REVERSE_TRANSITIONS}
+        if not reference:
+            return video_files
+        excluded = [v for v in video_files if v.stem in REVERSE_TRANSITIONS and codecs[v] not in reference]
+        if excluded:
+            print(f"  ⏭️  本地倒放的过渡编码与可灵视频不同，不参与拼接: {[v.stem for v in excluded]}")
+        return [v for v in video_files if v not in excluded]
+
     def _sort_videos_by_transition(self, video_files: list) -> list:
         """
         根据过渡关系智能排序视频，形成连贯的动作序列
@@ -1556,7 +2002,7 @@ class KlingPipeline:
         temp_graph = {k: v[:] for k, v in graph.items()}
         
         def dfs(u):
-            while temp_graph[u]:
+            while temp_graph.get(u):  # 没有出边的姿势（如倒放过渡被排除后的 sleep）
                 v, filename = temp_graph[u].pop(0)
                 dfs(v)
                 path.append(filename)
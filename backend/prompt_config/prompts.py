@@ -11,6 +11,17 @@ FIRST_TRANSITIONS = ["sit2walk", "sit2rest", "rest2sleep"]
 # 所有姿势
 POSES = ["sit", "walk", "rest", "sleep"]
 
+# 可由反方向视频倒放得到的过渡（本地倒放模式）：{倒放得到的过渡: 远程生成的源过渡}
+# 每对姿势只远程生成一个方向；源为首批过渡时，倒放后的首尾帧与姿势图完全一致
+REVERSE_TRANSITIONS = {
+    "walk2sit": "sit2walk",
+    "rest2sit": "sit2rest",
+    "sleep2rest": "rest2sleep",
+    "sleep2sit": "sit2sleep",
+    "rest2walk": "walk2rest",
+    "sleep2walk": "walk2sleep",
+}
+
 
 
 def get_all_transitions() -> list:
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+GIF 调色板对比：原 PIL save_all(optimize=True) vs 流式逐帧调色板 vs NumPy 全局调色板（可选有序抖动）
+
+输出每种方式的编码耗时、文件大小、与原视频帧的平均误差，以及静止区域的帧间颜色跳动（闪烁）。
+同时校验解码结果：帧数与原视频跳帧后一致、每一帧与原视频帧的误差不超过 MAX_FRAME_ERROR
+（图像描述符写错时，如丢失隔行标志，解码出的画面行序错乱，误差远大于量化误差），校验失败时退出码为 1。
+
+用法:
+    python scripts/video/benchmark_gif_palette.py [视频路径]
+不传视频路径时生成一个带渐变背景和移动主体的测试视频
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+from PIL import Image, ImageSequence
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from utils.video_utils import convert_mp4_to_gif  # noqa: E402
+
+FPS_REDUCTION = 2
+MAX_WIDTH = 480
+# 单帧与原视频帧的最大允许平均误差（量化/抖动误差在 10 以内，画面错乱时为 20 以上）
+MAX_FRAME_ERROR = 15
+
+
+def make_test_video(path: str, width: int = 1280, height: int = 720, fps: int = 24, seconds: int = 5):
+    """渐变背景 + 移动的圆形主体 + 轻微噪声（模拟宠物循环视频）"""
+    out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+    x = np.linspace(0, 1, width)[None, :, None]
+    y = np.linspace(0, 1, height)[:, None, None]
+    background = (np.concatenate([200 * x + 30 * y, 180 * y + 40 * x, 120 + 100 * x * y], axis=2)).astype(np.uint8)
+    rng = np.random.default_rng(0)
+    for i in range(fps * seconds):
+        frame = background.copy()
+        cx = int(width * (0.3 + 0.4 * np.sin(i / (fps * seconds) * 2 * np.pi) ** 2))
+        cv2.circle(frame, (cx, height // 2), height // 5, (60, 90, 160), -1)
+        cv2.circle(frame, (cx + 40, height // 2 - 40), height // 20, (240, 240, 240), -1)
+        noise = rng.integers(-3, 4, frame.shape)
+        out.write(np.clip(frame.astype(int) + noise, 0, 255).astype(np.uint8))
+    out.release()
+
+
+def read_reference_frames(video_path: str) -> list:
+    """与 GIF 同样跳帧/缩放后的原视频帧（RGB）"""
+    cap = cv2.VideoCapture(video_path)
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    size = (MAX_WIDTH, int(height * MAX_WIDTH / width)) if width > MAX_WIDTH else (width, height)
+    frames, index = [], 0
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        if index % FPS_REDUCTION == 0:
+            frames.append(cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB), size))
+        index += 1
+    cap.release()
+    return frames
+
+
+def save_pil_optimize(video_path: str, output_path: str):
+    """步骤7 原实现：所有帧读入内存，PIL 逐帧自适应调色板 + optimize=True"""
+    cap = cv2.VideoCapture(video_path)
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    cap.release()
+    frames = [Image.fromarray(frame) for frame in read_reference_frames(video_path)]
+    frames[0].save(output_path, save_all=True, append_images=frames[1:],
+                   duration=int(1000 / (fps / FPS_REDUCTION)), loop=0, optimize=True)
+
+
+def measure(gif_path: str, reference: list) -> dict:
+    frames = [np.asarray(frame.convert("RGB")).astype(np.int16) for frame in ImageSequence.Iterator(Image.open(gif_path))]
+    errors = [np.abs(a - b.astype(np.int16)).mean() for a, b in zip(frames, reference)]
+    error = np.mean(errors)
+    # 闪烁：原视频中几乎不变的像素，在 GIF 相邻帧之间的平均变化
+    static = np.all([np.abs(reference[i + 1].astype(np.int16) - reference[i]).max(axis=2) <= 6
+                     for i in range(len(reference) - 1)], axis=0)
+    flicker = np.mean([np.abs(frames[i + 1] - frames[i]).max(axis=2)[static].mean()
+                       for i in range(len(frames) - 1)]) if static.any() else 0.0
+    worst = int(np.argmax(errors))
+    problems = []
+    if len(frames) != len(reference):
+        problems.append(f"帧数 {len(frames)} != {len(reference)}")
+    if errors[worst] > MAX_FRAME_ERROR:
+        problems.append(f"第 {worst} 帧误差 {errors[worst]:.1f} > {MAX_FRAME_ERROR}")
+    return {"size_kb": os.path.getsize(gif_path) / 1024, "error": error, "flicker": flicker, "problems": problems}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GIF 调色板编码耗时/大小对比")
+    parser.add_argument("video", nargs="?", help="输入视频（默认生成测试视频）")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        video_path = args.video
+        if not video_path:
+            video_path = os.path.join(tmp_dir, "input.mp4")
+            print("🎬 生成测试视频...")
+            make_test_video(video_path)
+        reference = read_reference_frames(video_path)
+        print(f"📹 {video_path}: {len(reference)} 帧（跳帧后），{reference[0].shape[1]}x{reference[0].shape[0]}\n")
+
+        variants = [
+            ("PIL save_all(optimize=True)", lambda out: save_pil_optimize(video_path, out)),
+            ("流式 逐帧调色板", lambda out: convert_mp4_to_gif(video_path, out, FPS_REDUCTION, MAX_WIDTH)),
+            ("流式 全局调色板", lambda out: convert_mp4_to_gif(video_path, out, FPS_REDUCTION, MAX_WIDTH,
+                                                         palette="global")),
+            ("流式 全局调色板 + Bayer抖动", lambda out: convert_mp4_to_gif(video_path, out, FPS_REDUCTION, MAX_WIDTH,
+                                                                 palette="global", dither=True)),
+        ]
+        rows = []
+        for index, (name, encode) in enumerate(variants):
+            output_path = os.path.join(tmp_dir, f"{index}.gif")
+            start = time.time()
+            encode(output_path)
+            elapsed = time.time() - start
+            rows.append((name, elapsed, measure(output_path, reference)))
+
+        print(f"\n{'方式':<32}{'耗时':>8}{'大小':>12}{'平均误差':>10}{'闪烁':>8}  校验")
+        for name, elapsed, result in rows:
+            print(f"{name:<32}{elapsed:>7.2f}s{result['size_kb']:>10.0f}KB"
+                  f"{result['error']:>10.2f}{result['flicker']:>8.2f}  {'; '.join(result['problems']) or '✅'}")
+
+    if any(result["problems"] for _, _, result in rows):
+        print("\n❌ 解码校验失败")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+视频倒放内存对比：scripts/video/reverse_video.py（全部帧读入内存）
+vs utils.video_utils.reverse_video（按内存预算分块）
+
+每种实现在独立子进程中运行，记录子进程峰值内存（ru_maxrss）和耗时。
+
+用法:
+    python scripts/video/benchmark_reverse_video.py [视频路径] [--budget 64 128]
+不传视频路径时生成一个 1080p、5秒的测试视频（与可灵 pro 模式输出规格相当）
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 子进程：执行一次倒放并输出峰值内存
+CHILD_CODE = r"""
+import json, os, resource, sys, time, contextlib, io
+sys.path.insert(0, {backend!r})
+sys.path.insert(0, {script_dir!r})
+import cv2, numpy
+mode, input_path, output_path, budget = sys.argv[1], sys.argv[2], sys.argv[3], float(sys.argv[4])
+start = time.time()
+with contextlib.redirect_stdout(io.StringIO()):
+    if mode == "script":
+        from reverse_video import reverse_video
+        reverse_video(input_path, output_path)
+    elif mode == "bounded":
+        from utils.video_utils import reverse_video
+        reverse_video(input_path, output_path, memory_budget_mb=budget)
+    else:
+        cap = cv2.VideoCapture(input_path)
+        cap.read()
+        cap.release()
+elapsed = time.time() - start
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+if sys.platform == "darwin":
+    rss_kb //= 1024
+print(json.dumps({{"peak_rss_mb": rss_kb / 1024, "seconds": elapsed}}))
+"""
+
+
+def make_test_video(path: str, width: int = 1920, height: int = 1080, fps: int = 24, seconds: int = 5):
+    """生成测试视频（移动的色块 + 噪声，避免编码器把帧压得过小）"""
+    import cv2
+    import numpy as np
+
+    out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+    rng = np.random.default_rng(0)
+    noise = rng.integers(0, 40, (height, width, 3), dtype=np.uint8)
+    for i in range(fps * seconds):
+        frame = noise.copy()
+        x = int(i / (fps * seconds) * (width - 300))
+        frame[height // 2 - 150:height // 2 + 150, x:x + 300] = (40, 160, 220)
+        out.write(frame)
+    out.release()
+
+
+def run_child(mode: str, input_path: str, output_path: str, budget: float) -> dict:
+    code = CHILD_CODE.format(backend=BACKEND_DIR, script_dir=SCRIPT_DIR)
+    result = subprocess.run(
+        [sys.executable, "-c", code, mode, input_path, output_path, str(budget)],
+        capture_output=True, text=True, check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="视频倒放峰值内存对比")
+    parser.add_argument("video", nargs="?", help="输入视频（默认生成 1080p 测试视频）")
+    parser.add_argument("--budget", type=float, nargs="+", default=[32, 64, 128], help="内存预算（MB）")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_path = args.video
+        if not input_path:
+            input_path = os.path.join(tmp_dir, "input.mp4")
+            print("🎬 生成 1080p 测试视频...")
+            make_test_video(input_path)
+
+        import cv2
+        cap = cv2.VideoCapture(input_path)
+        info = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+                int(cap.get(cv2.CAP_PROP_FRAME_COUNT)))
+        cap.release()
+        print(f"📹 {input_path}: {info[0]}x{info[1]}，{info[2]} 帧"
+              f"（解码后约 {info[0] * info[1] * 3 * info[2] / 1024 / 1024:.0f}MB）\n")
+
+        rows = [("基线（仅解码一帧）", run_child("baseline", input_path, "", 0))]
+        rows.append(("scripts/video/reverse_video.py",
+                     run_child("script", input_path, os.path.join(tmp_dir, "script.mp4"), 0)))
+        for budget in args.budget:
+            rows.append((f"utils.video_utils（预算 {budget:g}MB）",
+                         run_child("bounded", input_path, os.path.join(tmp_dir, f"bounded_{budget:g}.mp4"), budget)))
+
+        print(f"{'实现':<36}{'峰值内存':>12}{'耗时':>10}")
+        for name, row in rows:
+            print(f"{name:<36}{row['peak_rss_mb']:>10.0f}MB{row['seconds']:>9.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,13 @@
-import cv2
 import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from utils.video_utils import get_video_info, trim_video  # noqa: E402
 
 def cut_video_by_frames(input_path, output_path, start_frame, end_frame):
     """
-    根据起始帧和终止帧剪切视频
+    根据起始帧和终止帧剪切视频（使用 utils.video_utils.trim_video：完整 GOP 直接复制，只重新编码首尾）
     
     Args:
         input_path (str): 输入视频文件路径
@@ -25,21 +29,12 @@ def cut_video_by_frames(input_path, output_path, start_frame, end_frame):
         print(f"错误：终止帧({end_frame})必须大于起始帧({start_frame})")
         return False
     
-    # 打开输入视频
-    cap = cv2.VideoCapture(input_path)
-    
-    if not cap.isOpened():
-        print(f"错误：无法打开视频文件 - {input_path}")
-        return False
-    
-    # 获取视频属性
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    info = get_video_info(input_path)
+    fps = info["fps"]
+    total_frames = info["total_frames"]
     
     print(f"原视频信息:")
-    print(f"  分辨率: {width}x{height}")
+    print(f"  分辨率: {info['width']}x{info['height']}")
     print(f"  帧率: {fps:.2f} FPS")
     print(f"  总帧数: {total_frames}")
     print(f"  原视频时长: {total_frames/fps:.2f}秒")
@@ -47,7 +42,6 @@ def cut_video_by_frames(input_path, output_path, start_frame, end_frame):
     # 验证帧数范围
     if start_frame >= total_frames:
         print(f"错误：起始帧({start_frame})超出视频范围(0-{total_frames-1})")
-        cap.release()
         return False
     
     # 调整终止帧，不能超出视频范围
@@ -65,49 +59,9 @@ def cut_video_by_frames(input_path, output_path, start_frame, end_frame):
     print(f"  起始时间: {start_frame/fps:.2f}秒")
     print(f"  结束时间: {(actual_end_frame+1)/fps:.2f}秒")
     
-    # 创建输出目录（如果不存在）
-    output_dir = os.path.dirname(output_path)
-    if output_dir and not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-    
-    # 设置视频编码器
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-    out = cv2.VideoWriter(output_path, fourcc, fps, (width, height))
-    
-    if not out.isOpened():
-        print(f"错误：无法创建输出视频文件 - {output_path}")
-        cap.release()
-        return False
-    
-    # 跳转到起始帧
-    cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
-    
-    # 读取并写入指定范围的帧
-    frame_count = 0
-    current_frame = start_frame
-    
-    while current_frame <= actual_end_frame:
-        ret, frame = cap.read()
-        
-        if not ret:
-            print(f"警告：在第 {current_frame} 帧处读取失败")
-            break
-        
-        out.write(frame)
-        frame_count += 1
-        current_frame += 1
-        
-        # 显示进度
-        if frame_count % 10 == 0 or current_frame > actual_end_frame:
-            progress = (frame_count / frames_to_extract) * 100
-            print(f"处理进度: {frame_count}/{frames_to_extract} 帧 ({progress:.1f}%) - 当前帧: {current_frame-1}")
-    
-    # 释放资源
-    cap.release()
-    out.release()
+    trim_video(input_path, output_path, start_frame, actual_end_frame)
     
     print(f"成功！剪切后的视频已保存到: {output_path}")
-    print(f"新视频包含 {frame_count} 帧")
     
     return True
 
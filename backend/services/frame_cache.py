@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+视频帧缩略图缓存（拖动条 / 联系表）
+裁剪界面一次要几十帧，以前每帧一次请求、每次重新上传和从头解码。
+- 缓存键为 (视频绝对路径, 文件大小, 修改时间, 帧索引, 宽度)，文件被重新生成后自动失效
+- 未命中的帧合并成一次 sample_frames 解码（按关键帧跳过不需要的 GOP）
+- 缓存 JPEG 字节，按总大小 LRU 淘汰
+"""
+
+import math
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Tuple
+
+import cv2
+import numpy as np
+
+import config
+from utils.video_utils import sample_frames
+
+# 缩略图 JPEG 质量
+FRAME_JPEG_QUALITY = 80
+# 联系表中缩略图之间的间隔（像素）
+CONTACT_SHEET_GAP = 2
+
+
+def _resize_to_width(frame: np.ndarray, width: int) -> np.ndarray:
+    height, source_width = frame.shape[:2]
+    if width <= 0 or width >= source_width:
+        return frame
+    return cv2.resize(frame, (width, max(1, round(height * width / source_width))), interpolation=cv2.INTER_AREA)
+
+
+def _encode_jpeg(image: np.ndarray) -> bytes:
+    ok, buffer = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, FRAME_JPEG_QUALITY])
+    if not ok:
+        raise Exception("JPEG 编码失败")
+    return buffer.tobytes()
+
+
+class FrameCache:
+    """按视频指纹缓存的帧缩略图（线程安全，LRU + 总大小淘汰）"""
+
+    def __init__(self, max_bytes: int = None):
+        self.max_bytes = max_bytes if max_bytes is not None else config.FRAME_CACHE_MAX_MB * 1024 * 1024
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[tuple, bytes]" = OrderedDict()
+        self._size = 0
+        self._stats = {"hits": 0, "misses": 0, "decodes": 0, "evictions": 0}
+
+    def _put_locked(self, key: tuple, data: bytes):
+        if key in self._entries:
+            self._size -= len(self._entries.pop(key))
+        self._entries[key] = data
+        self._size += len(data)
+        while self._size > self.max_bytes and len(self._entries) > 1:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+            self._stats["evictions"] += 1
+
+    def get_frames(self, video_path: str, indices: Iterable[int], width: int) -> Dict[int, bytes]:
+        """
+        帧缩略图（JPEG 字节）
+
+        Args:
+            video_path: 视频文件路径
+            indices: 帧索引（0 ~ 实际帧数-1）
+            width: 缩略图宽度（0 或不小于原宽度时保持原尺寸）
+
+        Returns:
+            {帧索引: JPEG 字节}
+        """
+        path = os.path.abspath(video_path)
+        stat = os.stat(path)
+        prefix = (path, stat.st_size, stat.st_mtime_ns)
+        indices = sorted(set(indices))
+
+        result: Dict[int, bytes] = {}
+        with self._lock:
+            for index in indices:
+                key = prefix + (index, width)
+                data = self._entries.get(key)
+                if data is not None:
+                    self._entries.move_to_end(key)
+                    result[index] = data
+            self._stats["hits"] += len(result)
+            self._stats["misses"] += len(indices) - len(result)
+
+        missing = [index for index in indices if index not in result]
+        if missing:
+            frames = sample_frames(path, missing)
+            encoded = {index: _encode_jpeg(_resize_to_width(frames.pop(index), width)) for index in missing}
+            with self._lock:
+                self._stats["decodes"] += 1
+                for index, data in encoded.items():
+                    self._put_locked(prefix + (index, width), data)
+            result.update(encoded)
+        return result
+
+    def contact_sheet(self, video_path: str, indices: List[int], width: int, columns: int = 0) -> Tuple[bytes, dict]:
+        """
+        联系表：按行排列的缩略图拼成一张 JPEG
+
+        Returns:
+            (JPEG 字节, 布局 {"columns", "rows", "tile_width", "tile_height", "gap", "indices"})
+        """
+        frames = self.get_frames(video_path, indices, width)
+        indices = sorted(frames)
+        tiles = [cv2.imdecode(np.frombuffer(frames[index], np.uint8), cv2.IMREAD_COLOR) for index in indices]
+        columns = columns if columns > 0 else math.ceil(math.sqrt(len(tiles)))
+        rows = math.ceil(len(tiles) / columns)
+        tile_height, tile_width = tiles[0].shape[:2]
+        sheet = np.zeros((
+            rows * tile_height + (rows - 1) * CONTACT_SHEET_GAP,
+            columns * tile_width + (columns - 1) * CONTACT_SHEET_GAP,
+            3,
+        ), dtype=np.uint8)
+        for slot, tile in enumerate(tiles):
+            top = (slot // columns) * (tile_height + CONTACT_SHEET_GAP)
+            left = (slot % columns) * (tile_width + CONTACT_SHEET_GAP)
+            sheet[top:top + tile_height, left:left + tile_width] = tile[:tile_height, :tile_width]
+        layout = {
+            "columns": columns,
+            "rows": rows,
+            "tile_width": tile_width,
+            "tile_height": tile_height,
+            "gap": CONTACT_SHEET_GAP,
+            "indices": indices,
+        }
+        return _encode_jpeg(sheet), layout
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return dict(
+                self._stats,
+                entries=len(self._entries),
+                size_mb=round(self._size / 1024 / 1024, 1),
+                max_mb=round(self.max_bytes / 1024 / 1024, 1),
+            )
+
+
+# 全局缓存实例
+frame_cache = FrameCache()
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+GIF 转换进程池
+MP4 → GIF 是纯 CPU 计算（解码、缩放、PIL 量化），在流程线程里逐个转换 16 个视频会占用几十秒，
+而且受 GIL 限制无法用线程并行。
+- 进程内所有 Pipeline 共享一个进程池，大小按可用 CPU 核数（GIF_CONVERT_WORKERS 可覆盖）
+- 每个视频下载完成后立即提交转换，步骤7基本只需等待最后几个视频转换完成
+- 进程池不可用（如受限环境无法创建子进程）时回退为在当前线程转换
+- 同一进程池也负责 WebP/APNG/MP4 循环等其他格式（fmt 参数，见 utils.renditions）
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from typing import Callable, Dict, Optional
+
+import cv2
+
+import config
+from utils.renditions import convert_rendition
+
+# GIF 转换参数（与原步骤7一致）
+GIF_FPS_REDUCTION = 2
+GIF_MAX_WIDTH = 480
+
+
+def available_cpu_count() -> int:
+    """当前进程可用的 CPU 核数（容器里优先按 CPU 亲和性计算）"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+
+class GifConverter:
+    """共享的 GIF 转换进程池（首次使用时创建，子进程用 spawn 启动，避免在多线程进程里 fork）"""
+
+    def __init__(self, max_workers: int = None):
+        self.max_workers = max_workers or config.GIF_CONVERT_WORKERS or available_cpu_count()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._stats = {"submitted": 0, "completed": 0, "failed": 0, "fallback": 0}
+
+    def _get_executor(self) -> Optional[ProcessPoolExecutor]:
+        with self._lock:
+            if self._executor is None:
+                try:
+                    # 进程间已经并行，子进程里的 OpenCV 只用单线程，避免核数超订
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.max_workers,
+                        mp_context=get_context("spawn"),
+                        initializer=cv2.setNumThreads,
+                        initargs=(1,),
+                    )
+                    print(f"🎞️ GIF 转换进程池已启动（{self.max_workers} 个进程）")
+                except (OSError, ValueError) as e:
+                    print(f"⚠️ 无法创建 GIF 转换进程池，改为在当前线程转换: {e}")
+                    return None
+            return self._executor
+
+    def reset(self):
+        """进程池损坏（子进程被杀）后丢弃，下次使用时重新创建"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    @staticmethod
+    def _convert_args(fmt: str, video_path: str, output_path: str, fps_reduction: int, max_width: int):
+        """convert_rendition 的参数（GIF 用原步骤7的宽度，其他格式用 RENDITION_MAX_WIDTH）"""
+        if max_width is None:
+            max_width = GIF_MAX_WIDTH if fmt == "gif" else config.RENDITION_MAX_WIDTH
+        args = (fmt, video_path, output_path, fps_reduction, max_width, config.RENDITION_QUALITY)
+        return args, {"palette": config.GIF_PALETTE, "dither": config.GIF_DITHER} if fmt == "gif" else {}
+
+    def submit(self, video_path: str, gif_path: str, fps_reduction: int = GIF_FPS_REDUCTION,
+               max_width: int = None, fmt: str = "gif") -> Future:
+        """提交一个转换任务，返回 Future（结果为输出文件路径）"""
+        self._count("submitted")
+        executor = self._get_executor()
+        if executor is not None:
+            try:
+                args, kwargs = self._convert_args(fmt, video_path, gif_path, fps_reduction, max_width)
+                future = executor.submit(convert_rendition, *args, **kwargs)
+                future.add_done_callback(self._on_done)
+                return future
+            except (BrokenProcessPool, RuntimeError) as e:
+                print(f"⚠️ GIF 转换进程池不可用，改为在当前线程转换: {e}")
+                self.reset()
+        return self.convert_inline(video_path, gif_path, fps_reduction, max_width, fmt)
+
+    def convert_inline(self, video_path: str, gif_path: str, fps_reduction: int = GIF_FPS_REDUCTION,
+                       max_width: int = None, fmt: str = "gif") -> Future:
+        """在当前线程转换（进程池不可用时的回退），返回已完成的 Future"""
+        self._count("fallback")
+        future = Future()
+        try:
+            args, kwargs = self._convert_args(fmt, video_path, gif_path, fps_reduction, max_width)
+            future.set_result(convert_rendition(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        self._on_done(future)
+        return future
+
+    def _on_done(self, future: Future):
+        error = future.exception()
+        if isinstance(error, BrokenProcessPool):
+            return  # 由 GifConversionBatch.wait 在当前线程重新转换，结果在那里计数
+        self._count("failed" if error else "completed")
+
+    def _count(self, field: str):
+        with self._lock:
+            self._stats[field] += 1
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats, workers=self.max_workers, started=self._executor is not None)
+
+
+class GifConversionBatch:
+    """
+    单次流程运行的 GIF 转换：视频就绪时 schedule()，步骤7 wait() 收集结果
+
+    同一个 GIF 只转换一次；视频文件在提交后被重新生成（修改时间变化）时重新提交。
+    """
+
+    def __init__(self, converter: GifConverter = None):
+        self.converter = converter or gif_converter
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, dict] = {}  # {output_path: {"video_path", "fmt", "mtime", "future", "submitted_at"}}
+
+    def schedule(self, video_path: str, gif_path: str, fmt: str = "gif"):
+        """视频已下载完成，立即提交转换（fmt 为 gif 以外时 gif_path 为对应格式的输出路径）"""
+        try:
+            mtime = os.path.getmtime(video_path)
+        except OSError:
+            return
+        with self._lock:
+            job = self._jobs.get(gif_path)
+            if job and job["video_path"] == video_path and job["mtime"] == mtime:
+                return
+            self._jobs[gif_path] = {"video_path": video_path, "fmt": fmt, "mtime": mtime, "future": None,
+                                    "submitted_at": time.time()}
+        future = self.converter.submit(video_path, gif_path, fmt=fmt)
+        with self._lock:
+            self._jobs[gif_path]["future"] = future
+
+    def wait(self, on_progress: Callable[[int, int], None] = None) -> Dict[str, Optional[str]]:
+        """
+        等待所有已提交的转换完成
+
+        Returns:
+            {输出路径: 错误信息}，成功的为 None
+        """
+        with self._lock:
+            jobs = dict(self._jobs)
+        outcome = {}
+        total = len(jobs)
+        for done, (gif_path, job) in enumerate(jobs.items(), 1):
+            try:
+                job["future"].result()
+                outcome[gif_path] = None
+            except BrokenProcessPool:
+                # 子进程异常退出：丢弃进程池，当前线程重新转换这个视频
+                print(f"⚠️ GIF 转换子进程异常退出，重新转换: {job['video_path']}")
+                self.converter.reset()
+                retry = self.converter.convert_inline(job["video_path"], gif_path, fmt=job["fmt"])
+                outcome[gif_path] = str(retry.exception()) if retry.exception() else None
+            except Exception as e:
+                outcome[gif_path] = str(e)
+                print(f"❌ {job['fmt'].upper()} 转换失败: {job['video_path']}: {e}")
+            if on_progress:
+                on_progress(done, total)
+        return outcome
+
+
+# 全局进程池（进程内所有 Pipeline 共享）
+gif_converter = GifConverter()
@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+"""
+可灵AI并发准入控制（进程级）
+可灵账户对同时运行的任务数有限制，进程内所有提交路径（Pipeline、工具接口、模型测试）
+都必须先在这里拿到槽位再提交：
+- 按（API密钥, 任务类型）分别计数，图片和视频互不占用
+- 槽位从提交前占用到任务结束（成功/失败/超时）才释放，与可灵侧的"运行中任务数"一致
+- 等待方按先来先得排队，释放时直接移交给队首（同步线程和 asyncio 协程都可以排队）
+- 槽位带租期，持有方异常退出、没人等待结果时，到期自动回收
+- 并发上限按 AIMD 自动调整：满载提交成功时缓慢加一，遇到限流（429/并发超限）时减半，
+  学到的上限持久化到 JSON，套餐变化后无需改配置
+"""
+
+import asyncio
+import itertools
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from pathlib import Path
+from typing import Dict, Optional
+
+import config
+
+
+REAP_CHECK_SECONDS = 30   # 排队期间检查过期槽位的间隔（秒）
+
+# AIMD 自适应并发
+AIMD_DECREASE_FACTOR = 0.5      # 限流时上限乘以该系数
+AIMD_DECREASE_COOLDOWN = 10     # 同一批在途提交同时被限流时只减一次（秒）
+MIN_CONCURRENCY = 1
+
+
+class _Lease:
+    """一个已占用的槽位"""
+
+    def __init__(self, lease_id: int, pool_key: tuple, label: str, ttl: float):
+        self.lease_id = lease_id
+        self.pool_key = pool_key
+        self.label = label
+        self.task_id = None
+        self.saturated = False   # 占用时是否已达到上限（只有满载时的成功才说明上限可以再加）
+        self.acquired_at = time.time()
+        self.expires_at = self.acquired_at + ttl
+
+
+class _Waiter:
+    """排队中的等待方（线程用 Event，协程用 asyncio.Future）"""
+
+    def __init__(self, label: str, loop: asyncio.AbstractEventLoop = None):
+        self.label = label
+        self.loop = loop
+        self.event = None if loop else threading.Event()
+        self.future = loop.create_future() if loop else None
+        self.lease: Optional[_Lease] = None
+        self.enqueued_at = time.time()
+
+    def grant(self, lease: _Lease):
+        self.lease = lease
+        if self.loop:
+            self.loop.call_soon_threadsafe(self._set_future)
+        else:
+            self.event.set()
+
+    def _set_future(self):
+        if not self.future.done():
+            self.future.set_result(self.lease)
+
+
+class _SlotPool:
+    """单个（密钥, 类型）的槽位池"""
+
+    def __init__(self, limit: float):
+        self.limit = float(limit)      # AIMD 学习到的上限（小数，加性增长时逐步累积）
+        self.leases: Dict[int, _Lease] = {}
+        self.waiters = deque()
+        self.last_decrease_at = 0.0
+        self.stats = {"acquired": 0, "queued": 0, "wait_seconds": 0.0, "expired": 0}
+        # 限流记录：{"total": n, "models": {model_name: n}, "last_at": timestamp}
+        self.rate_limited = {"total": 0, "models": {}, "last_at": None}
+
+    @property
+    def effective_limit(self) -> int:
+        return max(MIN_CONCURRENCY, int(self.limit))
+
+
+class KlingConcurrencyGovernor:
+    """进程级可灵并发控制器（线程安全）"""
+
+    def __init__(
+        self,
+        limits: Dict[str, int] = None,
+        lease_seconds: float = None,
+        max_limit: int = None,
+        stats_path: str = None,
+    ):
+        # 初始上限（没有学习记录时使用）
+        self.limits = limits or {
+            "image": config.KLING_IMAGE_CONCURRENCY,
+            "video": config.KLING_VIDEO_CONCURRENCY,
+        }
+        self.lease_seconds = lease_seconds or config.KLING_SLOT_LEASE_SECONDS
+        self.max_limit = max_limit or config.KLING_CONCURRENCY_MAX
+        self.stats_path = Path(stats_path or config.KLING_CONCURRENCY_STATS_PATH)
+        self._lock = threading.Lock()
+        self._pools: Dict[tuple, _SlotPool] = {}
+        self._leases_by_task: Dict[str, _Lease] = {}
+        self._ids = itertools.count(1)
+        self._learned = self._load_learned()   # {"<密钥前8位>:<类型>": {"limit": x, "rate_limited": {...}}}
+
+    # ==================== 占用槽位 ====================
+
+    def acquire(self, access_key: str, kind: str, label: str = "", timeout: float = None) -> _Lease:
+        """
+        阻塞等待一个槽位
+
+        Args:
+            access_key: API密钥（不同账户独立计数）
+            kind: 任务类型 "image" 或 "video"
+            label: 日志用的任务描述
+            timeout: 最长排队时间（秒），None 表示一直等
+
+        Returns:
+            槽位租约，提交成功后用 attach() 绑定 task_id，提交失败用 release() 归还
+        """
+        with self._lock:
+            lease = self._try_acquire(access_key, kind, label)
+            if lease:
+                return lease
+            waiter = self._enqueue(access_key, kind, label)
+
+        deadline = time.time() + timeout if timeout is not None else None
+        while True:
+            wait_time = REAP_CHECK_SECONDS if deadline is None else min(REAP_CHECK_SECONDS, deadline - time.time())
+            if waiter.event.wait(max(wait_time, 0)):
+                return waiter.lease
+            with self._lock:
+                # 排队期间也要检查租期（否则没有新的提交/释放时，过期槽位不会被回收）
+                self._reap_expired()
+                if waiter.lease is not None:
+                    return waiter.lease
+                if deadline is not None and time.time() >= deadline:
+                    self._pool(access_key, kind).waiters.remove(waiter)
+                    raise TimeoutError(f"等待可灵{kind}并发槽位超时（{timeout}秒）")
+
+    async def acquire_async(self, access_key: str, kind: str, label: str = "") -> _Lease:
+        """协程版 acquire（排队期间不占用线程）"""
+        with self._lock:
+            lease = self._try_acquire(access_key, kind, label)
+            if lease:
+                return lease
+            waiter = self._enqueue(access_key, kind, label, loop=asyncio.get_running_loop())
+
+        try:
+            while True:
+                try:
+                    return await asyncio.wait_for(asyncio.shield(waiter.future), REAP_CHECK_SECONDS)
+                except asyncio.TimeoutError:
+                    with self._lock:
+                        self._reap_expired()
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter.lease is None:
+                    self._pool(access_key, kind).waiters.remove(waiter)
+            if waiter.lease is not None:
+                self.release(waiter.lease)
+            raise
+
+    @contextmanager
+    def slot(self, access_key: str, kind: str, label: str = ""):
+        """
+        提交任务用的槽位上下文：进入时排队占用，提交失败（异常或未 attach）时归还，
+        提交成功并 attach 后槽位保留到任务结束
+        """
+        lease = self.acquire(access_key, kind, label)
+        try:
+            yield lease
+        except BaseException:
+            self.release(lease)
+            raise
+        if lease.task_id is None:
+            self.release(lease)
+
+    @asynccontextmanager
+    async def slot_async(self, access_key: str, kind: str, label: str = ""):
+        """协程版 slot"""
+        lease = await self.acquire_async(access_key, kind, label)
+        try:
+            yield lease
+        except BaseException:
+            self.release(lease)
+            raise
+        if lease.task_id is None:
+            self.release(lease)
+
+    def attach(self, lease: _Lease, task_id: str) -> str:
+        """提交成功后把槽位绑定到任务ID，任务结束时按ID释放"""
+        with self._lock:
+            lease.task_id = task_id
+            self._leases_by_task[task_id] = lease
+        return task_id
+
+    # ==================== 释放槽位 ====================
+
+    def release(self, lease: _Lease):
+        """归还槽位（重复释放无副作用）"""
+        with self._lock:
+            self._release_locked(lease)
+
+    def release_task(self, task_id: str):
+        """任务结束（成功/失败/超时）时按任务ID归还槽位；未登记的任务ID直接忽略"""
+        with self._lock:
+            lease = self._leases_by_task.get(task_id)
+            if lease:
+                self._release_locked(lease)
+
+    # ==================== AIMD 自适应 ====================
+
+    def report_success(self, lease: _Lease):
+        """提交成功：如果占用时已满载，上限加性增长（每满载成功一次 +1/上限，约一整轮 +1）"""
+        with self._lock:
+            pool = self._pools.get(lease.pool_key)
+            if pool is None or not lease.saturated or pool.limit >= self.max_limit:
+                return
+            before = pool.effective_limit
+            pool.limit = min(float(self.max_limit), pool.limit + 1.0 / pool.limit)
+            if pool.effective_limit != before:
+                print(f"  📈 可灵{lease.pool_key[1]}并发上限提升: {before} → {pool.effective_limit}")
+                self._save_learned(lease.pool_key, pool)
+                self._grant_waiters(lease.pool_key, pool)
+
+    def report_rate_limited(self, lease: _Lease, model_name: str = None):
+        """提交被限流（429 / 并发超限 / 队列已满）：上限乘性减小，并记录到哪个模型"""
+        with self._lock:
+            pool = self._pools.get(lease.pool_key)
+            if pool is None:
+                return
+            now = time.time()
+            pool.rate_limited["total"] += 1
+            model_key = model_name or "default"
+            pool.rate_limited["models"][model_key] = pool.rate_limited["models"].get(model_key, 0) + 1
+            pool.rate_limited["last_at"] = now
+
+            if now - pool.last_decrease_at >= AIMD_DECREASE_COOLDOWN:
+                before = pool.effective_limit
+                # 以当前实际在途数为基准减半（上限可能已高于真实在途数）
+                base = min(pool.limit, max(len(pool.leases), MIN_CONCURRENCY))
+                pool.limit = max(float(MIN_CONCURRENCY), base * AIMD_DECREASE_FACTOR)
+                pool.last_decrease_at = now
+                print(f"  📉 可灵{lease.pool_key[1]}提交被限流，并发上限: {before} → {pool.effective_limit}")
+            self._save_learned(lease.pool_key, pool)
+
+    def get_limit(self, access_key: str, kind: str) -> int:
+        """当前生效的并发上限"""
+        with self._lock:
+            return self._pool(access_key, kind).effective_limit
+
+    # ==================== 统计 ====================
+
+    def get_stats(self) -> dict:
+        """
+        各（密钥, 类型）的槽位使用情况
+
+        Returns:
+            {"<密钥前8位>:<类型>": {limit, learned_limit, initial_limit, in_use, queued, acquired,
+                                queued_total, avg_wait_seconds, expired, rate_limited, rate_limited_by_model}}
+        """
+        with self._lock:
+            self._reap_expired()
+            stats = {}
+            for (access_key, kind), pool in self._pools.items():
+                queued_total = pool.stats["queued"]
+                stats[self._learned_key((access_key, kind))] = {
+                    "limit": pool.effective_limit,
+                    "learned_limit": round(pool.limit, 2),
+                    "initial_limit": self.limits.get(kind, 1),
+                    "in_use": len(pool.leases),
+                    "queued": len(pool.waiters),
+                    "acquired": pool.stats["acquired"],
+                    "queued_total": queued_total,
+                    "avg_wait_seconds": round(pool.stats["wait_seconds"] / queued_total, 1) if queued_total else 0.0,
+                    "expired": pool.stats["expired"],
+                    "rate_limited": pool.rate_limited["total"],
+                    "rate_limited_by_model": dict(pool.rate_limited["models"]),
+                }
+            return stats
+
+    # ==================== 内部（调用方持有锁） ====================
+
+    def _pool(self, access_key: str, kind: str) -> _SlotPool:
+        key = (access_key, kind)
+        pool = self._pools.get(key)
+        if pool is None:
+            learned = self._learned.get(self._learned_key(key), {})
+            pool = _SlotPool(learned.get("limit", self.limits.get(kind, 1)))
+            pool.rate_limited.update(learned.get("rate_limited", {}))
+            self._pools[key] = pool
+        return pool
+
+    @staticmethod
+    def _learned_key(pool_key: tuple) -> str:
+        # 不落盘完整密钥
+        return f"{pool_key[0][:8]}:{pool_key[1]}"
+
+    def _load_learned(self) -> dict:
+        if not self.stats_path.exists():
+            return {}
+        try:
+            with open(self.stats_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"⚠️ 读取并发上限记录失败，使用默认配置: {e}")
+            return {}
+
+    def _save_learned(self, pool_key: tuple, pool: _SlotPool):
+        """原子写入学习到的上限"""
+        self._learned[self._learned_key(pool_key)] = {
+            "limit": round(pool.limit, 3),
+            "rate_limited": pool.rate_limited,
+            "updated_at": time.time(),
+        }
+        try:
+            self.stats_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.stats_path.with_suffix(".tmp")
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._learned, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.stats_path)
+        except Exception as e:
+            print(f"⚠️ 保存并发上限记录失败: {e}")
+
+    def _new_lease(self, pool_key: tuple, pool: _SlotPool, label: str) -> _Lease:
+        lease = _Lease(next(self._ids), pool_key, label, self.lease_seconds)
+        pool.leases[lease.lease_id] = lease
+        lease.saturated = len(pool.leases) >= pool.effective_limit
+        pool.stats["acquired"] += 1
+        return lease
+
+    def _try_acquire(self, access_key: str, kind: str, label: str) -> Optional[_Lease]:
+        self._reap_expired()
+        pool = self._pool(access_key, kind)
+        if len(pool.leases) < pool.effective_limit and not pool.waiters:
+            return self._new_lease((access_key, kind), pool, label)
+        return None
+
+    def _enqueue(self, access_key: str, kind: str, label: str, loop=None) -> _Waiter:
+        pool = self._pool(access_key, kind)
+        waiter = _Waiter(label, loop)
+        pool.waiters.append(waiter)
+        pool.stats["queued"] += 1
+        print(f"  🚦 可灵{kind}并发已满（{len(pool.leases)}/{pool.effective_limit}），{label or '任务'} 排队中（第{len(pool.waiters)}位）")
+        return waiter
+
+    def _release_locked(self, lease: _Lease):
+        pool = self._pools.get(lease.pool_key)
+        if pool is None or pool.leases.pop(lease.lease_id, None) is None:
+            return
+        if lease.task_id:
+            self._leases_by_task.pop(lease.task_id, None)
+        self._grant_waiters(lease.pool_key, pool)
+
+    def _grant_waiters(self, pool_key: tuple, pool: _SlotPool):
+        """把空出来的槽位按顺序移交给排队者"""
+        while pool.waiters and len(pool.leases) < pool.effective_limit:
+            waiter = pool.waiters.popleft()
+            pool.stats["wait_seconds"] += time.time() - waiter.enqueued_at
+            waiter.grant(self._new_lease(pool_key, pool, waiter.label))
+
+    def _reap_expired(self):
+        """回收超过租期的槽位（持有方崩溃或任务结果无人等待）"""
+        now = time.time()
+        for pool_key, pool in self._pools.items():
+            expired = [lease for lease in pool.leases.values() if lease.expires_at <= now]
+            for lease in expired:
+                print(f"  ⚠️ 可灵并发槽位租期已到，自动回收: {lease.label or lease.task_id}")
+                pool.leases.pop(lease.lease_id, None)
+                if lease.task_id:
+                    self._leases_by_task.pop(lease.task_id, None)
+                pool.stats["expired"] += 1
+            if expired:
+                self._grant_waiters(pool_key, pool)
+
+
+# 全局并发控制器实例（进程内所有提交路径共享）
+concurrency_governor = KlingConcurrencyGovernor()
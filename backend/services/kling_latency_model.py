@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+可灵AI任务耗时模型（自适应轮询）
+按 任务类型/模型/模式 记录任务完成耗时分布，并据此安排下一次轮询：
+- 预计完成前（< P10）稀疏轮询
+- 预计完成区间（P10 ~ P90）密集轮询
+- 超出预期（> P90）回到基础间隔
+- 每次间隔加随机抖动，避免多个任务同时打到 API
+"""
+
+import json
+import math
+import os
+import random
+import threading
+from pathlib import Path
+from typing import Dict, List
+
+import config
+
+
+MIN_SAMPLES = 5            # 样本数不足时使用固定间隔
+MAX_SAMPLES = 200          # 每个分组保留的最近样本数
+MIN_POLL_INTERVAL = 1.0    # 密集阶段的最小间隔（秒）
+MAX_SPARSE_INTERVAL = 60   # 稀疏阶段单次最长等待（秒）
+DENSE_STEPS = 10          # 在 P10~P90 区间内大约轮询的次数
+JITTER_RATIO = 0.15        # 抖动比例（±15%）
+
+
+def latency_key(kind: str, model_name: str = None, mode: str = None) -> str:
+    """分组键，如 video:kling-v2-1-master:pro"""
+    return f"{kind}:{model_name or 'default'}:{mode or '-'}"
+
+
+def _quantile(sorted_values: List[float], q: float) -> float:
+    index = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+class TaskLatencyModel:
+    """任务完成耗时分布（线程安全，持久化到 JSON）"""
+
+    def __init__(self, stats_path: str = None):
+        self.stats_path = Path(stats_path or config.KLING_LATENCY_STATS_PATH)
+        self._lock = threading.Lock()
+        self._samples: Dict[str, List[float]] = {}
+        # 实际轮询统计：{key: {"tasks": n, "polls": n}}
+        self._observed: Dict[str, Dict[str, int]] = {}
+        self._load()
+
+    def _load(self):
+        if not self.stats_path.exists():
+            return
+        try:
+            with open(self.stats_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self._samples = {k: [float(v) for v in vals][-MAX_SAMPLES:] for k, vals in data.get("samples", {}).items()}
+            self._observed = data.get("observed", {})
+        except Exception as e:
+            print(f"⚠️ 读取任务耗时统计失败，重新统计: {e}")
+
+    def _save(self):
+        """原子写入（调用方持有锁）"""
+        try:
+            self.stats_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.stats_path.with_suffix(".tmp")
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({"samples": self._samples, "observed": self._observed}, f)
+            os.replace(tmp_path, self.stats_path)
+        except Exception as e:
+            print(f"⚠️ 保存任务耗时统计失败: {e}")
+
+    def record(self, key: str, duration: float, polls: int = 0):
+        """记录一个成功任务的耗时（从提交到检测到完成）和实际轮询次数"""
+        with self._lock:
+            samples = self._samples.setdefault(key, [])
+            samples.append(round(duration, 1))
+            del samples[:-MAX_SAMPLES]
+            observed = self._observed.setdefault(key, {"tasks": 0, "polls": 0})
+            observed["tasks"] += 1
+            observed["polls"] += polls
+            self._save()
+
+    def _sorted_samples(self, key: str) -> List[float]:
+        with self._lock:
+            return sorted(self._samples.get(key, []))
+
+    def next_poll_delay(self, key: str, elapsed: float, base_interval: float, jitter: bool = True) -> float:
+        """
+        计算距离下一次轮询的等待时间
+
+        Args:
+            key: latency_key() 分组键
+            elapsed: 任务提交至今的秒数
+            base_interval: 固定轮询间隔（样本不足或超出预期时使用）
+            jitter: 是否加随机抖动
+
+        Returns:
+            等待秒数；样本不足且 elapsed 为0时返回0（立即查询一次，与固定间隔行为一致）
+        """
+        samples = self._sorted_samples(key)
+        if len(samples) < MIN_SAMPLES:
+            return 0 if elapsed <= 0 else base_interval
+        return self._delay_from_samples(samples, elapsed, base_interval, jitter)
+
+    @staticmethod
+    def _delay_from_samples(samples: List[float], elapsed: float, base_interval: float, jitter: bool) -> float:
+        p10 = _quantile(samples, 0.1)
+        p90 = _quantile(samples, 0.9)
+
+        if elapsed < p10:
+            # 稀疏阶段：直接睡到 P10 附近（单次最多 MAX_SPARSE_INTERVAL）
+            delay = min(p10 - elapsed, MAX_SPARSE_INTERVAL)
+        elif elapsed < p90:
+            # 密集阶段：在预计完成区间内均匀多查几次
+            delay = min(max((p90 - p10) / DENSE_STEPS, MIN_POLL_INTERVAL), base_interval)
+        else:
+            delay = base_interval
+
+        if jitter:
+            delay *= 1 + random.uniform(-JITTER_RATIO, JITTER_RATIO)
+        return max(delay, MIN_POLL_INTERVAL)
+
+    def get_report(self, base_intervals: Dict[str, float] = None) -> Dict[str, dict]:
+        """
+        对比自适应轮询与固定间隔轮询（基于已记录样本回放，不含抖动）
+
+        Args:
+            base_intervals: {任务类型: 固定间隔}，默认 video=10s, image=5s
+
+        Returns:
+            {key: {samples, p50, p90, fixed: {...}, adaptive: {...}, saved: {...}, observed: {...}}}
+            polls 为每个任务的平均查询次数，lag 为平均检测延迟（秒）
+        """
+        base_intervals = base_intervals or {"video": 10, "image": 5}
+        with self._lock:
+            keys = list(self._samples.keys())
+            observed = {k: dict(v) for k, v in self._observed.items()}
+
+        report = {}
+        for key in keys:
+            samples = self._sorted_samples(key)
+            if not samples:
+                continue
+            base = base_intervals.get(key.split(":")[0], 10)
+
+            fixed_polls = fixed_lag = adaptive_polls = adaptive_lag = 0.0
+            for duration in samples:
+                # 固定间隔：t=0 查一次，之后每 base 秒一次
+                n = math.ceil(duration / base)
+                fixed_polls += n + 1
+                fixed_lag += n * base - duration
+
+                polls, lag = self._replay(samples, duration, base)
+                adaptive_polls += polls
+                adaptive_lag += lag
+
+            count = len(samples)
+            fixed = {"polls": round(fixed_polls / count, 1), "lag": round(fixed_lag / count, 1)}
+            adaptive = {"polls": round(adaptive_polls / count, 1), "lag": round(adaptive_lag / count, 1)}
+            report[key] = {
+                "samples": count,
+                "p50": _quantile(samples, 0.5),
+                "p90": _quantile(samples, 0.9),
+                "fixed": fixed,
+                "adaptive": adaptive,
+                "saved": {
+                    "polls_per_task": round(fixed["polls"] - adaptive["polls"], 1),
+                    "lag_seconds": round(fixed["lag"] - adaptive["lag"], 1),
+                },
+                "observed": observed.get(key, {"tasks": 0, "polls": 0}),
+            }
+        return report
+
+    def _replay(self, samples: List[float], duration: float, base: float) -> tuple:
+        if len(samples) < MIN_SAMPLES:
+            n = math.ceil(duration / base)
+            return n + 1, n * base - duration
+        t = 0.0
+        polls = 0
+        while True:
+            t += self._delay_from_samples(samples, t, base, jitter=False)
+            polls += 1
+            if t >= duration:
+                return polls, t - duration
+
+
+# 全局耗时模型实例
+latency_model = TaskLatencyModel()
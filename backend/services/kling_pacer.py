@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+可灵AI请求节奏控制（令牌桶）
+替代 Pipeline 里每一步之后固定 sleep 的做法：
+- 每个密钥一个令牌桶，进程内所有 Pipeline 共享（多个流程同时运行时总速率不变），在提交可灵任务前消耗
+- 桶里有令牌就立即继续，只有短时间内请求过密、令牌用完时才等待
+- 平均速率与原来的固定间隔相同（每 api_interval 秒补充一个令牌），允许短时突发
+"""
+
+import threading
+import time
+from typing import Dict
+
+import config
+
+
+class TokenBucket:
+    """线程安全的令牌桶（令牌可预支为负数，等待方按先后顺序排队）"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate              # 每秒补充的令牌数
+        self.capacity = capacity      # 桶容量（允许的突发数）
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, cost: float = 1.0) -> float:
+        """预订令牌，返回需要等待的秒数（0 表示立即可用）"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            self._tokens -= cost
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def acquire(self, cost: float = 1.0) -> float:
+        """阻塞直到拿到令牌，返回实际等待的秒数"""
+        wait_time = self.reserve(cost)
+        if wait_time > 0:
+            time.sleep(wait_time)
+        return wait_time
+
+
+class PacingReport:
+    """单次流程运行的节奏统计：实际等待时间 vs 固定间隔模式下的等待时间"""
+
+    def __init__(self, mode: str):
+        self.mode = mode
+        self.calls = 0
+        self.delayed_calls = 0
+        self.waited_seconds = 0.0
+        self.fixed_seconds = 0.0
+
+    def add(self, waited: float, fixed: float):
+        self.calls += 1
+        if waited > 0:
+            self.delayed_calls += 1
+        self.waited_seconds += waited
+        self.fixed_seconds += fixed
+
+    def to_dict(self) -> dict:
+        return {
+            "mode": self.mode,
+            "calls": self.calls,
+            "delayed_calls": self.delayed_calls,
+            "waited_seconds": round(self.waited_seconds, 1),
+            "fixed_interval_seconds": round(self.fixed_seconds, 1),
+            "saved_seconds": round(self.fixed_seconds - self.waited_seconds, 1),
+        }
+
+
+class KlingPacer:
+    """按密钥共享令牌桶的节奏控制器"""
+
+    def __init__(self, burst: int = None):
+        self.burst = burst or config.KLING_PACER_BURST
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, access_key: str, interval: float) -> TokenBucket:
+        """
+        获取密钥对应的令牌桶（同一密钥只有一个桶，请求预算按密钥计算）
+
+        各 Pipeline 配置的平均间隔不同时取最慢的（间隔最大的）速率
+        """
+        rate = 1.0 / max(interval, 0.001)
+        with self._lock:
+            bucket = self._buckets.get(access_key)
+            if bucket is None:
+                bucket = TokenBucket(rate=rate, capacity=self.burst)
+                self._buckets[access_key] = bucket
+            elif rate < bucket.rate:
+                bucket.reserve(0)  # 按旧速率结算已补充的令牌，再降低速率
+                bucket.rate = rate
+            return bucket
+
+    def pace(self, access_key: str, interval: float) -> float:
+        """消耗一个令牌（必要时等待），返回等待秒数"""
+        return self.bucket(access_key, interval).acquire()
+
+
+# 全局节奏控制器实例（进程内所有 Pipeline 共享）
+request_pacer = KlingPacer()
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+可灵AI生成结果缓存（按请求内容寻址）
+相同的输入（起始图片字节 + 提示词 + 负向提示词 + 模型 + 模式 + 时长等）每次都会重新付费生成，
+多模型对比、分步接口重跑、用户重复上传同一张照片都会触发。
+缓存以完整请求的哈希为键，保存下载好的 MP4/PNG 和任务元数据：
+- <缓存目录>/<键前2位>/<键>.<扩展名>  结果文件
+- <缓存目录>/<键前2位>/<键>.json       元数据（任务ID、请求参数、大小、最近使用时间）
+超过容量上限时按最近使用时间（LRU）淘汰。
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+import config
+from kling_api_helper import file_sha256
+
+# 请求参数里代表输入图片的字段（按文件内容哈希参与计算，而不是路径）
+IMAGE_FIELDS = ("image_path", "tail_image_path")
+# 缓存格式版本（格式变化时修改，旧缓存自动失效）
+CACHE_VERSION = 1
+
+
+class KlingResultCache:
+    """内容寻址的生成结果缓存（线程安全，LRU + 总大小淘汰）"""
+
+    def __init__(self, cache_dir: str = None, max_bytes: int = None):
+        self.cache_dir = Path(cache_dir or config.KLING_RESULT_CACHE_DIR)
+        self.max_bytes = max_bytes if max_bytes is not None else config.KLING_RESULT_CACHE_MAX_MB * 1024 * 1024
+        self._lock = threading.Lock()
+        self._index: Optional[Dict[str, dict]] = None  # {键: {"path", "meta_path", "size", "last_used_at"}}
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    # ==================== 键 ====================
+
+    def make_key(self, api: str, request: dict) -> str:
+        """
+        计算请求的缓存键
+
+        Args:
+            api: 接口名（image_to_image / image_to_video）
+            request: 调用参数（图片路径字段按文件内容哈希）
+        """
+        normalized = {}
+        for name, value in request.items():
+            if name in IMAGE_FIELDS and value:
+                normalized[name] = file_sha256(value)
+            else:
+                normalized[name] = value
+        payload = json.dumps({"v": CACHE_VERSION, "api": api, "request": normalized},
+                             sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    # ==================== 读写 ====================
+
+    def get(self, key: str, output_path: str) -> Optional[dict]:
+        """命中时把结果复制到 output_path 并返回元数据，未命中返回 None"""
+        with self._lock:
+            entry = self._load_index().get(key)
+            if entry is None or not os.path.exists(entry["path"]):
+                if entry is not None:
+                    self._remove_locked(key)
+                self._stats["misses"] += 1
+                return None
+            entry["last_used_at"] = time.time()
+            self._stats["hits"] += 1
+            cached_path = entry["path"]
+            meta_path = entry["meta_path"]
+
+        # 复制到输出目录（下游会原地修改输出文件，如 sit.png 去背景，不能用硬链接）
+        Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = f"{output_path}.cache.tmp"
+        shutil.copyfile(cached_path, tmp_path)
+        os.replace(tmp_path, output_path)
+
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            meta["last_used_at"] = time.time()
+            meta["hits"] = meta.get("hits", 0) + 1
+            self._write_json(meta_path, meta)
+        except (OSError, ValueError):
+            meta = {}
+        return meta
+
+    def put(self, key: str, source_path: str, metadata: dict):
+        """保存结果文件和元数据，超出容量时淘汰最久未使用的条目"""
+        ext = Path(source_path).suffix or ".bin"
+        bucket = self.cache_dir / key[:2]
+        bucket.mkdir(parents=True, exist_ok=True)
+        cached_path = bucket / f"{key}{ext}"
+        meta_path = bucket / f"{key}.json"
+
+        tmp_path = f"{cached_path}.tmp"
+        shutil.copyfile(source_path, tmp_path)
+        os.replace(tmp_path, cached_path)
+
+        now = time.time()
+        size = os.path.getsize(cached_path)
+        meta = dict(metadata, key=key, file=cached_path.name, size=size, created_at=now, last_used_at=now, hits=0)
+        self._write_json(meta_path, meta)
+
+        with self._lock:
+            self._load_index()[key] = {
+                "path": str(cached_path),
+                "meta_path": str(meta_path),
+                "size": size,
+                "last_used_at": now,
+            }
+            self._stats["stores"] += 1
+            self._evict_locked()
+
+    # ==================== 索引 / 淘汰 ====================
+
+    def _load_index(self) -> Dict[str, dict]:
+        """首次使用时扫描缓存目录建立索引"""
+        if self._index is not None:
+            return self._index
+        self._index = {}
+        if self.cache_dir.exists():
+            for meta_path in self.cache_dir.glob("*/*.json"):
+                try:
+                    with open(meta_path, "r", encoding="utf-8") as f:
+                        meta = json.load(f)
+                    cached_path = meta_path.parent / meta["file"]
+                    self._index[meta["key"]] = {
+                        "path": str(cached_path),
+                        "meta_path": str(meta_path),
+                        "size": meta.get("size", 0),
+                        "last_used_at": meta.get("last_used_at", 0),
+                    }
+                except (OSError, ValueError, KeyError):
+                    continue
+        return self._index
+
+    def _evict_locked(self):
+        index = self._load_index()
+        total = sum(entry["size"] for entry in index.values())
+        if total <= self.max_bytes:
+            return
+        for key, entry in sorted(index.items(), key=lambda item: item[1]["last_used_at"]):
+            if total <= self.max_bytes:
+                break
+            total -= entry["size"]
+            self._remove_locked(key)
+            self._stats["evictions"] += 1
+            print(f"🧹 缓存淘汰: {key[:12]}（{entry['size'] / 1024 / 1024:.1f}MB）")
+
+    def _remove_locked(self, key: str):
+        entry = self._load_index().pop(key, None)
+        if entry:
+            for path in (entry["path"], entry["meta_path"]):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    @staticmethod
+    def _write_json(path, data: dict):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+    # ==================== 统计 ====================
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            index = self._load_index()
+            return dict(
+                self._stats,
+                entries=len(index),
+                size_mb=round(sum(entry["size"] for entry in index.values()) / 1024 / 1024, 1),
+                max_mb=round(self.max_bytes / 1024 / 1024, 1),
+            )
+
+
+# 全局缓存实例（进程内所有 Pipeline 共享）
+result_cache = KlingResultCache()
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+可灵AI任务批量轮询器
+进程内所有 Pipeline / 工具接口共享一个轮询线程：
+- 按（API地址, 密钥, 任务类型）分组，每轮用一次列表查询覆盖该组所有在途任务
+- 列表里找不到的任务（或列表接口不可用时）再单独查询
+- 每个任务的下次查询时间由耗时模型决定（预计完成前稀疏、临近完成时密集）
+- 任务结束时通过 Future / 回调通知等待方
+"""
+
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional
+
+import config
+from kling_api_helper import (
+    KlingAPI,
+    KlingTaskFailedError,
+    extract_task_status,
+    extract_task_error,
+    is_task_succeeded,
+    is_task_failed,
+    get_task_meta,
+    record_task_completion,
+)
+from services.kling_latency_model import latency_model, latency_key
+from services.kling_concurrency import concurrency_governor
+
+
+DEFAULT_LIST_PAGE_SIZE = 100   # 列表查询每页数量
+DEFAULT_LIST_MAX_PAGES = 3     # 每轮最多翻页数（在途任务一般都在前几页）
+LIST_RETRY_COOLDOWN = 30       # 列表查询失败后暂停使用的秒数（连续失败时翻倍）
+LIST_RETRY_MAX_COOLDOWN = 600  # 暂停时长上限（接口确实不支持时，每10分钟试一次）
+
+
+class _TrackedTask:
+    """一个在途任务的轮询状态"""
+
+    def __init__(self, api: KlingAPI, task_id: str, kind: str, max_wait_seconds: int, future: Future):
+        self.api = api
+        self.task_id = task_id
+        self.kind = kind
+        self.max_wait_seconds = max_wait_seconds
+        self.future = future
+        self.tracked_at = time.time()
+        self.deadline = self.tracked_at + max_wait_seconds
+        self.polls = 0
+
+        # 耗时统计从提交时刻算起（提交元数据缺失时以登记时刻为准）
+        meta = get_task_meta(task_id)
+        self.latency_key = meta["key"] if meta else latency_key(kind)
+        self.started_at = meta["submitted_at"] if meta else self.tracked_at
+        self.next_poll_at = self.tracked_at
+
+    @property
+    def group_key(self) -> tuple:
+        return (self.api.base_url, self.api.access_key, self.kind)
+
+
+class KlingTaskPoller:
+    """进程级可灵任务轮询器（线程安全，轮询线程按需启动）"""
+
+    def __init__(
+        self,
+        poll_interval: int = None,
+        page_size: int = DEFAULT_LIST_PAGE_SIZE,
+        max_pages: int = DEFAULT_LIST_MAX_PAGES,
+    ):
+        self.poll_interval = poll_interval or config.KLING_POLL_INTERVAL
+        self.page_size = page_size
+        self.max_pages = max_pages
+
+        self._cond = threading.Condition()
+        self._tasks: Dict[tuple, _TrackedTask] = {}  # {(kind, task_id): _TrackedTask}
+        self._thread = None
+        self._list_backoff: Dict[tuple, tuple] = {}  # {分组: (连续失败次数, 恢复列表查询的时间)}，暂停期间只做单任务查询
+
+        self._stats = {
+            "tracked_total": 0,
+            "list_requests": 0,
+            "single_requests": 0,
+            "succeeded": 0,
+            "failed": 0,
+            "timeouts": 0,
+        }
+
+    def track(
+        self,
+        api: KlingAPI,
+        task_id: str,
+        kind: str = "video",
+        max_wait_seconds: int = 600,
+        callback: Callable[[Future], None] = None,
+    ) -> Future:
+        """
+        登记一个在途任务
+
+        Args:
+            api: 提交该任务的 KlingAPI 实例（决定查询用的密钥）
+            task_id: 任务ID
+            kind: 任务类型 "video" 或 "image"
+            max_wait_seconds: 最大等待时间（秒）
+            callback: 任务结束时的回调，参数为 Future
+
+        Returns:
+            Future，结果为与 query_*_task 相同格式的任务数据；失败/超时时抛出异常
+        """
+        key = (kind, task_id)
+        with self._cond:
+            tracked = self._tasks.get(key)
+            if tracked is None:
+                tracked = _TrackedTask(api, task_id, kind, max_wait_seconds, Future())
+                tracked.next_poll_at = time.time() + self._next_delay(tracked)
+                self._tasks[key] = tracked
+                self._stats["tracked_total"] += 1
+                self._ensure_thread()
+                self._cond.notify()
+        if callback:
+            tracked.future.add_done_callback(callback)
+        return tracked.future
+
+    def wait(self, api: KlingAPI, task_id: str, kind: str = "video", max_wait_seconds: int = 600) -> dict:
+        """阻塞等待任务完成（替代 wait_for_task / wait_for_video_task）"""
+        return self.track(api, task_id, kind=kind, max_wait_seconds=max_wait_seconds).result()
+
+    def get_stats(self) -> dict:
+        """轮询统计：在途任务数、列表/单任务请求数、完成情况"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats["in_flight"] = len(self._tasks)
+        return stats
+
+    # ==================== 轮询线程 ====================
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="kling-task-poller", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._tasks:
+                    self._cond.wait()
+                now = time.time()
+                next_due = min(t.next_poll_at for t in self._tasks.values())
+                if next_due > now:
+                    self._cond.wait(timeout=next_due - now)
+                    continue
+                tracked = list(self._tasks.values())
+
+            try:
+                self._poll_round(tracked)
+            except Exception as e:
+                # 轮询线程不能退出，异常只记录
+                print(f"  ⚠️ 任务轮询异常: {e}")
+                time.sleep(1)
+
+    def _poll_round(self, tracked: List[_TrackedTask]):
+        now = time.time()
+        groups: Dict[tuple, List[_TrackedTask]] = {}
+        for t in tracked:
+            groups.setdefault(t.group_key, []).append(t)
+
+        for group_key, tasks in groups.items():
+            due = [t for t in tasks if t.next_poll_at <= now]
+            if not due:
+                continue
+
+            # 同组有多个任务时，一次列表查询顺带拿到所有任务状态
+            found = {}
+            if len(tasks) > 1 and self._list_backoff.get(group_key, (0, 0))[1] <= now:
+                found = self._query_by_list(tasks)
+
+            for t in tasks:
+                task_data = found.get(t.task_id)
+                if task_data is None and t in due:
+                    task_data = self._query_single(t)
+                if task_data is not None:
+                    t.polls += 1
+                    self._handle_result(t, task_data)
+
+            for t in due:
+                if t.future.done():
+                    continue
+                if time.time() >= t.deadline:
+                    self._finish(t, error=Exception(f"任务超时（{t.max_wait_seconds}秒）"), stat="timeouts")
+                else:
+                    t.next_poll_at = time.time() + self._next_delay(t)
+
+    def _next_delay(self, t: _TrackedTask) -> float:
+        return latency_model.next_poll_delay(t.latency_key, time.time() - t.started_at, self.poll_interval)
+
+    def _query_by_list(self, tasks: List[_TrackedTask]) -> Dict[str, dict]:
+        api = tasks[0].api
+        kind = tasks[0].kind
+        wanted = {t.task_id for t in tasks}
+        found = {}
+
+        list_func = api.list_video_tasks if kind == "video" else api.list_image_tasks
+        try:
+            for page_num in range(1, self.max_pages + 1):
+                items = list_func(page_num=page_num, page_size=self.page_size)
+                with self._cond:
+                    self._stats["list_requests"] += 1
+                for item in items:
+                    task_id = item.get("task_id")
+                    if task_id in wanted:
+                        # 包装成与单任务查询相同的响应格式，方便复用解析逻辑
+                        found[task_id] = {"code": 0, "data": item}
+                if len(found) == len(wanted) or len(items) < self.page_size:
+                    break
+        except Exception as e:
+            # 可能只是暂时性错误（超时、限流、5xx）：按连续失败次数暂停一段时间，之后再试列表查询
+            failures = self._list_backoff.get(tasks[0].group_key, (0, 0))[0] + 1
+            cooldown = min(LIST_RETRY_COOLDOWN * 2 ** (failures - 1), LIST_RETRY_MAX_COOLDOWN)
+            self._list_backoff[tasks[0].group_key] = (failures, time.time() + cooldown)
+            print(f"  ⚠️ 任务列表查询失败（连续{failures}次），{cooldown}秒内改为逐个查询: {str(e)[:100]}")
+            return found
+
+        self._list_backoff.pop(tasks[0].group_key, None)
+        return found
+
+    def _query_single(self, t: _TrackedTask) -> Optional[dict]:
+        query_func = t.api.query_video_task if t.kind == "video" else t.api.query_task
+        try:
+            task_data = query_func(t.task_id)
+        except Exception as e:
+            # 查询失败视为暂时性错误，下轮继续
+            print(f"  ⚠️ [{t.task_id}] 查询失败，稍后重试: {str(e)[:100]}")
+            return None
+        finally:
+            with self._cond:
+                self._stats["single_requests"] += 1
+        return task_data
+
+    def _handle_result(self, t: _TrackedTask, task_data: dict):
+        status = extract_task_status(task_data)
+        if is_task_succeeded(status):
+            elapsed = time.time() - t.started_at
+            print(f"  ✅ [{t.task_id}] 任务成功完成: {status}（{elapsed:.0f}秒，查询{t.polls}次）")
+            record_task_completion(t.task_id, t.polls, fallback_key=t.latency_key, fallback_start=t.started_at)
+            self._finish(t, result=task_data, stat="succeeded")
+        elif is_task_failed(status):
+            error_msg = extract_task_error(task_data)
+            print(f"  ❌ [{t.task_id}] 任务失败: status={status}, 错误原因={error_msg}")
+            self._finish(t, error=KlingTaskFailedError(f"任务失败: {error_msg}"), stat="failed")
+
+    def _finish(self, t: _TrackedTask, result: dict = None, error: Exception = None, stat: str = None):
+        # 任务结束（成功/失败/超时），归还并发槽位
+        concurrency_governor.release_task(t.task_id)
+        with self._cond:
+            self._tasks.pop((t.kind, t.task_id), None)
+            if stat:
+                self._stats[stat] += 1
+        if error is not None:
+            t.future.set_exception(error)
+        else:
+            t.future.set_result(result)
+
+
+# 全局轮询器实例（进程内所有 Pipeline 共享）
+task_poller = KlingTaskPoller()
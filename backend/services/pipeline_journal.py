@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+生成流程断点日志（journal.json，保存在每个宠物的输出目录下）
+后台流程运行在守护线程里，服务重启/重新部署会直接中断，之前已付费生成的视频全部作废。
+日志记录：
+- 流程启动参数（用于服务启动时自动恢复）
+- 已完成的步骤和产物（恢复时跳过，不再重复调用可灵API/去背景API）
+- 已提交但尚未下载的可灵任务ID（恢复时直接接管等待，不再重新提交）
+"""
+
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+JOURNAL_FILENAME = "journal.json"
+JOURNAL_VERSION = 1
+
+
+class PipelineJournal:
+    """单个宠物生成流程的断点日志（线程安全，每次变更原子写入磁盘）"""
+
+    def __init__(self, pet_dir: Path):
+        self.pet_dir = Path(pet_dir)
+        self.path = self.pet_dir / JOURNAL_FILENAME
+        self._lock = threading.Lock()
+        self.data = self._load()
+
+    def _load(self) -> dict:
+        if self.path.exists():
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if data.get("version") == JOURNAL_VERSION:
+                    return data
+                print(f"⚠️ 断点日志版本不匹配，重新开始: {self.path}")
+            except (OSError, ValueError) as e:
+                print(f"⚠️ 读取断点日志失败，重新开始: {e}")
+        return {
+            "version": JOURNAL_VERSION,
+            "status": "new",
+            "kind": None,
+            "params": {},
+            "steps": {},
+            "artifacts": {},
+            "tasks": {},
+            "resume_count": 0,
+            "updated_at": time.time(),
+        }
+
+    def _save_locked(self):
+        self.data["updated_at"] = time.time()
+        tmp_path = self.path.with_suffix(".json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def _key(self, output_path: str) -> str:
+        """产物键：相对宠物目录的路径"""
+        try:
+            return Path(output_path).resolve().relative_to(self.pet_dir.resolve()).as_posix()
+        except ValueError:
+            return str(output_path)
+
+    # ==================== 流程 ====================
+
+    @property
+    def resumed(self) -> bool:
+        """本次运行是否接续上次中断的流程"""
+        return self.data.get("status") == "running"
+
+    def start(self, kind: str, params: dict):
+        """开始（或恢复）一次流程运行"""
+        with self._lock:
+            if self.data["status"] == "running":
+                self.data["resume_count"] += 1
+                print(f"♻️ 恢复中断的流程（第{self.data['resume_count']}次）：已完成 "
+                      f"{len(self.data['artifacts'])} 个产物，{len(self.data['tasks'])} 个在途任务待接管")
+            elif self.data["status"] != "new":
+                # 上次已结束（完成/失败）的目录重新运行：保留产物记录，步骤从头执行
+                self.data["steps"] = {}
+            self.data["status"] = "running"
+            self.data["kind"] = kind
+            self.data["params"] = params
+            self.data["pid"] = os.getpid()
+            self._save_locked()
+
+    def finish(self, status: str = "completed", error: str = None):
+        """结束流程（completed / failed），结束后不会在服务启动时自动恢复"""
+        with self._lock:
+            self.data["status"] = status
+            if error:
+                self.data["error"] = error[:500]
+            self._save_locked()
+
+    # ==================== 步骤 ====================
+
+    def step_done(self, step: str) -> bool:
+        with self._lock:
+            return step in self.data["steps"]
+
+    def mark_step(self, step: str, value=None):
+        with self._lock:
+            self.data["steps"][step] = {"value": value, "finished_at": time.time()}
+            self._save_locked()
+
+    # ==================== 产物 / 在途任务 ====================
+
+    def completed_artifact(self, output_path: str) -> Optional[str]:
+        """
+        流程运行中（start 之后）产物已生成且文件仍在时返回路径（下载先写 .part 再改名，存在即完整）
+        分步接口不调用 start，重新执行某一步时照常重新生成
+        """
+        key = self._key(output_path)
+        with self._lock:
+            if self.data["status"] != "running" or key not in self.data["artifacts"]:
+                return None
+        if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
+            return str(output_path)
+        return None
+
+    def mark_artifact(self, output_path: str, task_id: str = None):
+        """产物下载完成，清除对应的在途任务"""
+        key = self._key(output_path)
+        with self._lock:
+            self.data["artifacts"][key] = {"task_id": task_id, "finished_at": time.time()}
+            self.data["tasks"].pop(key, None)
+            self._save_locked()
+
+    def record_task(self, output_path: str, task_id: str, kind: str):
+        """记录已提交的可灵任务（提交成功后立即写盘）"""
+        key = self._key(output_path)
+        with self._lock:
+            self.data["tasks"][key] = {"task_id": task_id, "kind": kind, "submitted_at": time.time()}
+            self._save_locked()
+
+    def pending_task(self, output_path: str) -> Optional[str]:
+        """
+        已提交但尚未下载的任务ID（本次运行之前的重试或上次进程遗留），每次调用计为一次接管
+
+        记录只在产物下载完成（mark_artifact）或远程确认任务失败/不存在（clear_task）时清除，
+        等待超时不清除：调用方先查询远程状态再决定下载、继续等待还是重新提交
+        """
+        key = self._key(output_path)
+        with self._lock:
+            task = self.data["tasks"].get(key)
+            if task is None:
+                return None
+            task["reattached"] = task.get("reattached", 0) + 1
+            self._save_locked()
+            return task["task_id"]
+
+    def clear_task(self, output_path: str):
+        """远程任务失败或查询不到，清除记录（下次重试重新提交）"""
+        key = self._key(output_path)
+        with self._lock:
+            if self.data["tasks"].pop(key, None) is not None:
+                self._save_locked()
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {
+                "status": self.data["status"],
+                "resume_count": self.data["resume_count"],
+                "artifacts": len(self.data["artifacts"]),
+                "pending_tasks": len(self.data["tasks"]),
+            }
+
+
+class SubmissionReport:
+    """单次流程运行的提交统计：新提交 / 接管已有任务（即避免的重复提交）/ 命中结果缓存 / 远程任务失败（之后才允许重新提交）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.reattached = 0
+        self.cache_hits = 0
+        self.remote_failures = 0
+
+    def add(self, field: str):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                "submitted": self.submitted,
+                "reattached": self.reattached,
+                "cache_hits": self.cache_hits,
+                "remote_failures": self.remote_failures,
+                "duplicate_submissions_avoided": self.reattached,
+            }
+
+
+def find_interrupted_journals(output_dir: Path) -> List[Tuple[str, dict]]:
+    """扫描输出目录，返回仍处于 running 状态（进程中断）的流程 [(pet_id, 日志内容)]"""
+    interrupted = []
+    output_dir = Path(output_dir)
+    if not output_dir.exists():
+        return interrupted
+    for journal_path in sorted(output_dir.glob(f"*/{JOURNAL_FILENAME}")):
+        try:
+            with open(journal_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if data.get("version") == JOURNAL_VERSION and data.get("status") == "running":
+            interrupted.append((journal_path.parent.name, data))
+    return interrupted
+
+
+def mark_journal_failed(pet_dir: Path, error: str):
+    """流程异常结束时标记失败（避免下次启动时反复恢复一个必然失败的流程）"""
+    if (Path(pet_dir) / JOURNAL_FILENAME).exists():
+        PipelineJournal(pet_dir).finish("failed", error)
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+宠物视频依赖图调度
+12个过渡视频 + 4个循环视频，每个任务只依赖起始姿势图片是否存在：
+- sit 的循环视频和所有 sit2* 过渡在 sit.png 生成后即可开始
+- sit2walk / sit2rest / rest2sleep 完成后从尾帧提取 walk / rest / sleep 图片，解锁对应的后续任务
+调度器在并发上限内贪心派发就绪任务，关键路径（产出姿势图片的任务）优先，
+整体耗时约为 3 个视频串行生成的时间（sit2rest → rest2sleep → sleep2*）。
+本地倒放模式下，反向过渡（kind="reverse"）依赖其源过渡完成，在本地执行，不占可灵并发。
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, Dict, Iterable, List, Set, Tuple
+
+
+class VideoTask:
+    """依赖图中的一个视频任务"""
+
+    def __init__(self, name: str, kind: str, start_pose: str, produces: str = None, order: int = 0,
+                 source: str = None):
+        self.name = name              # 过渡名（如 sit2walk）或姿势名（循环视频，如 sit）
+        self.kind = kind              # "transition" / "loop" / "reverse"（由 source 倒放得到）
+        self.start_pose = start_pose  # 依赖的起始姿势图片
+        self.produces = produces      # 完成后提取出的姿势图片（仅首批过渡视频）
+        self.source = source          # 倒放的源过渡（仅 reverse）
+        self.order = order            # 原始顺序（优先级相同时保持稳定）
+        self.priority = 1             # 关键路径长度（从该任务到结束需要串行生成的视频数）
+        self.attempts = 0
+        self.not_before = 0.0         # 失败重试的最早时间
+        self.output_path = None       # 视频已生成、后续处理（on_success）失败时保留的结果
+        self.callback_attempts = 0
+
+    def __repr__(self):
+        return f"VideoTask({self.name}, {self.kind}, {self.start_pose}->{self.produces})"
+
+
+def build_video_task_graph(
+    transitions: Iterable[str],
+    poses: Iterable[str],
+    producers: Iterable[str],
+    reverse_sources: Dict[str, str] = None,
+) -> Dict[str, VideoTask]:
+    """
+    构建视频任务依赖图
+
+    Args:
+        transitions: 所有过渡（get_all_transitions()）
+        poses: 所有姿势（POSES，每个姿势一个循环视频）
+        producers: 完成后提取尾帧作为新姿势图片的过渡（FIRST_TRANSITIONS）
+        reverse_sources: 本地倒放模式下 {反向过渡: 源过渡}（REVERSE_TRANSITIONS），None 表示全部远程生成
+
+    Returns:
+        {任务键: VideoTask}，过渡的键为过渡名，循环视频的键为 "<姿势>_loop"
+    """
+    producers = list(producers)
+    transitions = list(transitions)
+    reverse_sources = reverse_sources or {}
+    tasks: Dict[str, VideoTask] = {}
+    order = 0
+    for transition in transitions:
+        start_pose, end_pose = transition.split("2")
+        produces = end_pose if transition in producers else None
+        source = reverse_sources.get(transition)
+        if source in transitions and source not in reverse_sources:
+            tasks[transition] = VideoTask(transition, "reverse", start_pose, produces, order, source=source)
+        else:
+            tasks[transition] = VideoTask(transition, "transition", start_pose, produces, order)
+        order += 1
+    for pose in poses:
+        tasks[f"{pose}_loop"] = VideoTask(pose, "loop", pose, None, order)
+        order += 1
+
+    # 关键路径长度：任务 = 自身 + 依赖它的任务（用它产出的姿势图片或倒放它）中最长的那条
+    def path_length(task: VideoTask, visiting: Set[str]) -> int:
+        dependents = [t for t in tasks.values() if t.source == task.name]
+        if task.produces and task.produces not in visiting:
+            dependents += [t for t in tasks.values() if t.start_pose == task.produces]
+            visiting = visiting | {task.produces}
+        return 1 + max((path_length(t, visiting) for t in dependents), default=0)
+
+    for task in tasks.values():
+        task.priority = path_length(task, {task.start_pose})
+    return tasks
+
+
+class VideoTaskScheduler:
+    """在并发上限内贪心调度依赖图（失败任务延迟重试，依赖缺失的任务直接跳过）"""
+
+    def __init__(
+        self,
+        tasks: Dict[str, VideoTask],
+        run_task: Callable[[VideoTask], str],
+        max_concurrent: Callable[[], int],
+        on_success: Callable[[VideoTask, str], None] = None,
+        on_progress: Callable[[int, int, VideoTask, bool], None] = None,
+        available_poses: Iterable[str] = ("sit",),
+        max_attempts: int = 3,
+        retry_delay: float = 30,
+    ):
+        """
+        Args:
+            tasks: build_video_task_graph() 的结果
+            run_task: 执行单个任务，返回视频路径（阻塞，在工作线程中调用）；倒放任务返回 None 表示倒放质量不合格，
+                任务改为远程生成并重新排队（按远程任务占用并发名额）
+            max_concurrent: 返回当前并发上限（每次派发前调用，随自适应并发变化）
+            on_success: 任务成功后的回调（在调度线程中调用，如提取尾帧）；抛异常时保留已生成的视频，
+                延迟后只重试回调，不重新执行 run_task（视频已付费生成）
+            on_progress: 进度回调 (已结束数, 总数, 任务, 是否成功)
+            available_poses: 已存在的姿势图片
+            max_attempts: 单个任务最多尝试次数
+            retry_delay: 失败后重新排队前的等待（秒），期间其他任务照常执行
+        """
+        self.tasks = tasks
+        self.run_task = run_task
+        self.max_concurrent = max_concurrent
+        self.on_success = on_success
+        self.on_progress = on_progress
+        self.available_poses = set(available_poses)
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+
+    def run(self) -> Tuple[Dict[str, str], Dict[str, str]]:
+        """
+        执行所有任务
+
+        Returns:
+            (results, failed)：{任务键: 视频路径}，{任务键: 错误信息}
+        """
+        pending: Dict[str, VideoTask] = dict(self.tasks)
+        running = {}  # {future: (key, task)}
+        unfinished: Dict[str, VideoTask] = {}  # 视频已生成、等待重试 on_success 的任务
+        results: Dict[str, str] = {}
+        failed: Dict[str, str] = {}
+        total = len(pending)
+        start_time = time.time()
+
+        with ThreadPoolExecutor(max_workers=max(1, total), thread_name_prefix="video-dag") as executor:
+            while pending or running or unfinished:
+                now = time.time()
+                for key in [key for key, task in unfinished.items() if task.not_before <= now]:
+                    task = unfinished.pop(key)
+                    self._complete(key, task, task.output_path, unfinished, failed, total, results)
+
+                self._skip_unreachable(pending, running, failed, total, results, unfinished)
+
+                now = time.time()
+                ready = [
+                    (key, task) for key, task in pending.items()
+                    if task.start_pose in self.available_poses and task.not_before <= now
+                    and (task.source is None or task.source in results)
+                ]
+                ready.sort(key=lambda item: (-item[1].priority, item[1].order))
+
+                # 倒放任务在本地执行，不计入可灵并发
+                limit = max(1, self.max_concurrent())
+                remote_running = sum(1 for _, t in running.values() if t.kind != "reverse")
+                for key, task in ready:
+                    if task.kind != "reverse":
+                        if remote_running >= limit:
+                            continue
+                        remote_running += 1
+                    del pending[key]
+                    task.attempts += 1
+                    print(f"  ▶️ [{key}] 开始（第{task.attempts}次，关键路径 {task.priority}，"
+                          f"已用时 {time.time() - start_time:.0f}秒）")
+                    running[executor.submit(self.run_task, task)] = (key, task)
+
+                if not running:
+                    if not pending and not unfinished:
+                        break
+                    # 只剩等待重试的任务
+                    next_retry = min(task.not_before for task in list(pending.values()) + list(unfinished.values()))
+                    time.sleep(max(0.0, next_retry - time.time()))
+                    continue
+
+                timeout = None
+                retry_times = [task.not_before for task in list(pending.values()) + list(unfinished.values())
+                               if task.not_before > now]
+                if retry_times:
+                    timeout = max(0.0, min(retry_times) - time.time())
+                done, _ = wait(list(running), timeout=timeout, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    key, task = running.pop(future)
+                    try:
+                        output_path = future.result()
+                    except Exception as e:
+                        self._handle_failure(key, task, e, pending, failed, total, results)
+                        continue
+                    if output_path is None and task.kind == "reverse":
+                        # 倒放不合格：不在同一个工作线程里直接远程生成（那样绕过了并发上限），改为远程任务重新排队
+                        print(f"  ↩️ [{key}] 倒放不合格，改为远程生成")
+                        task.kind = "transition"
+                        task.source = None
+                        task.attempts -= 1
+                        pending[key] = task
+                        continue
+                    self._complete(key, task, output_path, unfinished, failed, total, results)
+
+        print(f"  📊 依赖图调度完成: 成功 {len(results)}/{total}，总耗时 {time.time() - start_time:.0f}秒")
+        return results, failed
+
+    def _complete(self, key, task, output_path, unfinished, failed, total, results):
+        """视频已生成：执行 on_success，失败时只重试回调（不把任务放回 pending 重新生成视频）"""
+        try:
+            if self.on_success:
+                self.on_success(task, output_path)
+        except Exception as e:
+            task.callback_attempts += 1
+            if task.callback_attempts < self.max_attempts:
+                task.output_path = output_path
+                task.not_before = time.time() + self.retry_delay
+                unfinished[key] = task
+                print(f"  ⚠️ [{key}] 视频已生成，后续处理第{task.callback_attempts}次失败: {str(e)[:80]}，"
+                      f"{self.retry_delay}秒后只重试后续处理")
+            else:
+                failed[key] = f"视频已生成（{output_path}），后续处理失败: {e}"
+                print(f"  ❌ [{key}] 视频已生成，后续处理最终失败: {str(e)[:100]}")
+                self._report(results, failed, total, task, False)
+            return
+        results[key] = output_path
+        if task.produces:
+            self.available_poses.add(task.produces)
+        self._report(results, failed, total, task, True)
+
+    def _handle_failure(self, key, task, error, pending, failed, total, results):
+        if task.attempts < self.max_attempts:
+            task.not_before = time.time() + self.retry_delay
+            pending[key] = task
+            print(f"  ⚠️ [{key}] 第{task.attempts}次失败: {str(error)[:80]}，{self.retry_delay}秒后重试")
+        else:
+            failed[key] = str(error)
+            print(f"  ❌ [{key}] 最终失败: {str(error)[:100]}")
+            self._report(results, failed, total, task, False)
+            # 源过渡失败，倒放它的任务改为远程生成
+            for dependent in pending.values():
+                if dependent.source == key:
+                    print(f"  ↩️ [{dependent.name}] 源过渡 {key} 失败，改为远程生成")
+                    dependent.kind = "transition"
+                    dependent.source = None
+
+    def _skip_unreachable(self, pending, running, failed, total, results, unfinished):
+        """起始姿势图片已不可能生成（产出它的任务最终失败）的任务直接跳过"""
+        producible = {t.produces for t in pending.values() if t.produces}
+        producible |= {t.produces for _, t in running.values() if t.produces}
+        producible |= {t.produces for t in unfinished.values() if t.produces}
+        for key in list(pending):
+            task = pending[key]
+            if task.start_pose not in self.available_poses and task.start_pose not in producible:
+                del pending[key]
+                failed[key] = f"{task.start_pose}.png 未生成，跳过"
+                print(f"  ⚠️ 跳过 {key}：{task.start_pose}.png 未生成")
+                self._report(results, failed, total, task, False)
+
+    def _report(self, results, failed, total, task, success: bool):
+        if self.on_progress:
+            self.on_progress(len(results) + len(failed), total, task, success)
+
+
+def critical_path(tasks: Dict[str, VideoTask]) -> List[str]:
+    """返回关键路径上的任务键（用于日志）"""
+    path = []
+    current = max(tasks.values(), key=lambda t: (t.priority, -t.order), default=None)
+    while current:
+        key = f"{current.name}_loop" if current.kind == "loop" else current.name
+        path.append(key)
+        dependents = [t for t in tasks.values() if t.source == current.name]
+        if current.produces:
+            dependents += [t for t in tasks.values() if t.start_pose == current.produces and t is not current]
+        current = max(dependents, key=lambda t: (t.priority, -t.order), default=None)
+    return path
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+流式 APNG 写入
+PIL 的 save(save_all=True) 需要先把所有帧放进列表（APNG 编码时还会保留每一帧的副本），峰值内存随帧数增长。
+ApngWriter 每收到一帧就编码并追加写入文件，内存里只保留上一帧：
+- 每帧由 PIL（C 实现）编码成单帧 PNG，再取出其中的 IDAT 数据写成 APNG 的 IDAT / fdAT 块
+- 与上一帧相比只写变化区域（处置方式 NONE、混合方式 SOURCE，同 PIL save_all 的默认行为）
+- 帧数在关闭时才确定，acTL 先写占位，关闭时回写
+"""
+
+import io
+import struct
+import zlib
+from typing import Optional
+
+import numpy as np
+from PIL import Image
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+def _chunk(chunk_type: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", zlib.crc32(chunk_type + data))
+
+
+def _idat_payloads(data: bytes) -> list:
+    """PIL 编码的单帧 PNG 中所有 IDAT 块的数据"""
+    if data[:8] != PNG_SIGNATURE:
+        raise ValueError("不是有效的 PNG 数据")
+    payloads = []
+    pos = 8
+    while pos + 8 <= len(data):
+        length, chunk_type = struct.unpack(">I4s", data[pos:pos + 8])
+        if chunk_type == b"IDAT":
+            payloads.append(data[pos + 8:pos + 8 + length])
+        elif chunk_type == b"IEND":
+            break
+        pos += 12 + length
+    if not payloads:
+        raise ValueError("PNG 中没有图像数据")
+    return payloads
+
+
+class ApngWriter:
+    """
+    增量 APNG 写入器（RGB，无损）
+
+    用法:
+        with ApngWriter(path, width, height, duration_ms) as writer:
+            for frame in frames:
+                writer.write(frame)
+    """
+
+    def __init__(self, output_path: str, width: int, height: int, duration_ms: int, loop: Optional[int] = 0):
+        """
+        Args:
+            output_path: 输出 PNG 路径
+            width, height: 画面尺寸（所有帧需一致）
+            duration_ms: 每帧显示时间（毫秒）
+            loop: 循环次数（0 表示无限循环，None 表示只播放一次）
+        """
+        self.output_path = output_path
+        self.width = width
+        self.height = height
+        self.duration_ms = duration_ms
+        self.loop = loop
+        self.frame_count = 0
+        self._file = None
+        self._actl_offset = 0
+        self._sequence = 0       # fcTL / fdAT 共用的序号
+        self._previous = None    # 上一帧画面（计算变化区域）
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def write(self, frame) -> None:
+        """
+        追加一帧
+
+        Args:
+            frame: PIL Image 或 RGB 的 numpy 数组（尺寸需与构造时一致）
+        """
+        image = frame if isinstance(frame, Image.Image) else Image.fromarray(np.asarray(frame))
+        if image.size != (self.width, self.height):
+            raise ValueError(f"帧尺寸 {image.size} 与 APNG 尺寸 {(self.width, self.height)} 不一致")
+        rgb = np.asarray(image.convert("RGB"))
+
+        # 只编码与上一帧不同的矩形区域（完全相同时写 1x1）
+        box = (0, 0, self.width, self.height)
+        if self._previous is not None:
+            changed = np.any(rgb != self._previous, axis=2)
+            rows = np.flatnonzero(changed.any(axis=1))
+            cols = np.flatnonzero(changed.any(axis=0))
+            if rows.size == 0:
+                box = (0, 0, 1, 1)
+            else:
+                box = (int(cols[0]), int(rows[0]), int(cols[-1]) + 1, int(rows[-1]) + 1)
+        self._previous = rgb
+        left, top, right, bottom = box
+
+        buffer = io.BytesIO()
+        Image.fromarray(rgb[top:bottom, left:right]).save(buffer, format="PNG", optimize=False)
+        payloads = _idat_payloads(buffer.getvalue())
+
+        if self._file is None:
+            self._open()
+        # 帧控制块：尺寸、偏移、显示时间（duration_ms/1000 秒），处置 NONE，混合 SOURCE
+        self._file.write(_chunk(b"fcTL", struct.pack(
+            ">IIIIIHHBB", self._sequence, right - left, bottom - top, left, top, self.duration_ms, 1000, 0, 0)))
+        self._sequence += 1
+        for payload in payloads:
+            if self.frame_count == 0:
+                # 第一帧同时是默认图片，用 IDAT 存储
+                self._file.write(_chunk(b"IDAT", payload))
+            else:
+                self._file.write(_chunk(b"fdAT", struct.pack(">I", self._sequence) + payload))
+                self._sequence += 1
+        self.frame_count += 1
+
+    def _actl(self) -> bytes:
+        return _chunk(b"acTL", struct.pack(">II", max(1, self.frame_count), self.loop if self.loop is not None else 1))
+
+    def _open(self):
+        self._file = open(self.output_path, "wb")
+        self._file.write(PNG_SIGNATURE)
+        # IHDR：8 位 RGB，不隔行
+        self._file.write(_chunk(b"IHDR", struct.pack(">IIBBBBB", self.width, self.height, 8, 2, 0, 0, 0)))
+        self._actl_offset = self._file.tell()
+        self._file.write(self._actl())
+
+    def close(self):
+        """写入结束块、回写帧数并关闭文件"""
+        if self._file is None:
+            return
+        self._file.write(_chunk(b"IEND", b""))
+        self._file.seek(self._actl_offset)
+        self._file.write(self._actl())
+        self._file.close()
+        self._file = None
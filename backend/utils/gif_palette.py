@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+GIF 全局调色板量化（NumPy 向量化）
+逐帧让 PIL 生成自适应调色板既慢，又会让循环视频每帧颜色略有不同（闪烁）。
+这里从抽样帧的像素里用中位切分（median-cut）生成一个全局调色板，
+再预先计算 32x32x32 的最近颜色查找表，每帧只需一次查表即可得到调色板索引；
+可选 8x8 Bayer 有序抖动（抖动图案固定，不会像误差扩散那样在帧间跳动）。
+"""
+
+from typing import Iterable
+
+import numpy as np
+
+# 查找表精度：每个通道取高 5 位（32x32x32 个格子）
+LUT_BITS = 5
+# 生成调色板时最多使用的抽样像素数
+MAX_SAMPLE_PIXELS = 200_000
+
+# 8x8 Bayer 矩阵（0~63）
+_BAYER_2 = np.array([[0, 2], [3, 1]])
+_BAYER_4 = np.block([[4 * _BAYER_2, 4 * _BAYER_2 + 2], [4 * _BAYER_2 + 3, 4 * _BAYER_2 + 1]])
+BAYER_8 = np.block([[4 * _BAYER_4, 4 * _BAYER_4 + 2], [4 * _BAYER_4 + 3, 4 * _BAYER_4 + 1]])
+
+
+def sample_pixels(frames: Iterable[np.ndarray], max_pixels: int = MAX_SAMPLE_PIXELS, seed: int = 0) -> np.ndarray:
+    """从若干帧（RGB，HxWx3）中随机抽取像素，返回 (N, 3) uint8"""
+    pixels = np.concatenate([np.asarray(frame, dtype=np.uint8).reshape(-1, 3) for frame in frames])
+    if len(pixels) > max_pixels:
+        rng = np.random.default_rng(seed)
+        pixels = pixels[rng.choice(len(pixels), max_pixels, replace=False)]
+    return pixels
+
+
+def median_cut_palette(pixels: np.ndarray, colors: int = 256) -> np.ndarray:
+    """
+    中位切分生成调色板
+
+    每次选 像素数 x 最大通道跨度 最大的盒子，沿跨度最大的通道在中位数处一分为二，
+    直到盒子数达到 colors 或无法再分，每个盒子取像素均值作为调色板颜色。
+
+    Args:
+        pixels: (N, 3) uint8
+        colors: 调色板颜色数（≤256）
+
+    Returns:
+        (K, 3) uint8，K ≤ colors
+    """
+    pixels = np.asarray(pixels, dtype=np.uint8).reshape(-1, 3)
+    if len(pixels) == 0:
+        raise ValueError("没有可用于生成调色板的像素")
+
+    boxes = [pixels]
+    spans = [np.ptp(pixels, axis=0)]
+    while len(boxes) < colors:
+        scores = [len(box) * int(span.max()) for box, span in zip(boxes, spans)]
+        index = int(np.argmax(scores))
+        if scores[index] == 0:
+            break  # 所有盒子都只剩一种颜色
+        box = boxes.pop(index)
+        channel = int(np.argmax(spans.pop(index)))
+        half = len(box) // 2
+        order = np.argpartition(box[:, channel], half)
+        for part in (box[order[:half]], box[order[half:]]):
+            boxes.append(part)
+            spans.append(np.ptp(part, axis=0))
+
+    return np.array([box.mean(axis=0) for box in boxes]).round().astype(np.uint8)
+
+
+def build_lut(palette: np.ndarray, bits: int = LUT_BITS) -> np.ndarray:
+    """
+    预计算最近颜色查找表
+
+    Returns:
+        (2^bits)^3 的 uint8 数组，下标为 (r >> s) << 2b | (g >> s) << b | (b >> s)
+    """
+    size = 1 << bits
+    step = 256 // size
+    centers = np.arange(size) * step + step // 2
+    grid = np.stack(np.meshgrid(centers, centers, centers, indexing="ij"), axis=-1).reshape(-1, 3).astype(np.int32)
+    palette = np.asarray(palette, dtype=np.int32)
+
+    lut = np.empty(len(grid), dtype=np.uint8)
+    chunk = 4096
+    for start in range(0, len(grid), chunk):
+        cells = grid[start:start + chunk]
+        distances = ((cells[:, None, :] - palette[None, :, :]) ** 2).sum(axis=2)
+        lut[start:start + chunk] = distances.argmin(axis=1)
+    return lut
+
+
+class PaletteQuantizer:
+    """全局调色板 + 查找表量化器（同一个实例用于一个 GIF 的所有帧）"""
+
+    def __init__(self, palette: np.ndarray, dither: bool = False, dither_strength: float = None,
+                 bits: int = LUT_BITS):
+        """
+        Args:
+            palette: (K, 3) uint8 调色板
+            dither: 是否使用 Bayer 有序抖动
+            dither_strength: 抖动幅度（0~255 色阶），默认按调色板颜色间距估算
+            bits: 查找表每通道精度
+        """
+        self.palette = np.asarray(palette, dtype=np.uint8)
+        self.bits = bits
+        self.lut = build_lut(self.palette, bits)
+        self.dither = dither
+        if dither_strength is None:
+            # 调色板颜色在 RGB 立方体中的平均间距
+            dither_strength = 256 / max(len(self.palette), 1) ** (1 / 3)
+        self.dither_strength = dither_strength
+
+    @classmethod
+    def from_frames(cls, frames: Iterable[np.ndarray], colors: int = 256, **kwargs) -> "PaletteQuantizer":
+        """从抽样帧（RGB）生成调色板"""
+        return cls(median_cut_palette(sample_pixels(frames), colors), **kwargs)
+
+    def quantize(self, frame: np.ndarray) -> np.ndarray:
+        """
+        将 RGB 帧映射为调色板索引
+
+        Returns:
+            (H, W) uint8 索引
+        """
+        frame = np.asarray(frame)
+        shift = 8 - self.bits
+        if self.dither:
+            h, w = frame.shape[:2]
+            threshold = (BAYER_8[np.arange(h)[:, None] % 8, np.arange(w)[None, :] % 8] + 0.5) / 64 - 0.5
+            frame = np.clip(frame + threshold[:, :, None] * self.dither_strength, 0, 255).astype(np.uint8)
+        channels = frame.astype(np.uint16) >> shift
+        index = (channels[:, :, 0] << (2 * self.bits)) | (channels[:, :, 1] << self.bits) | channels[:, :, 2]
+        return self.lut[index]
+
+    def palette_bytes(self) -> list:
+        """PIL putpalette 用的 256 色调色板（不足补 0）"""
+        padded = np.zeros((256, 3), dtype=np.uint8)
+        padded[:len(self.palette)] = self.palette
+        return padded.ravel().tolist()
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+流式 GIF 写入
+PIL 的 save(save_all=True) 需要先把所有帧放进列表，峰值内存随视频长度和分辨率增长。
+GifWriter 每收到一帧就量化、LZW 编码并追加写入文件，内存里只保留当前帧：
+- 每帧仍由 PIL（C 实现）编码成单帧 GIF，再取出其中的图像块拼接到输出文件
+- palette="per_frame"：每帧独立的自适应调色板（局部颜色表，与原 PIL 多帧保存一致）
+- palette="global"：第一帧的调色板作为全局颜色表，后续帧映射到同一调色板（文件更小，帧间颜色不闪烁）
+- 与上一帧相比只写变化区域（保留上一帧画面），静止背景不重复编码；
+  变化区域内未变的像素写成透明索引，LZW 压缩率更高（同 PIL save_all 的 optimize=True）。
+  RGB 帧量化为 255 色，索引 255 留作透明；已量化的 "P" 帧需指定 transparent_index
+"""
+
+import io
+import struct
+from typing import Optional
+
+import numpy as np
+from PIL import Image
+
+PALETTE_MODES = ("per_frame", "global")
+# RGB 帧由写入器量化时使用的颜色数，剩下的索引 255 表示“与上一帧相同”的透明像素
+QUANTIZE_COLORS = 255
+DELTA_INDEX = 255
+
+
+def _read_sub_blocks(data: bytes, pos: int) -> int:
+    """跳过一串数据子块（以 0 长度块结束），返回结束后的位置"""
+    while True:
+        size = data[pos]
+        pos += 1
+        if size == 0:
+            return pos
+        pos += size
+
+
+def _split_single_frame_gif(data: bytes):
+    """
+    拆分 PIL 编码的单帧 GIF
+
+    Returns:
+        (颜色表字节, 颜色表大小标志位, 图像描述符之后的 LZW 数据块（含最小码长字节和结束块）, 图像描述符)
+    """
+    if data[:6] not in (b"GIF87a", b"GIF89a"):
+        raise ValueError("不是有效的 GIF 数据")
+    packed = data[10]
+    pos = 13
+    color_table = b""
+    table_bits = 0
+    if packed & 0x80:
+        table_bits = packed & 0x07
+        table_size = 3 * (2 ** (table_bits + 1))
+        color_table = data[pos:pos + table_size]
+        pos += table_size
+
+    while pos < len(data):
+        block = data[pos]
+        if block == 0x21:  # 扩展块（PIL 可能写入注释/图形控制扩展），跳过
+            pos = _read_sub_blocks(data, pos + 2)
+        elif block == 0x2C:  # 图像描述符
+            descriptor = data[pos:pos + 10]
+            image_packed = descriptor[9]
+            pos += 10
+            if image_packed & 0x80:  # 局部颜色表优先
+                table_bits = image_packed & 0x07
+                table_size = 3 * (2 ** (table_bits + 1))
+                color_table = data[pos:pos + table_size]
+                pos += table_size
+            image_start = pos
+            pos = _read_sub_blocks(data, pos + 1)
+            return color_table, table_bits, data[image_start:pos], descriptor
+        else:
+            break
+    raise ValueError("GIF 中没有图像数据")
+
+
+class GifWriter:
+    """
+    增量 GIF 写入器
+
+    用法:
+        with GifWriter(path, width, height, duration_ms) as writer:
+            for frame in frames:
+                writer.write(frame)
+    """
+
+    def __init__(
+        self,
+        output_path: str,
+        width: int,
+        height: int,
+        duration_ms: int,
+        loop: Optional[int] = 0,
+        palette: str = "per_frame",
+        transparent_index: Optional[int] = None,
+    ):
+        """
+        Args:
+            output_path: 输出 GIF 路径
+            width, height: 画面尺寸（所有帧需一致）
+            duration_ms: 每帧显示时间（毫秒）
+            loop: 循环次数（0 表示无限循环，None 表示不循环）
+            palette: "per_frame" 每帧独立调色板 / "global" 全局调色板
+            transparent_index: 调色板中保留给“与上一帧相同”的索引（仅用于已量化的 "P" 帧，调色板不能使用该索引）
+        """
+        if palette not in PALETTE_MODES:
+            raise ValueError(f"不支持的调色板模式: {palette}（可选 {PALETTE_MODES}）")
+        self.output_path = output_path
+        self.width = width
+        self.height = height
+        self.duration_ms = duration_ms
+        self.loop = loop
+        self.palette = palette
+        self.transparent_index = transparent_index
+        self.frame_count = 0
+        self._file = None
+        self._global_table = None       # 全局颜色表字节
+        self._palette_image = None      # global 模式下用于映射后续帧的调色板图片
+        self._previous = None           # 上一帧显示的 RGB 画面（计算变化区域）
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def write(self, frame) -> None:
+        """
+        追加一帧
+
+        Args:
+            frame: PIL Image 或 RGB 的 numpy 数组（尺寸需与构造时一致）；
+                   "P" 模式的图片视为已量化，直接使用其调色板（如 utils.gif_palette 的全局调色板）
+        """
+        image = frame if isinstance(frame, Image.Image) else Image.fromarray(np.asarray(frame))
+        if image.size != (self.width, self.height):
+            raise ValueError(f"帧尺寸 {image.size} 与 GIF 尺寸 {(self.width, self.height)} 不一致")
+        if image.mode not in ("RGB", "P"):
+            image = image.convert("RGB")
+
+        delta_index = self.transparent_index
+        if image.mode == "P":
+            indexed = image
+        else:
+            delta_index = DELTA_INDEX
+            if self.palette == "global" and self._palette_image is not None:
+                indexed = image.quantize(palette=self._palette_image, dither=Image.Dither.NONE)
+            else:
+                indexed = image.convert("P", palette=Image.Palette.ADAPTIVE, colors=QUANTIZE_COLORS)
+                if self.palette == "global":
+                    self._palette_image = indexed
+
+        # 只编码与上一帧不同的矩形区域（完全相同时写 1x1）
+        rgb = np.asarray(indexed.convert("RGB"))
+        box = (0, 0, self.width, self.height)
+        transparent = False
+        if self._previous is not None:
+            changed = np.any(rgb != self._previous, axis=2)
+            rows = np.flatnonzero(changed.any(axis=1))
+            cols = np.flatnonzero(changed.any(axis=0))
+            if rows.size == 0:
+                box = (0, 0, 1, 1)
+            else:
+                box = (int(cols[0]), int(rows[0]), int(cols[-1]) + 1, int(rows[-1]) + 1)
+            if delta_index is not None:
+                left, top, right, bottom = box
+                indices = np.asarray(indexed)[top:bottom, left:right].copy()
+                indices[~changed[top:bottom, left:right]] = delta_index
+                cropped = Image.fromarray(indices, "P")
+                cropped.putpalette(indexed.getpalette())
+                indexed = cropped
+                transparent = True
+        self._previous = rgb
+        if not transparent and box != (0, 0, self.width, self.height):
+            indexed = indexed.crop(box)
+
+        buffer = io.BytesIO()
+        # 不隔行存储（与 save_all 一致，LZW 压缩率更高）；描述符中的隔行标志仍按 PIL 实际写入的保留
+        indexed.save(buffer, format="GIF", optimize=False, interlace=False)
+        color_table, table_bits, image_data, descriptor = _split_single_frame_gif(buffer.getvalue())
+        interlace = descriptor[9] & 0x40
+
+        if self._file is None:
+            self._open(color_table if self.palette == "global" else b"", table_bits)
+
+        # 图形控制扩展：帧间隔（单位 1/100 秒），处置方式 1 = 保留本帧画面，下一帧在其上覆盖
+        delay = int(round(self.duration_ms / 10))
+        if transparent:
+            self._file.write(b"\x21\xf9\x04" + struct.pack("<BHBB", 0x05, delay, delta_index, 0))
+        else:
+            self._file.write(b"\x21\xf9\x04" + struct.pack("<BHBB", 0x04, delay, 0, 0))
+        # 图像描述符：颜色表与全局颜色表相同时不再写局部颜色表
+        left, top, right, bottom = box
+        packed = interlace if color_table == self._global_table else 0x80 | interlace | table_bits
+        self._file.write(b"\x2c" + struct.pack("<HHHHB", left, top, right - left, bottom - top, packed))
+        if packed & 0x80:
+            self._file.write(color_table)
+        self._file.write(image_data)
+        self.frame_count += 1
+
+    def _open(self, global_table: bytes, table_bits: int):
+        self._file = open(self.output_path, "wb")
+        self._global_table = global_table or None
+        packed = (0x80 | 0x70 | table_bits) if global_table else 0x70
+        self._file.write(b"GIF89a" + struct.pack("<HHBBB", self.width, self.height, packed, 0, 0))
+        if global_table:
+            self._file.write(global_table)
+        if self.loop is not None:
+            # NETSCAPE2.0 循环扩展
+            self._file.write(b"\x21\xff\x0bNETSCAPE2.0\x03\x01" + struct.pack("<H", self.loop) + b"\x00")
+
+    def close(self):
+        """写入结束符并关闭文件"""
+        if self._file is None:
+            return
+        self._file.write(b"\x3b")
+        self._file.close()
+        self._file = None
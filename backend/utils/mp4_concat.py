@@ -0,0 +1,657 @@
+#!/usr/bin/env python3
+"""
+MP4 无重编码拼接/裁剪（stream copy）
+步骤8 原来用 OpenCV 逐帧解码再用 mp4v 重新编码，慢且画质下降。
+同一模型生成的过渡视频编码参数一致（编码器、分辨率、时间基相同），可以直接拼接容器：
+- 解析每个文件 moov 中各轨道的样本表（stts/ctts/stss/stsz/stsc/stco）
+- 样本数据原样复制到新的 mdat，样本表首尾相接，解码时间戳顺延
+- moov 写在 mdat 之前（faststart），客户端可边下边播
+- 每条轨道按片段写编辑列表：各片段从自己的 media_time 开始（跳过 AAC 起始填充），播放时长与该片段视频一致
+  （可灵的 AAC 比视频长约 40ms，整条拼接会逐段累积音画偏移）
+轨道数、轨道类型、时间基或样本描述（stsd，含编码参数 SPS/PPS 和分辨率）不一致、
+或源文件含多段编辑列表时抛出 Mp4ConcatError，由调用方回退为解码重编码。
+"""
+
+import copy
+import os
+import struct
+from typing import List
+
+import numpy as np
+
+# 需要递归解析的容器 box（其他 box 按原字节保留）
+CONTAINER_BOXES = {b"moov", b"trak", b"edts", b"mdia", b"minf", b"stbl", b"dinf"}
+# 复制样本数据时每次读取的字节数
+COPY_BLOCK_SIZE = 1 << 20
+# 样本描述条目在子 box 之前的固定字段长度（视频 78 字节，音频 28 字节）
+SAMPLE_ENTRY_HEADER = {b"vide": 78, b"soun": 28}
+
+
+class Mp4ConcatError(Exception):
+    """视频无法直接拼接（格式不支持或编码参数不一致）"""
+    pass
+
+
+def _parse_boxes(data: bytes, start: int = 0, end: int = None) -> list:
+    """解析 box 列表，返回 [[类型, 子 box 列表或 payload 字节], ...]"""
+    end = len(data) if end is None else end
+    boxes = []
+    pos = start
+    while pos + 8 <= end:
+        size, box_type = struct.unpack_from(">I4s", data, pos)
+        header = 8
+        if size == 1:
+            size = struct.unpack_from(">Q", data, pos + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header or pos + size > end:
+            raise Mp4ConcatError(f"损坏的 {box_type.decode('latin-1')} box")
+        if box_type in CONTAINER_BOXES:
+            boxes.append([box_type, _parse_boxes(data, pos + header, pos + size)])
+        else:
+            boxes.append([box_type, data[pos + header:pos + size]])
+        pos += size
+    return boxes
+
+
+def _serialize(boxes: list) -> bytes:
+    out = bytearray()
+    for box_type, value in boxes:
+        payload = _serialize(value) if isinstance(value, list) else value
+        out += struct.pack(">I4s", len(payload) + 8, box_type) + payload
+    return bytes(out)
+
+
+def _child(boxes: list, box_type: bytes):
+    for child_type, value in boxes:
+        if child_type == box_type:
+            return value
+    return None
+
+
+def _require(boxes: list, path: str):
+    """按路径（如 "mdia/minf/stbl"）取子 box，不存在时抛出 Mp4ConcatError"""
+    for name in path.split("/"):
+        boxes = _child(boxes, name.encode())
+        if boxes is None:
+            raise Mp4ConcatError(f"缺少 {name} box")
+    return boxes
+
+
+def _table(payload: bytes, columns: int, dtype: str = ">u4", header: int = 8) -> np.ndarray:
+    """full box 里的定长表（version/flags + entry_count 之后的条目）"""
+    count = struct.unpack_from(">I", payload, header - 4)[0]
+    return np.frombuffer(payload, dtype=dtype, count=count * columns, offset=header).reshape(count, columns)
+
+
+def _read_descriptor(data: bytes, pos: int):
+    """MPEG-4 描述符（esds 内），返回 (tag, 内容起点, 内容终点)"""
+    tag = data[pos]
+    pos += 1
+    size = 0
+    for _ in range(4):
+        byte = data[pos]
+        pos += 1
+        size = (size << 7) | (byte & 0x7F)
+        if not byte & 0x80:
+            break
+    return tag, pos, pos + size
+
+
+def _strip_esds_bitrate(esds: bytes) -> bytes:
+    """清零 esds 中 DecoderConfigDescriptor 的 maxBitrate/avgBitrate"""
+    data = bytearray(esds)
+    try:
+        tag, pos, _ = _read_descriptor(data, 4)
+        if tag != 0x03:
+            return esds
+        flags = data[pos + 2]
+        pos += 3
+        if flags & 0x80:
+            pos += 2
+        if flags & 0x40:
+            pos += 1 + data[pos]
+        if flags & 0x20:
+            pos += 2
+        tag, pos, _ = _read_descriptor(data, pos)
+        if tag == 0x04:
+            data[pos + 5:pos + 13] = bytes(8)
+    except IndexError:
+        return esds
+    return bytes(data)
+
+
+def _read_top_level(path: str):
+    """读取文件的 ftyp 和 moov（mdat 只记录位置，不读入内存）"""
+    ftyp = moov = None
+    with open(path, "rb") as f:
+        file_size = os.fstat(f.fileno()).st_size
+        pos = 0
+        while pos + 8 <= file_size:
+            f.seek(pos)
+            header = f.read(16)
+            size, box_type = struct.unpack_from(">I4s", header)
+            if size == 1:
+                size = struct.unpack_from(">Q", header, 8)[0]
+            elif size == 0:
+                size = file_size - pos
+            if size < 8:
+                raise Mp4ConcatError(f"损坏的 MP4 文件: {path}")
+            if box_type == b"moof":
+                raise Mp4ConcatError(f"不支持分片 MP4: {path}")
+            if box_type in (b"ftyp", b"moov"):
+                f.seek(pos)
+                data = f.read(size)
+                if box_type == b"ftyp":
+                    ftyp = data
+                else:
+                    moov = _parse_boxes(data)[0][1]
+            pos += size
+    if moov is None:
+        raise Mp4ConcatError(f"没有 moov box（文件未写完？）: {path}")
+    return ftyp, moov, file_size
+
+
+def _entry_signature(entry_type: bytes, entry: bytes, handler: bytes) -> bytes:
+    """
+    用于比较编码参数的样本描述条目
+
+    去掉码率信息（btrt box、esds 的码率字段）：编码器按每个文件的实际码率写入，不影响解码
+    """
+    header = SAMPLE_ENTRY_HEADER.get(handler)
+    if header is None:
+        return entry_type + entry
+    try:
+        children = [[child_type, _strip_esds_bitrate(child) if child_type == b"esds" else child]
+                    for child_type, child in _parse_boxes(entry, header) if child_type != b"btrt"]
+    except Mp4ConcatError:
+        return entry_type + entry
+    return entry_type + entry[:header] + _serialize(children)
+
+
+class _Track:
+    """一个文件中一条轨道的样本表（展开为逐样本数组，可按解码顺序截取一段）"""
+
+    def __init__(self, trak: list, file_size: int):
+        mdia = _require(trak, "mdia")
+        mdhd = _require(mdia, "mdhd")
+        self.timescale = struct.unpack_from(">I", mdhd, 20 if mdhd[0] == 1 else 12)[0]
+        self.handler = _require(mdia, "hdlr")[8:12]
+        stbl = _require(mdia, "minf/stbl")
+        # 样本描述条目（stsd 可以有多个，块通过描述索引引用）
+        self.entries = _parse_boxes(_require(stbl, "stsd"), 8)
+        self.signatures = [_entry_signature(entry_type, entry, self.handler) for entry_type, entry in self.entries]
+
+        stsz = _child(stbl, b"stsz")
+        if stsz is None:
+            raise Mp4ConcatError("不支持 stz2 样本大小表")
+        sample_size, count = struct.unpack_from(">II", stsz, 4)
+        if sample_size:
+            self.sizes = np.full(count, sample_size, dtype=np.int64)
+        else:
+            self.sizes = np.frombuffer(stsz, ">u4", count, 12).astype(np.int64)
+        if count == 0:
+            raise Mp4ConcatError("轨道没有样本")
+
+        stts = _table(_require(stbl, "stts"), 2)
+        self.deltas = np.repeat(stts[:, 1], stts[:, 0]).astype(np.int64)
+        ctts = _child(stbl, b"ctts")
+        self.composition = None
+        if ctts is not None:
+            table = _table(ctts, 2, ">i4" if ctts[0] == 1 else ">u4")
+            self.composition = np.repeat(table[:, 1], table[:, 0]).astype(np.int64)
+        stss = _child(stbl, b"stss")
+        self.sync = None
+        if stss is not None:
+            self.sync = np.zeros(count, dtype=bool)
+            self.sync[_table(stss, 1)[:, 0].astype(np.int64) - 1] = True
+        if len(self.deltas) != count or (self.composition is not None and len(self.composition) != count):
+            raise Mp4ConcatError("样本表长度不一致")
+
+        if _child(stbl, b"co64") is not None:
+            chunk_offsets = _table(_child(stbl, b"co64"), 1, ">u8")[:, 0].astype(np.int64)
+        else:
+            chunk_offsets = _table(_require(stbl, "stco"), 1)[:, 0].astype(np.int64)
+        stsc = _table(_require(stbl, "stsc"), 3).astype(np.int64)
+        repeat = np.diff(np.append(stsc[:, 0], len(chunk_offsets) + 1))
+        if np.any(repeat < 0) or stsc[0, 0] != 1:
+            raise Mp4ConcatError("stsc 表无效")
+        chunk_samples = np.repeat(stsc[:, 1], repeat)
+        if chunk_samples.sum() != count or np.any(chunk_samples == 0):
+            raise Mp4ConcatError("stsc 与样本数不一致")
+        # 逐样本的所在块、描述索引和文件偏移
+        self.sample_chunks = np.repeat(np.arange(len(chunk_offsets)), chunk_samples)
+        self.sample_descriptions = np.repeat(np.repeat(stsc[:, 2], repeat), chunk_samples)
+        if np.any(self.sample_descriptions < 1) or np.any(self.sample_descriptions > len(self.entries)):
+            raise Mp4ConcatError("样本描述索引无效")
+        first_samples = np.concatenate(([0], np.cumsum(chunk_samples)[:-1]))
+        preceding = np.cumsum(self.sizes) - self.sizes   # 每个样本之前所有样本的字节数
+        self.sample_offsets = (chunk_offsets[self.sample_chunks]
+                               + preceding - preceding[first_samples][self.sample_chunks])
+        if np.any(self.sample_offsets + self.sizes > file_size):
+            raise Mp4ConcatError("样本数据超出文件范围")
+
+        # 编辑列表的媒体起点（如 B 帧编码的起始偏移、AAC 起始填充）；拼接只支持没有空白段的单段编辑
+        self.media_times = []
+        elst = _child(_child(trak, b"edts") or [], b"elst")
+        if elst is not None:
+            entry_format, entry_size = (">Qq", 20) if elst[0] == 1 else (">Ii", 12)
+            self.media_times = [struct.unpack_from(entry_format, elst, 8 + entry_size * i)[1]
+                                for i in range(struct.unpack_from(">I", elst, 4)[0])]
+        self.media_time = next((t for t in self.media_times if t != -1), 0)
+
+    def select(self, first: int, stop: int) -> "_Track":
+        """解码顺序中 [first, stop) 的样本"""
+        if not 0 <= first < stop <= len(self.sizes):
+            raise Mp4ConcatError(f"样本范围无效: [{first}, {stop})")
+        track = copy.copy(self)
+        for name in ("sizes", "deltas", "composition", "sync", "sample_chunks", "sample_descriptions",
+                     "sample_offsets"):
+            values = getattr(self, name)
+            setattr(track, name, None if values is None else values[first:stop])
+        return track
+
+    def presentation_duration(self) -> int:
+        """从 media_time 起可播放的时长（轨道时间基；有 ctts 时显示时间整体后移，按最晚的显示结束时间算）"""
+        end = np.cumsum(self.deltas)
+        if self.composition is not None:
+            end = end + self.composition
+        return max(int(end.max()) - self.media_time, 0)
+
+    def chunks(self):
+        """按块分组：原文件中同一块且连续的样本组成一块，返回 (起始样本, 样本数, 偏移, 字节数)"""
+        breaks = ((np.diff(self.sample_chunks) != 0)
+                  | (np.diff(self.sample_descriptions) != 0)
+                  | (self.sample_offsets[1:] != self.sample_offsets[:-1] + self.sizes[:-1]))
+        starts = np.concatenate(([0], np.flatnonzero(breaks) + 1))
+        counts = np.diff(np.append(starts, len(self.sizes)))
+        return starts, counts, self.sample_offsets[starts], np.add.reduceat(self.sizes, starts)
+
+
+def _read_clip(path: str):
+    ftyp, moov, file_size = _read_top_level(path)
+    if _child(moov, b"mvex") is not None:
+        raise Mp4ConcatError(f"不支持分片 MP4: {path}")
+    tracks = [_Track(value, file_size) for box_type, value in moov if box_type == b"trak"]
+    if not tracks:
+        raise Mp4ConcatError(f"没有轨道: {path}")
+    return {"path": path, "ftyp": ftyp, "moov": moov, "tracks": tracks}
+
+
+def _check_compatible(clips: list):
+    """检查能否直接拼接（轨道、时间基、编码参数和分辨率完全一致）"""
+    first = clips[0]
+    for clip in clips:
+        name = os.path.basename(clip["path"])
+        if any(-1 in track.media_times or len(track.media_times) > 1 for track in clip["tracks"]):
+            raise Mp4ConcatError(f"{name} 含空白段或多段的编辑列表")
+        if clip is first:
+            continue
+        if len(clip["tracks"]) != len(first["tracks"]):
+            raise Mp4ConcatError(f"{name} 轨道数不同")
+        for reference, track in zip(first["tracks"], clip["tracks"]):
+            if track.handler != reference.handler:
+                raise Mp4ConcatError(f"{name} 轨道类型不同")
+            if track.timescale != reference.timescale:
+                raise Mp4ConcatError(f"{name} 时间基不同（{track.timescale} ≠ {reference.timescale}）")
+            if track.signatures != reference.signatures:
+                raise Mp4ConcatError(f"{name} 编码参数或分辨率不同")
+
+
+def _run_lengths(values: np.ndarray):
+    """游程编码，返回 (起始下标, 长度)"""
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(values)) + 1))
+    return starts, np.diff(np.append(starts, len(values)))
+
+
+def _full_box(box_type: bytes, version: int, body: bytes) -> list:
+    return [box_type, bytes([version, 0, 0, 0]) + body]
+
+
+def _merge_descriptions(parts: List[_Track]):
+    """合并各片段的样本描述条目（编码参数相同的只保留一个），返回 (条目列表, 各片段的索引映射)"""
+    entries, index_of, mappings = [], {}, []
+    for track in parts:
+        mapping = np.zeros(len(track.entries) + 1, dtype=np.int64)
+        for local, (entry, signature) in enumerate(zip(track.entries, track.signatures), 1):
+            if signature not in index_of:
+                entries.append(entry)
+                index_of[signature] = len(entries)
+            mapping[local] = index_of[signature]
+        mappings.append(mapping)
+    return entries, mappings
+
+
+def _sample_table_boxes(parts: List[_Track], chunk_layout: list, use_co64: bool) -> list:
+    """
+    拼接后一条轨道的 stsd/stts/ctts/stss/stsz/stsc/stco
+
+    Args:
+        parts: 各片段的轨道样本表
+        chunk_layout: 各片段的 (每块样本数, 每块描述索引（片段内）, 每块输出偏移)
+    """
+    entries, mappings = _merge_descriptions(parts)
+    deltas = np.concatenate([t.deltas for t in parts])
+    sizes = np.concatenate([t.sizes for t in parts])
+    boxes = [_full_box(b"stsd", 0, struct.pack(">I", len(entries)) + _serialize(entries))]
+
+    starts, lengths = _run_lengths(deltas)
+    boxes.append(_full_box(b"stts", 0, struct.pack(">I", len(starts)) +
+                           np.column_stack((lengths, deltas[starts])).astype(">u4").tobytes()))
+
+    if any(t.composition is not None for t in parts):
+        composition = np.concatenate([t.composition if t.composition is not None else np.zeros(len(t.sizes), np.int64)
+                                      for t in parts])
+        starts, lengths = _run_lengths(composition)
+        version = 1 if composition.min() < 0 else 0
+        table = np.column_stack((lengths, composition[starts])).astype(">i4" if version else ">u4")
+        boxes.append(_full_box(b"ctts", version, struct.pack(">I", len(starts)) + table.tobytes()))
+
+    if any(t.sync is not None for t in parts):
+        sync = np.concatenate([t.sync if t.sync is not None else np.ones(len(t.sizes), bool) for t in parts])
+        numbers = np.flatnonzero(sync) + 1
+        boxes.append(_full_box(b"stss", 0, struct.pack(">I", len(numbers)) + numbers.astype(">u4").tobytes()))
+
+    if np.all(sizes == sizes[0]):
+        boxes.append(_full_box(b"stsz", 0, struct.pack(">II", int(sizes[0]), len(sizes))))
+    else:
+        boxes.append(_full_box(b"stsz", 0, struct.pack(">II", 0, len(sizes)) + sizes.astype(">u4").tobytes()))
+
+    chunk_samples = np.concatenate([layout[0] for layout in chunk_layout])
+    chunk_descriptions = np.concatenate([mapping[layout[1]] for mapping, layout in zip(mappings, chunk_layout)])
+    chunk_offsets = np.concatenate([layout[2] for layout in chunk_layout])
+    starts, _ = _run_lengths(chunk_samples * 65536 + chunk_descriptions)
+    table = np.column_stack((starts + 1, chunk_samples[starts], chunk_descriptions[starts])).astype(">u4")
+    boxes.append(_full_box(b"stsc", 0, struct.pack(">I", len(starts)) + table.tobytes()))
+
+    offsets_type, dtype = (b"co64", ">u8") if use_co64 else (b"stco", ">u4")
+    boxes.append(_full_box(offsets_type, 0, struct.pack(">I", len(chunk_offsets)) + chunk_offsets.astype(dtype).tobytes()))
+    return boxes
+
+
+def _set_duration(payload: bytes, v0_offset: int, v1_offset: int, duration: int) -> bytes:
+    """改写 mvhd/tkhd/mdhd 的 duration 字段（按 version 选择 32/64 位）"""
+    data = bytearray(payload)
+    if data[0] == 1:
+        struct.pack_into(">Q", data, v1_offset, duration)
+    elif duration > 0xFFFFFFFF:
+        raise Mp4ConcatError("时长超出 32 位 duration 范围")
+    else:
+        struct.pack_into(">I", data, v0_offset, duration)
+    return bytes(data)
+
+
+def _clip_seconds(clip: dict) -> float:
+    """片段的播放时长（秒，以视频轨为准）"""
+    track = next((t for t in clip["tracks"] if t.handler == b"vide"), clip["tracks"][0])
+    return track.presentation_duration() / track.timescale
+
+
+def _edit_list(parts: List[_Track], clip_seconds: list, movie_timescale: int) -> list:
+    """
+    拼接后一条轨道的编辑列表 [(时长（movie 时间基）, 媒体起点（-1 为空白段）)]
+
+    每个片段一段：从片段自己的 media_time 开始，播放时长等于该片段的视频时长，
+    比视频长的部分（AAC 尾部）不播放，比视频短的部分补空白段，下一个片段的各轨道仍然同时开始。
+    媒体连续且完整播放的相邻段合并（视频轨通常合并为一段）。
+    """
+    edits = []      # [时长, 媒体起点, 媒体终点, 是否播放到片段末尾]
+    offset = 0
+    for track, seconds in zip(parts, clip_seconds):
+        duration = round(seconds * movie_timescale)
+        available = track.presentation_duration()
+        played = min(round(seconds * track.timescale), available)
+        played_duration = min(duration, round(played * movie_timescale / track.timescale))
+        start = offset + track.media_time
+        if played_duration > 0:
+            previous = edits[-1] if edits else None
+            if previous and previous[3] and previous[2] == start:
+                previous[0] += played_duration
+                previous[2] = start + played
+                previous[3] = played == available
+            else:
+                edits.append([played_duration, start, start + played, played == available])
+        if duration > played_duration:
+            edits.append([duration - played_duration, -1, None, False])
+        offset += int(track.deltas.sum())
+    return [(duration, media_time) for duration, media_time, _, _ in edits]
+
+
+def _build_moov(first_moov: list, clips: list, layouts: list, data_start: int, use_co64: bool) -> list:
+    mvhd = _require(first_moov, "mvhd")
+    movie_timescale = struct.unpack_from(">I", mvhd, 20 if mvhd[0] == 1 else 12)[0]
+    clip_seconds = [_clip_seconds(clip) for clip in clips]
+    moov = []
+    movie_duration = 0
+    track_index = 0
+    for box_type, value in first_moov:
+        if box_type != b"trak":
+            moov.append([box_type, value])
+            continue
+        parts = [clip["tracks"][track_index] for clip in clips]
+        chunk_layout = [(samples, descriptions, offsets + data_start)
+                        for samples, descriptions, offsets in (layout[track_index] for layout in layouts)]
+        media_duration = int(sum(int(t.deltas.sum()) for t in parts))
+        edits = _edit_list(parts, clip_seconds, movie_timescale)
+        duration = sum(edit_duration for edit_duration, _ in edits)
+        movie_duration = max(movie_duration, duration)
+        elst = _full_box(b"elst", 1, struct.pack(">I", len(edits)) +
+                         b"".join(struct.pack(">Qqhh", d, t, 1, 0) for d, t in edits))
+        # 源文件没有编辑列表且拼接后也只需从头完整播放时不添加
+        needs_edts = edits != [(duration, 0)]
+
+        trak = []
+        for child_type, child in value:
+            if child_type == b"tkhd":
+                child = _set_duration(child, 20, 28, duration)
+            elif child_type == b"edts":
+                child = [elst]
+                needs_edts = False
+            elif child_type == b"mdia":
+                if needs_edts:
+                    trak.append([b"edts", [elst]])
+                    needs_edts = False
+                mdia = []
+                for mdia_type, mdia_child in child:
+                    if mdia_type == b"mdhd":
+                        mdia_child = _set_duration(mdia_child, 16, 24, media_duration)
+                    elif mdia_type == b"minf":
+                        minf = []
+                        for minf_type, minf_child in mdia_child:
+                            if minf_type == b"stbl":
+                                # 逐样本的附加表（sdtp/sbgp 等）在拼接后不再对应，丢弃
+                                minf_child = _sample_table_boxes(parts, chunk_layout, use_co64)
+                            minf.append([minf_type, minf_child])
+                        mdia_child = minf
+                    mdia.append([mdia_type, mdia_child])
+                child = mdia
+            trak.append([child_type, child])
+        moov.append([b"trak", trak])
+        track_index += 1
+
+    for box in moov:
+        if box[0] == b"mvhd":
+            box[1] = _set_duration(box[1], 16, 24, movie_duration)
+    return moov
+
+
+def _write_mp4(clips: list, output_path: str) -> str:
+    """把各片段的样本（可能已截取）依次写成一个 MP4（moov 在 mdat 之前）"""
+    track_count = len(clips[0]["tracks"])
+
+    # 输出 mdat 布局：每个片段的块按原文件中的偏移顺序排列（保持音视频交错）
+    copy_plan = []                 # [(源文件, 源偏移, 字节数)]
+    layouts = []                   # 每个片段每条轨道的 (每块样本数, 每块描述索引, 每块相对 mdat 数据起点的偏移)
+    position = 0
+    for clip in clips:
+        track_chunks = [track.chunks() for track in clip["tracks"]]
+        ordered = sorted(
+            (int(offset), int(size), index, chunk)
+            for index, (_, _, offsets, sizes) in enumerate(track_chunks)
+            for chunk, (offset, size) in enumerate(zip(offsets, sizes))
+        )
+        clip_offsets = [np.zeros(len(chunks[0]), dtype=np.int64) for chunks in track_chunks]
+        for offset, size, index, chunk in ordered:
+            clip_offsets[index][chunk] = position
+            if copy_plan and copy_plan[-1][0] == clip["path"] and copy_plan[-1][1] + copy_plan[-1][2] == offset:
+                path, start, length = copy_plan[-1]
+                copy_plan[-1] = (path, start, length + size)
+            else:
+                copy_plan.append((clip["path"], offset, size))
+            position += size
+        layouts.append([(counts, track.sample_descriptions[starts], clip_offsets[index])
+                        for index, (track, (starts, counts, _, _)) in enumerate(zip(clip["tracks"], track_chunks))])
+    mdat_size = position
+
+    ftyp = clips[0]["ftyp"] or b""
+    mdat_header_size = 16 if mdat_size + 8 > 0xFFFFFFFF else 8
+    # moov 大小与块偏移的数值无关，先按相对偏移算出大小，再加上 mdat 数据起点
+    moov_size = len(_serialize([[b"moov", _build_moov(clips[0]["moov"], clips, layouts, 0, False)]]))
+    use_co64 = len(ftyp) + moov_size + mdat_header_size + mdat_size > 0xFFFFFFFF
+    if use_co64:
+        moov_size = len(_serialize([[b"moov", _build_moov(clips[0]["moov"], clips, layouts, 0, True)]]))
+    data_start = len(ftyp) + moov_size + mdat_header_size
+    moov = _serialize([[b"moov", _build_moov(clips[0]["moov"], clips, layouts, data_start, use_co64)]])
+
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    tmp_path = f"{output_path}.part"
+    try:
+        with open(tmp_path, "wb") as out:
+            out.write(ftyp)
+            out.write(moov)
+            if mdat_header_size == 16:
+                out.write(struct.pack(">I4sQ", 1, b"mdat", mdat_size + 16))
+            else:
+                out.write(struct.pack(">I4s", mdat_size + 8, b"mdat"))
+            source_path, source = None, None
+            for path, offset, size in copy_plan:
+                if path != source_path:
+                    if source:
+                        source.close()
+                    source_path, source = path, open(path, "rb")
+                source.seek(offset)
+                while size > 0:
+                    block = source.read(min(size, COPY_BLOCK_SIZE))
+                    if not block:
+                        raise Mp4ConcatError(f"读取样本数据失败: {path}")
+                    out.write(block)
+                    size -= len(block)
+            if source:
+                source.close()
+        os.replace(tmp_path, output_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return output_path
+
+
+def concat_mp4(video_paths: List[str], output_path: str) -> str:
+    """
+    无重编码拼接多个 MP4（样本数据原样复制）
+
+    Args:
+        video_paths: 视频文件路径列表（按顺序）
+        output_path: 输出视频路径
+
+    Returns:
+        输出视频路径
+
+    Raises:
+        Mp4ConcatError: 文件无法直接拼接（调用方应回退为重新编码）
+    """
+    clips = [_read_clip(path) for path in video_paths]
+    _check_compatible(clips)
+    return _write_mp4(clips, output_path)
+
+
+def _presentation_order(track: _Track) -> np.ndarray:
+    """每个解码序号对应的显示帧序号（有 B 帧时两者不同）"""
+    pts = np.cumsum(track.deltas) - track.deltas
+    if track.composition is not None:
+        pts = pts + track.composition
+    presentation = np.empty(len(pts), dtype=np.int64)
+    presentation[np.argsort(pts, kind="stable")] = np.arange(len(pts))
+    return presentation
+
+
+def read_video_samples(video_path: str) -> dict:
+    """
+    单视频轨 MP4 的样本信息（供按 GOP 裁剪规划）
+
+    Returns:
+        {"keyframes": 关键帧的解码序号列表, "presentation": 每个解码序号对应的显示帧序号,
+         "count": 样本数, "codec": 样本描述类型（如 avc1、mp4v）}
+
+    Raises:
+        Mp4ConcatError: 不是可解析的 MP4，或含视频以外的轨道
+    """
+    clip = _read_clip(video_path)
+    if len(clip["tracks"]) != 1 or clip["tracks"][0].handler != b"vide":
+        raise Mp4ConcatError("只支持单视频轨的 MP4")
+    track = clip["tracks"][0]
+    count = len(track.sizes)
+    keyframes = np.arange(count) if track.sync is None else np.flatnonzero(track.sync)
+    return {"keyframes": keyframes.tolist(), "presentation": _presentation_order(track), "count": count,
+            "codec": track.entries[0][0].decode("latin-1")}
+
+
+def probe_mp4(video_path: str) -> dict:
+    """
+    从 MP4 容器读取视频轨的元数据（不解码）
+
+    帧数为样本表中的实际样本数（比 OpenCV 的 CAP_PROP_FRAME_COUNT 估算准确），关键帧来自 stss。
+
+    Returns:
+        {"fps", "width", "height", "total_frames", "duration", "codec", "keyframes": 关键帧的显示帧序号}
+
+    Raises:
+        Mp4ConcatError: 不是可解析的 MP4 或没有视频轨
+    """
+    clip = _read_clip(video_path)
+    tracks = [track for track in clip["tracks"] if track.handler == b"vide"]
+    if not tracks:
+        raise Mp4ConcatError(f"没有视频轨: {video_path}")
+    track = tracks[0]
+    count = len(track.sizes)
+    media_seconds = float(track.deltas.sum()) / track.timescale if track.timescale else 0.0
+    fps = count / media_seconds if media_seconds > 0 else 0.0
+    entry_type, entry = track.entries[0]
+    width, height = struct.unpack_from(">HH", entry, 24)
+    if track.sync is None:
+        keyframes = list(range(count))
+    else:
+        keyframes = sorted(int(index) for index in _presentation_order(track)[track.sync])
+    return {
+        "fps": fps,
+        "width": width,
+        "height": height,
+        "total_frames": count,
+        "duration": count / fps if fps > 0 else 0,
+        "codec": entry_type.decode("latin-1"),
+        "keyframes": keyframes,
+    }
+
+
+def splice_mp4(segments: list, output_path: str) -> str:
+    """
+    按解码顺序截取多个 MP4 的样本并拼接（裁剪：原视频中间完整的 GOP + 重新编码的首尾片段）
+
+    Args:
+        segments: [(视频路径, (起始样本, 结束样本) 或 None 表示全部), ...]，均为单视频轨
+        output_path: 输出视频路径
+
+    Raises:
+        Mp4ConcatError: 片段之间编码参数/分辨率/时间基不一致（不同参数集不写成多个样本描述条目，
+            很多播放器不会在播放中途切换解码器配置）
+    """
+    clips = []
+    for path, sample_range in segments:
+        clip = _read_clip(path)
+        if sample_range is not None:
+            if len(clip["tracks"]) != 1:
+                raise Mp4ConcatError("只支持单视频轨的 MP4")
+            clip["tracks"] = [clip["tracks"][0].select(*sample_range)]
+        clips.append(clip)
+    _check_compatible(clips)
+    return _write_mp4(clips, output_path)
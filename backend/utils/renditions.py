@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+动图多格式输出（与 GIF 并列）
+GIF 只有 256 色、体积大，Flutter 客户端下载慢，另外生成：
+- webp：动画 WebP（有损，默认质量 75，体积通常为 GIF 的 1/3~1/5）
+- apng：动画 PNG（无损，兼容只支持 PNG 的场景，体积较大）
+- mp4：短 H.264 循环视频（有 ffmpeg 时用 libx264，否则用 OpenCV 可用的编码器）
+输出目录与 gifs/ 并列：webp/transitions/x.webp、apng/transitions/x.png、mp4_loops/transitions/x.mp4
+"""
+
+import os
+import shutil
+import subprocess
+from pathlib import Path
+from typing import Iterator, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from utils.apng_writer import ApngWriter
+from utils.video_utils import convert_mp4_to_gif
+
+# 格式 → (宠物目录下的子目录, 扩展名)
+RENDITION_FORMATS = {
+    "gif": ("gifs", ".gif"),
+    "webp": ("webp", ".webp"),
+    "apng": ("apng", ".png"),
+    "mp4": ("mp4_loops", ".mp4"),
+}
+# WebP 动画编码前缓存的帧（RGB，已缩放）的内存上限（MB）
+ANIMATION_MEMORY_BUDGET_MB = 256
+
+
+def find_ffmpeg() -> str:
+    """ffmpeg 可执行文件路径（FFMPEG_PATH 环境变量优先），没有时返回空字符串"""
+    return os.getenv("FFMPEG_PATH") or shutil.which("ffmpeg") or ""
+
+
+def rendition_path(pet_dir: Path, fmt: str, category: str, name: str) -> Path:
+    """某个视频在指定格式下的输出路径（category 为 transitions / loops）"""
+    directory, ext = RENDITION_FORMATS[fmt]
+    return Path(pet_dir) / directory / category / f"{name}{ext}"
+
+
+def _iter_frames(input_path: str, fps_reduction: int, max_width: int) -> Tuple[float, Tuple[int, int], Iterator]:
+    """按 fps_reduction 跳帧、按 max_width 缩放，逐帧产出 RGB PIL Image"""
+    cap = cv2.VideoCapture(input_path)
+    if not cap.isOpened():
+        raise Exception(f"无法打开视频: {input_path}")
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    size = (max_width, int(height * max_width / width)) if width > max_width else (width, height)
+
+    def frames():
+        index = 0
+        try:
+            while True:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                if index % fps_reduction == 0:
+                    frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+                    if size != (width, height):
+                        frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+                    yield Image.fromarray(frame)
+                index += 1
+        finally:
+            cap.release()
+
+    return fps, size, frames()
+
+
+def _save_animation(input_path: str, output_path: str, fmt: str, fps_reduction: int, max_width: int,
+                    loop: int, **save_options) -> str:
+    """
+    WebP 动画：PIL 的 WebP 编码需要完整的帧列表（内部会再 list() 一次），无法逐帧写入；
+    帧已缩放到输出尺寸（480 宽的 5 秒视频约 20MB），累计超过 ANIMATION_MEMORY_BUDGET_MB 时中止
+    """
+    fps, size, frames = _iter_frames(input_path, fps_reduction, max_width)
+    frame_bytes = size[0] * size[1] * 3
+    budget = ANIMATION_MEMORY_BUDGET_MB * 1024 * 1024
+    images = []
+    for image in frames:
+        if (len(images) + 1) * frame_bytes > budget:
+            frames.close()
+            raise Exception(f"{fmt} 帧缓冲超过 {ANIMATION_MEMORY_BUDGET_MB}MB（{len(images)} 帧 {size[0]}x{size[1]}），"
+                            f"请增大 fps_reduction 或减小 max_width")
+        images.append(image)
+    if not images:
+        raise Exception("没有读取到任何帧")
+    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = f"{output_path}.part"
+    images[0].save(
+        tmp_path,
+        format=fmt,
+        save_all=True,
+        append_images=images[1:],
+        duration=int(1000 / (fps / fps_reduction)),
+        loop=loop,
+        **save_options,
+    )
+    os.replace(tmp_path, output_path)
+    print(f"✅ {fmt.upper()}已保存: {output_path}")
+    return output_path
+
+
+def convert_mp4_to_webp(input_path: str, output_path: str, fps_reduction: int = 2, max_width: int = 480,
+                        quality: int = 75, loop: int = 0) -> str:
+    """MP4 → 动画 WebP（有损，quality 0~100）"""
+    return _save_animation(input_path, output_path, "WEBP", fps_reduction, max_width, loop,
+                           quality=quality, method=4, minimize_size=True)
+
+
+def convert_mp4_to_apng(input_path: str, output_path: str, fps_reduction: int = 2, max_width: int = 480,
+                        loop: int = 0) -> str:
+    """MP4 → 动画 PNG（无损，逐帧流式写入，内存里只保留上一帧）"""
+    fps, size, frames = _iter_frames(input_path, fps_reduction, max_width)
+    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = f"{output_path}.part"
+    with ApngWriter(tmp_path, size[0], size[1], int(1000 / (fps / fps_reduction)), loop=loop) as writer:
+        for image in frames:
+            writer.write(image)
+    if writer.frame_count == 0:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise Exception("没有读取到任何帧")
+    os.replace(tmp_path, output_path)
+    print(f"✅ PNG已保存: {output_path}")
+    return output_path
+
+
+def convert_mp4_to_loop(input_path: str, output_path: str, max_width: int = 480, crf: int = 28) -> str:
+    """
+    MP4 → 缩小后的 H.264 循环视频（无音轨，faststart，便于客户端边下边播）
+
+    有 ffmpeg 时用 libx264（crf 控制质量），否则用 OpenCV 编码（avc1 不可用时退回 mp4v）
+    """
+    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = f"{output_path}.part.mp4"
+    ffmpeg = find_ffmpeg()
+    if ffmpeg:
+        subprocess.run(
+            [ffmpeg, "-y", "-loglevel", "error", "-i", input_path, "-an",
+             "-vf", f"scale='min({max_width},iw)':-2",
+             "-c:v", "libx264", "-preset", "medium", "-crf", str(crf),
+             "-pix_fmt", "yuv420p", "-movflags", "+faststart", tmp_path],
+            check=True,
+        )
+    else:
+        fps, size, frames = _iter_frames(input_path, 1, max_width)
+        # 偶数尺寸（部分 H.264 解码器要求）
+        size = (size[0] - size[0] % 2, size[1] - size[1] % 2)
+        writer = None
+        for fourcc in ("avc1", "mp4v"):
+            writer = cv2.VideoWriter(tmp_path, cv2.VideoWriter_fourcc(*fourcc), fps, size)
+            if writer.isOpened():
+                break
+            writer.release()
+        if writer is None or not writer.isOpened():
+            raise Exception(f"无法创建输出视频文件: {output_path}")
+        try:
+            for image in frames:
+                frame = np.asarray(image)[:size[1], :size[0]]
+                writer.write(cv2.cvtColor(frame, cv2.COLOR_RGB2BGR))
+        finally:
+            writer.release()
+    os.replace(tmp_path, output_path)
+    print(f"✅ MP4循环视频已保存: {output_path}")
+    return output_path
+
+
+def convert_rendition(fmt: str, input_path: str, output_path: str, fps_reduction: int = 2,
+                      max_width: int = 480, quality: int = 75, **gif_options) -> str:
+    """
+    按格式转换（进程池的统一入口）
+
+    Args:
+        fmt: gif / webp / apng / mp4
+        gif_options: 传给 convert_mp4_to_gif 的其他参数（palette、dither）
+    """
+    if fmt == "gif":
+        return convert_mp4_to_gif(input_path, output_path, fps_reduction, max_width, **gif_options)
+    if fmt == "webp":
+        return convert_mp4_to_webp(input_path, output_path, fps_reduction, max_width, quality)
+    if fmt == "apng":
+        return convert_mp4_to_apng(input_path, output_path, fps_reduction, max_width)
+    if fmt == "mp4":
+        # quality 0~100 映射到 x264 的 crf 35~18
+        return convert_mp4_to_loop(input_path, output_path, max_width, crf=int(round(35 - quality * 0.17)))
+    raise ValueError(f"不支持的格式: {fmt}（可选 {list(RENDITION_FORMATS)}）")
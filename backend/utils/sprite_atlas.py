@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+精灵图集导出（客户端动画）
+Flutter 客户端每只宠物要下载 16 个 GIF，逐个请求、逐个解码。
+这里把所有过渡/循环视频的抽样帧打包进少数几张图集（WebP/PNG），并生成 JSON 清单：
+- sprites/atlas_0.webp ...  图集（同一动画的帧尽量放在同一张图集里）
+- sprites/manifest.json     每个动画的帧矩形（图集序号, x, y, w, h）和每帧时长
+客户端下载 1~2 张图集 + 清单，解码一次即可播放所有动画。
+"""
+
+import json
+import os
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from utils.video_probe import video_probe
+
+# 清单格式版本（字段变化时修改）
+MANIFEST_VERSION = 1
+# 帧之间的间隔（像素），避免客户端纹理采样时串到相邻帧
+ATLAS_PADDING = 2
+# 图集格式 → 扩展名
+ATLAS_FORMATS = {"webp": ".webp", "png": ".png"}
+
+
+def _frame_size(info: dict, max_frame_width: int) -> Tuple[int, int]:
+    width, height = info["width"], info["height"]
+    if max_frame_width > 0 and width > max_frame_width:
+        return max_frame_width, max(1, int(height * max_frame_width / width))
+    return width, height
+
+
+def _pack(animations: List[dict], max_size: int) -> List[Tuple[int, int]]:
+    """
+    货架式排布：帧从左到右排成行，行满换行，图集满换新图集；
+    当前图集剩余空间放不下整个动画、而新图集放得下时直接换新图集，同一动画不拆到两张图集里
+
+    每个动画写入 "placements": [(图集序号, x, y), ...]，返回每张图集实际使用的 (宽, 高)
+    """
+    cursors: List[List[int]] = []  # 每张图集的 [当前行已用宽度, 当前行顶部, 当前行高度]
+
+    def place(cursor: List[int], width: int, height: int):
+        x = cursor[0] + ATLAS_PADDING if cursor[0] else 0
+        if x + width > max_size:
+            cursor[1] += cursor[2] + ATLAS_PADDING
+            cursor[0], cursor[2], x = 0, 0, 0
+        if cursor[1] + height > max_size:
+            return None
+        cursor[0] = x + width
+        cursor[2] = max(cursor[2], height)
+        return x, cursor[1]
+
+    def fits(cursor: List[int], animation: dict) -> bool:
+        trial = list(cursor)
+        return all(place(trial, animation["width"], animation["height"]) for _ in range(animation["frame_count"]))
+
+    cursors.append([0, 0, 0])
+    for animation in animations:
+        width, height = animation["width"], animation["height"]
+        if width > max_size or height > max_size:
+            raise ValueError(f"帧尺寸 {width}x{height} 超过图集上限 {max_size}")
+        if not fits(cursors[-1], animation) and fits([0, 0, 0], animation):
+            cursors.append([0, 0, 0])
+        placements = []
+        for _ in range(animation["frame_count"]):
+            position = place(cursors[-1], width, height)
+            if position is None:
+                # 单个动画超过一张图集，拆到下一张
+                cursors.append([0, 0, 0])
+                position = place(cursors[-1], width, height)
+            placements.append((len(cursors) - 1, position[0], position[1]))
+        animation["placements"] = placements
+
+    sizes = [[0, 0] for _ in cursors]
+    for animation in animations:
+        for atlas, x, y in animation["placements"]:
+            sizes[atlas][0] = max(sizes[atlas][0], x + animation["width"])
+            sizes[atlas][1] = max(sizes[atlas][1], y + animation["height"])
+    return [tuple(size) for size in sizes]
+
+
+def _paste_frames(canvas: np.ndarray, atlas: int, animation: dict, frame_step: int) -> int:
+    """顺序解码视频，把属于该图集的抽样帧缩放后写入画布（只对抽样帧做颜色转换），返回写入帧数"""
+    targets = {i: placement for i, placement in enumerate(animation["placements"]) if placement[0] == atlas}
+    if not targets:
+        return 0
+    last_needed = max(targets) * frame_step
+    width, height = animation["width"], animation["height"]
+    cap = cv2.VideoCapture(animation["path"])
+    if not cap.isOpened():
+        raise Exception(f"无法打开视频: {animation['path']}")
+    written = 0
+    try:
+        index = 0
+        while index <= last_needed and cap.grab():
+            sample, remainder = divmod(index, frame_step)
+            if remainder == 0 and sample in targets:
+                ret, frame = cap.retrieve()
+                if not ret:
+                    break
+                if frame.shape[1] != width or frame.shape[0] != height:
+                    frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+                _, x, y = targets[sample]
+                canvas[y:y + height, x:x + width] = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+                written += 1
+            index += 1
+    finally:
+        cap.release()
+    return written
+
+
+def build_sprite_atlases(
+    videos: List[Tuple[str, str, str]],
+    output_dir: str,
+    frame_step: int = 3,
+    max_frame_width: int = 192,
+    max_atlas_size: int = 4096,
+    fmt: str = "webp",
+    quality: int = 80,
+) -> dict:
+    """
+    把多个视频的抽样帧打包成图集 + JSON 清单
+
+    Args:
+        videos: [(分类 transitions/loops, 动画名, 视频路径), ...]
+        output_dir: 输出目录（写入 atlas_N.<ext> 和 manifest.json，删除清单中没有的旧图集）
+        frame_step: 每隔几帧取一帧（24fps 视频取 3 即 8fps）
+        max_frame_width: 帧宽度上限（像素）
+        max_atlas_size: 图集宽高上限（像素，客户端纹理尺寸限制）
+        fmt: webp（有损，quality 生效）/ png（无损）
+        quality: WebP 质量 0~100
+
+    Returns:
+        清单内容（同 manifest.json），"manifest_path" 为清单文件路径
+    """
+    if fmt not in ATLAS_FORMATS:
+        raise ValueError(f"不支持的图集格式: {fmt}（可选 {list(ATLAS_FORMATS)}）")
+    frame_step = max(1, frame_step)
+
+    animations = []
+    for category, name, video_path in videos:
+        info = video_probe.probe(video_path)
+        frame_count = (info["total_frames"] + frame_step - 1) // frame_step
+        if frame_count <= 0:
+            print(f"  ⚠️  跳过没有帧的视频: {video_path}")
+            continue
+        width, height = _frame_size(info, max_frame_width)
+        animations.append({
+            "category": category,
+            "name": name,
+            "path": str(video_path),
+            "fps": info["fps"] / frame_step if info["fps"] > 0 else 0,
+            "width": width,
+            "height": height,
+            "frame_count": frame_count,
+        })
+    if not animations:
+        raise Exception("没有可打包的视频")
+
+    atlas_sizes = _pack(animations, max_atlas_size)
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    ext = ATLAS_FORMATS[fmt]
+
+    atlases = []
+    decoded: Dict[str, int] = {}
+    for atlas, (width, height) in enumerate(atlas_sizes):
+        # 逐张图集生成，同时只占用一张画布的内存
+        canvas = np.zeros((height, width, 3), dtype=np.uint8)
+        for animation in animations:
+            decoded[animation["path"]] = decoded.get(animation["path"], 0) + _paste_frames(canvas, atlas, animation, frame_step)
+        filename = f"atlas_{atlas}{ext}"
+        atlas_path = output_dir / filename
+        tmp_path = f"{atlas_path}.part"
+        if fmt == "webp":
+            Image.fromarray(canvas).save(tmp_path, format="WEBP", quality=quality, method=4)
+        else:
+            Image.fromarray(canvas).save(tmp_path, format="PNG", optimize=True)
+        os.replace(tmp_path, atlas_path)
+        del canvas
+        atlases.append({"file": filename, "width": width, "height": height, "size": atlas_path.stat().st_size})
+        print(f"  🧩 图集 {filename}: {width}x{height}, {atlases[-1]['size'] / 1024:.0f}KB")
+
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "format": fmt,
+        "frame_step": frame_step,
+        "atlases": atlases,
+        "animations": {"transitions": {}, "loops": {}},
+    }
+    for animation in animations:
+        # 实际解码到的帧数可能比探测的少（尾部损坏），清单只列出真正写入的帧
+        frame_count = min(animation["frame_count"], decoded[animation["path"]])
+        duration_ms = round(1000 / animation["fps"]) if animation["fps"] > 0 else 0
+        manifest["animations"].setdefault(animation["category"], {})[animation["name"]] = {
+            "fps": round(animation["fps"], 3),
+            "width": animation["width"],
+            "height": animation["height"],
+            "loop": animation["category"] == "loops",
+            "frames": [
+                {"atlas": atlas, "x": x, "y": y, "w": animation["width"], "h": animation["height"], "duration_ms": duration_ms}
+                for atlas, x, y in animation["placements"][:frame_count]
+            ],
+        }
+
+    manifest_path = output_dir / "manifest.json"
+    tmp_path = f"{manifest_path}.part"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+    # 清单替换后删除上次生成、本次不再使用的图集（图集数减少或换了格式时残留的 atlas_N）
+    current = {atlas["file"] for atlas in atlases}
+    for stale in output_dir.glob("atlas_*"):
+        if stale.name not in current:
+            stale.unlink(missing_ok=True)
+    return dict(manifest, manifest_path=str(manifest_path))
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+视频元数据探测缓存
+get_video_info、extract_frame、拼接/裁剪等每次都重新打开 MP4 读取 fps、尺寸和帧数，
+而 OpenCV 的 CAP_PROP_FRAME_COUNT 只是按时长估算的值。
+- MP4 直接解析容器：帧数为样本表中的实际样本数，关键帧来自 stss，不需要解码
+- 其他格式用 OpenCV 逐帧 grab 计数（只做一次）
+- 结果按 (路径, 文件大小, 修改时间) 缓存：进程内字典 + SQLite（output/video_probe.db，与 pet_motion_lab.db 同目录），
+  文件被重新生成后自动重新探测
+- 首帧/尾帧缩略图（JPEG）在第一次调用 thumbnails() 时才生成，生成后写回同一条缓存记录；
+  探测本身不解码（可灵视频整段只有一个 GOP，取尾帧需要解码整个文件）
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Tuple
+
+import cv2
+
+import config
+from utils.mp4_concat import Mp4ConcatError, probe_mp4
+
+# 探测结果格式版本（字段变化时修改，旧记录自动重新探测）
+PROBE_VERSION = 1
+# 缩略图宽度（像素）与 JPEG 质量
+THUMBNAIL_WIDTH = 320
+THUMBNAIL_QUALITY = 85
+# 进程内缓存最多保留的文件数（LRU）；数据库每写入这么多次清理一遍已删除文件的记录（打开数据库时也清理一次）
+MAX_MEMORY_ENTRIES = 1024
+PRUNE_EVERY_WRITES = 100
+
+
+def _probe_with_decoder(video_path: str) -> dict:
+    """非 MP4（或无法解析的 MP4）：OpenCV 读取属性，逐帧 grab 得到实际帧数"""
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise Exception(f"无法打开视频文件: {video_path}")
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    fourcc = int(cap.get(cv2.CAP_PROP_FOURCC))
+    total_frames = 0
+    while cap.grab():
+        total_frames += 1
+    cap.release()
+    return {
+        "fps": fps,
+        "width": width,
+        "height": height,
+        "total_frames": total_frames,
+        "duration": total_frames / fps if fps > 0 else 0,
+        "codec": "".join(chr((fourcc >> (8 * i)) & 0xFF) for i in range(4)).strip("\x00"),
+        "keyframes": [],
+    }
+
+
+def _encode_thumbnail(frame) -> bytes:
+    height, width = frame.shape[:2]
+    if width > THUMBNAIL_WIDTH:
+        frame = cv2.resize(frame, (THUMBNAIL_WIDTH, int(height * THUMBNAIL_WIDTH / width)), interpolation=cv2.INTER_AREA)
+    ok, buffer = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, THUMBNAIL_QUALITY])
+    if not ok:
+        raise Exception("缩略图编码失败")
+    return buffer.tobytes()
+
+
+def _read_thumbnails(video_path: str, info: dict) -> Tuple[bytes, bytes]:
+    """解码首帧和尾帧（已知关键帧时从最后一个关键帧开始解码，只需解码最后一个 GOP）"""
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise Exception(f"无法打开视频文件: {video_path}")
+    try:
+        ret, first = cap.read()
+        if not ret:
+            raise Exception(f"无法读取首帧: {video_path}")
+        last = first
+        last_index = info["total_frames"] - 1
+        if last_index > 0:
+            position = 1
+            if info["keyframes"] and info["keyframes"][-1] > position:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, info["keyframes"][-1])
+                position = info["keyframes"][-1]
+            # 帧数是实际值，grab 到尾帧之前一帧再 read（grab 失败后不能再 retrieve）
+            while position < last_index and cap.grab():
+                position += 1
+            ret, frame = cap.read()
+            if ret:
+                last = frame
+    finally:
+        cap.release()
+    return _encode_thumbnail(first), _encode_thumbnail(last)
+
+
+class VideoProbeCache:
+    """视频元数据缓存（线程安全；SQLite 不可用时只用进程内缓存）"""
+
+    def __init__(self, db_path: str = None):
+        self.db_path = Path(db_path or config.VIDEO_PROBE_DB)
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._db_failed = False
+        # {绝对路径: {"fingerprint": (大小, 修改时间ns), "info": dict, "thumbnails": (首帧, 尾帧) 或 None}}，按最近使用排序
+        self._memory: "OrderedDict[str, dict]" = OrderedDict()
+        self._writes = 0
+        self._stats = {"memory_hits": 0, "db_hits": 0, "probes": 0, "evicted": 0, "pruned_rows": 0}
+
+    # ==================== SQLite ====================
+
+    def _db(self) -> Optional[sqlite3.Connection]:
+        """持锁调用"""
+        if self._conn is None and not self._db_failed:
+            try:
+                self.db_path.parent.mkdir(parents=True, exist_ok=True)
+                conn = sqlite3.connect(str(self.db_path), check_same_thread=False, timeout=5)
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS video_probe (
+                        path TEXT PRIMARY KEY,
+                        size INTEGER NOT NULL,
+                        mtime_ns INTEGER NOT NULL,
+                        version INTEGER NOT NULL,
+                        info TEXT NOT NULL,
+                        first_thumbnail BLOB,
+                        last_thumbnail BLOB,
+                        probed_at REAL NOT NULL
+                    )
+                ''')
+                conn.commit()
+                self._conn = conn
+                self._prune_rows()
+            except sqlite3.Error as e:
+                self._db_failed = True
+                print(f"⚠️ 视频探测缓存数据库不可用，仅使用内存缓存: {e}")
+        return self._conn
+
+    def _load_row(self, path: str, fingerprint: tuple) -> Optional[dict]:
+        """持锁调用：读取与文件指纹一致的记录"""
+        conn = self._db()
+        if conn is None:
+            return None
+        try:
+            row = conn.execute(
+                "SELECT info, first_thumbnail, last_thumbnail FROM video_probe "
+                "WHERE path = ? AND size = ? AND mtime_ns = ? AND version = ?",
+                (path, fingerprint[0], fingerprint[1], PROBE_VERSION),
+            ).fetchone()
+        except sqlite3.Error as e:
+            print(f"⚠️ 读取视频探测缓存失败: {e}")
+            return None
+        if row is None:
+            return None
+        thumbnails = (row[1], row[2]) if row[1] is not None and row[2] is not None else None
+        return {"fingerprint": fingerprint, "info": json.loads(row[0]), "thumbnails": thumbnails}
+
+    def _save_row(self, path: str, entry: dict):
+        """持锁调用：写入（覆盖该路径的旧记录）"""
+        conn = self._db()
+        if conn is None:
+            return
+        thumbnails = entry["thumbnails"] or (None, None)
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO video_probe "
+                "(path, size, mtime_ns, version, info, first_thumbnail, last_thumbnail, probed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (path, entry["fingerprint"][0], entry["fingerprint"][1], PROBE_VERSION,
+                 json.dumps(entry["info"]), thumbnails[0], thumbnails[1], time.time()),
+            )
+            conn.commit()
+        except sqlite3.Error as e:
+            print(f"⚠️ 写入视频探测缓存失败: {e}")
+            return
+        self._writes += 1
+        if self._writes % PRUNE_EVERY_WRITES == 0:
+            self._prune_rows()
+
+    def _prune_rows(self):
+        """持锁调用：删除文件已不存在的记录（/info、/trim 的临时上传文件用完即删）"""
+        try:
+            paths = [row[0] for row in self._conn.execute("SELECT path FROM video_probe")]
+            missing = [(path,) for path in paths if not os.path.exists(path)]
+            if missing:
+                self._conn.executemany("DELETE FROM video_probe WHERE path = ?", missing)
+                self._conn.commit()
+                self._stats["pruned_rows"] += len(missing)
+        except sqlite3.Error as e:
+            print(f"⚠️ 清理视频探测缓存失败: {e}")
+
+    def _remember(self, path: str, entry: dict):
+        """持锁调用：放入进程内缓存，超出 MAX_MEMORY_ENTRIES 时淘汰最久未使用的"""
+        self._memory[path] = entry
+        self._memory.move_to_end(path)
+        while len(self._memory) > MAX_MEMORY_ENTRIES:
+            self._memory.popitem(last=False)
+            self._stats["evicted"] += 1
+
+    # ==================== 查询 ====================
+
+    def _entry(self, video_path: str) -> Tuple[str, dict]:
+        """当前文件对应的缓存条目（指纹不一致或没有记录时重新探测）"""
+        path = os.path.abspath(video_path)
+        stat = os.stat(path)
+        fingerprint = (stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            entry = self._memory.get(path)
+            if entry is not None and entry["fingerprint"] == fingerprint:
+                self._stats["memory_hits"] += 1
+                self._memory.move_to_end(path)
+                return path, entry
+            entry = self._load_row(path, fingerprint)
+            if entry is not None:
+                self._stats["db_hits"] += 1
+                self._remember(path, entry)
+                return path, entry
+
+        try:
+            info = probe_mp4(path)
+        except Mp4ConcatError:
+            info = _probe_with_decoder(path)
+        entry = {"fingerprint": fingerprint, "info": info, "thumbnails": None}
+        with self._lock:
+            self._stats["probes"] += 1
+            self._remember(path, entry)
+            self._save_row(path, entry)
+        return path, entry
+
+    def probe(self, video_path: str) -> dict:
+        """
+        视频元数据
+
+        Returns:
+            {"fps", "width", "height", "total_frames"（实际帧数）, "duration", "codec", "keyframes"（关键帧的帧序号，未知时为空）}
+
+        Raises:
+            FileNotFoundError: 文件不存在
+        """
+        _, entry = self._entry(video_path)
+        return dict(entry["info"])
+
+    def thumbnails(self, video_path: str) -> Tuple[bytes, bytes]:
+        """首帧和尾帧缩略图（JPEG 字节，宽度不超过 THUMBNAIL_WIDTH；第一次调用时解码生成并缓存）"""
+        path, entry = self._entry(video_path)
+        if entry["thumbnails"] is None:
+            thumbnails = _read_thumbnails(path, entry["info"])
+            with self._lock:
+                entry["thumbnails"] = thumbnails
+                if self._memory.get(path) is entry:
+                    self._save_row(path, entry)
+        return entry["thumbnails"]
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats, cached=len(self._memory), db_path=str(self.db_path))
+
+
+# 全局实例
+video_probe = VideoProbeCache()
@@ -4,12 +4,37 @@
 封装视频帧提取、转换等功能
 """
 
+import bisect
 import cv2
 import os
+import queue
+import tempfile
+import threading
+from collections import deque
 from pathlib import Path
+from typing import Dict, Iterable, Union
 from PIL import Image
 import numpy as np
 
+from utils.gif_writer import GifWriter
+from utils.gif_palette import PaletteQuantizer
+from utils.mp4_concat import Mp4ConcatError, concat_mp4, read_video_samples, splice_mp4
+from utils.video_probe import video_probe
+
+# 视频倒放的默认帧缓冲内存预算（MB），超出时借助临时文件分块倒序
+REVERSE_MEMORY_BUDGET_MB = 64
+# 全局调色板 GIF：生成调色板时均匀抽样的帧数
+GIF_PALETTE_SAMPLE_FRAMES = 8
+# 提取末尾帧时，头部记录帧数之前额外保留的帧数（头部帧数可能比实际可解码的多几帧）
+TAIL_FRAME_MARGIN = 8
+# 重新编码拼接时解码线程最多预读的帧数
+CONCAT_PREFETCH_FRAMES = 32
+# 按 GOP 裁剪时，首尾片段按原视频的样本描述类型选择 OpenCV 编码器
+GOP_TRIM_ENCODERS = {"mp4v": "mp4v", "avc1": "avc1", "avc3": "avc1", "hvc1": "hvc1", "hev1": "hvc1"}
+
+# OpenCV 各编码器是否可用（首次使用时试写一个小文件探测，结果在进程内缓存）
+_encoder_available: Dict[str, bool] = {}
+
 
 def extract_frame(video_path: str, frame_index: int = -1, output_path: str = None) -> np.ndarray:
     """
@@ -26,12 +51,8 @@ def extract_frame(video_path: str, frame_index: int = -1, output_path: str = Non
     if not os.path.exists(video_path):
         raise FileNotFoundError(f"视频文件不存在: {video_path}")
     
-    cap = cv2.VideoCapture(video_path)
-    
-    if not cap.isOpened():
-        raise Exception(f"无法打开视频文件: {video_path}")
-    
-    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    # 实际帧数（探测缓存，头部记录的帧数可能偏大）
+    total_frames = video_probe.probe(video_path)["total_frames"]
     
     # 处理负索引
     if frame_index < 0:
@@ -39,9 +60,13 @@ def extract_frame(video_path: str, frame_index: int = -1, output_path: str = Non
     
     # 验证帧索引
     if frame_index < 0 or frame_index >= total_frames:
-        cap.release()
         raise ValueError(f"帧索引超出范围: {frame_index}（总帧数: {total_frames}）")
     
+    cap = cv2.VideoCapture(video_path)
+    
+    if not cap.isOpened():
+        raise Exception(f"无法打开视频文件: {video_path}")
+    
     # 跳转到指定帧
     cap.set(cv2.CAP_PROP_POS_FRAMES, frame_index)
     
@@ -61,64 +86,215 @@ def extract_frame(video_path: str, frame_index: int = -1, output_path: str = Non
     return frame
 
 
+def extract_frames(
+    video_path: str,
+    indices: Iterable[int] = (),
+    outputs: Dict[int, Union[str, Iterable[str]]] = None,
+    evenly_spaced: int = 0,
+    _tail_from: int = None,
+) -> Dict[int, np.ndarray]:
+    """
+    一次顺序解码提取多帧（首帧、尾帧、均匀间隔帧），可选同时写出图片
+
+    不使用 CAP_PROP_POS_FRAMES 跳帧：mp4 的跳帧慢且可能不准，头部记录的帧数也可能比实际可解码的多，
+    负索引按实际解码到的帧数计算，-1 一定是最后一个可解码的帧。
+
+    Args:
+        video_path: 视频文件路径
+        indices: 帧索引（负数从末尾算，-1 为最后一帧）
+        outputs: {帧索引: 输出路径或路径列表}，同一帧可写多个文件（索引自动加入 indices）
+        evenly_spaced: 额外提取 N 个均匀间隔的帧（含首尾，按头部帧数计算，超出实际帧数的取最后一帧）
+
+    Returns:
+        {帧索引: 帧}，indices/outputs 中的帧以传入的索引为键，均匀间隔帧以实际索引为键
+    """
+    if not os.path.exists(video_path):
+        raise FileNotFoundError(f"视频文件不存在: {video_path}")
+
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise Exception(f"无法打开视频文件: {video_path}")
+
+    outputs = {index: [paths] if isinstance(paths, str) else list(paths) for index, paths in (outputs or {}).items()}
+    requested = set(indices) | set(outputs)
+    header_total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    spaced = set()
+    if evenly_spaced > 0 and header_total > 0:
+        if evenly_spaced == 1:
+            spaced = {0}
+        else:
+            spaced = {round(i * (header_total - 1) / (evenly_spaced - 1)) for i in range(evenly_spaced)}
+
+    forward = {i for i in requested if i >= 0} | spaced
+    # 负索引需要保留最后若干帧；均匀间隔帧可能超出实际帧数，至少保留最后一帧
+    tail_size = max([-i for i in requested if i < 0] + [1 if spaced else 0])
+    tail = deque(maxlen=tail_size) if tail_size else None
+    last_needed = max(forward, default=-1)
+    # 只对头部帧数附近的帧做颜色转换（grab 只解码不转换），头部帧数严重偏大时回退为全部转换
+    if _tail_from is None:
+        _tail_from = max(0, header_total - tail_size - TAIL_FRAME_MARGIN)
+
+    frames: Dict[int, np.ndarray] = {}
+    count = 0
+    try:
+        while True:
+            if tail is None and count > last_needed:
+                break
+            if not cap.grab():
+                break
+            in_tail = tail is not None and count >= _tail_from
+            if count in forward or in_tail:
+                ret, frame = cap.retrieve()
+                if not ret:
+                    break
+                if count in forward:
+                    frames[count] = frame
+                if in_tail:
+                    tail.append(frame)
+            count += 1
+    finally:
+        cap.release()
+
+    if count == 0:
+        raise Exception(f"视频没有可读取的帧: {video_path}")
+    if tail is not None and _tail_from > 0 and count - _tail_from < tail_size:
+        # 实际帧数比头部记录少太多，末尾窗口没覆盖到，重新解码一遍
+        return extract_frames(video_path, requested, outputs, evenly_spaced, _tail_from=0)
+
+    result: Dict[int, np.ndarray] = {}
+    for index in requested:
+        if index < 0:
+            if -index > count:
+                raise ValueError(f"帧索引超出范围: {index}（实际帧数: {count}）")
+            result[index] = tail[index]
+        elif index in frames:
+            result[index] = frames[index]
+        else:
+            raise ValueError(f"帧索引超出范围: {index}（实际帧数: {count}）")
+    for index in spaced:
+        if index in frames:
+            result[index] = frames[index]
+        else:
+            result[count - 1] = tail[-1]
+
+    for index, paths in outputs.items():
+        for output_path in paths:
+            Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+            cv2.imwrite(output_path, result[index])
+            print(f"✅ 帧已保存: {output_path}")
+
+    return result
+
+
 def extract_first_frame(video_path: str, output_path: str) -> str:
     """提取视频第一帧"""
-    extract_frame(video_path, frame_index=0, output_path=output_path)
+    extract_frames(video_path, outputs={0: output_path})
     return output_path
 
 
 def extract_last_frame(video_path: str, output_path: str) -> str:
-    """提取视频最后一帧"""
-    extract_frame(video_path, frame_index=-1, output_path=output_path)
+    """提取视频最后一帧（实际可解码的最后一帧）"""
+    extract_frames(video_path, outputs={-1: output_path})
     return output_path
 
 
 def get_video_info(video_path: str) -> dict:
     """
-    获取视频信息
+    获取视频信息（来自探测缓存，文件未变化时不重新打开视频）
     
     Returns:
-        包含fps, width, height, total_frames, duration的字典
+        包含fps, width, height, total_frames（实际帧数）, duration, codec的字典
     """
     if not os.path.exists(video_path):
         raise FileNotFoundError(f"视频文件不存在: {video_path}")
     
-    cap = cv2.VideoCapture(video_path)
-    
-    if not cap.isOpened():
-        raise Exception(f"无法打开视频文件: {video_path}")
-    
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    duration = total_frames / fps if fps > 0 else 0
-    
-    cap.release()
+    info = video_probe.probe(video_path)
     
     return {
-        "fps": fps,
-        "width": width,
-        "height": height,
-        "total_frames": total_frames,
-        "duration": duration,
+        "fps": info["fps"],
+        "width": info["width"],
+        "height": info["height"],
+        "total_frames": info["total_frames"],
+        "duration": info["duration"],
+        "codec": info["codec"],
     }
 
 
+def sample_frames(video_path: str, indices: Iterable[int]) -> Dict[int, np.ndarray]:
+    """
+    一次解码按顺序提取任意多帧（拖动条缩略图、联系表）
+
+    利用探测缓存中的关键帧索引：下一个目标帧所在 GOP 的关键帧在当前解码位置之后时直接跳到该关键帧，
+    中间的 GOP 不解码；同一 GOP 内的目标帧顺序 grab，只对目标帧做颜色转换。
+    没有关键帧信息（非 MP4）时从头顺序解码。
+
+    Args:
+        video_path: 视频文件路径
+        indices: 帧索引（0 ~ 实际帧数-1）
+
+    Returns:
+        {帧索引: 帧}
+    """
+    if not os.path.exists(video_path):
+        raise FileNotFoundError(f"视频文件不存在: {video_path}")
+
+    info = video_probe.probe(video_path)
+    targets = sorted(set(indices))
+    for index in targets:
+        if index < 0 or index >= info["total_frames"]:
+            raise ValueError(f"帧索引超出范围: {index}（实际帧数: {info['total_frames']}）")
+    keyframes = info["keyframes"]
+
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise Exception(f"无法打开视频文件: {video_path}")
+
+    frames: Dict[int, np.ndarray] = {}
+    position = 0
+    try:
+        for index in targets:
+            slot = bisect.bisect_right(keyframes, index) - 1
+            if slot >= 0 and keyframes[slot] > position:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, keyframes[slot])
+                position = keyframes[slot]
+            while position < index and cap.grab():
+                position += 1
+            if position < index or not cap.grab():
+                break
+            position += 1
+            ret, frame = cap.retrieve()
+            if not ret:
+                break
+            frames[index] = frame
+    finally:
+        cap.release()
+
+    if len(frames) < len(targets):
+        missing = [index for index in targets if index not in frames]
+        raise Exception(f"无法读取第 {missing[0]} 帧: {video_path}")
+    return frames
+
+
 def convert_mp4_to_gif(
     input_path: str,
     output_path: str,
     fps_reduction: int = 2,
-    max_width: int = 480
+    max_width: int = 480,
+    palette: str = "per_frame",
+    loop: int = 0,
+    dither: bool = False,
 ) -> str:
     """
-    将MP4转换为GIF
+    将MP4转换为GIF（边解码边写入，内存占用与视频长度无关）
     
     Args:
         input_path: 输入MP4路径
         output_path: 输出GIF路径
         fps_reduction: 帧率缩减倍数
         max_width: GIF最大宽度
+        palette: "per_frame" 每帧独立调色板（PIL）/ "global" 抽样帧中位切分的全局调色板 + 查找表（见 utils.gif_palette）
+        loop: 循环次数（0 表示无限循环）
+        dither: 全局调色板时使用 Bayer 有序抖动
     
     Returns:
         输出GIF路径
@@ -142,50 +318,67 @@ def convert_mp4_to_gif(
         new_height = height
         scale_factor = 1.0
     
-    # 读取帧
-    frames = []
+    # 计算GIF帧间隔
+    gif_fps = fps / fps_reduction
+    frame_duration = int(1000 / gif_fps)
+    
+    # 全局调色板：先从均匀抽样的几帧生成（帧间颜色一致，循环视频不闪烁）
+    quantizer = None
+    if palette == "global":
+        samples = extract_frames(input_path, evenly_spaced=GIF_PALETTE_SAMPLE_FRAMES)
+        # 255 色，索引 255 留作“与上一帧相同”的透明像素
+        quantizer = PaletteQuantizer.from_frames(
+            [cv2.resize(cv2.cvtColor(f, cv2.COLOR_BGR2RGB), (new_width, new_height)) for f in samples.values()],
+            colors=255,
+            dither=dither,
+        )
+        palette_values = quantizer.palette_bytes()
+    
+    # 先写临时文件，完成后再改名（避免半成品GIF被读取）
+    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = f"{output_path}.part"
+    writer = GifWriter(tmp_path, new_width, new_height, frame_duration, loop=loop, palette=palette,
+                       transparent_index=255 if quantizer is not None else None)
     frame_count = 0
     
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-        
-        # 跳帧
-        if frame_count % fps_reduction == 0:
-            # BGR转RGB
-            frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    try:
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
             
-            # 缩放
-            if scale_factor != 1.0:
-                frame_rgb = cv2.resize(frame_rgb, (new_width, new_height))
+            # 跳帧
+            if frame_count % fps_reduction == 0:
+                # BGR转RGB
+                frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+                
+                # 缩放
+                if scale_factor != 1.0:
+                    frame_rgb = cv2.resize(frame_rgb, (new_width, new_height))
+                
+                if quantizer is not None:
+                    indexed = Image.fromarray(quantizer.quantize(frame_rgb), "P")
+                    indexed.putpalette(palette_values)
+                    writer.write(indexed)
+                else:
+                    writer.write(frame_rgb)
             
-            # 转PIL Image
-            pil_image = Image.fromarray(frame_rgb)
-            frames.append(pil_image)
-        
-        frame_count += 1
-    
-    cap.release()
+            frame_count += 1
+    except BaseException:
+        writer.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    finally:
+        cap.release()
+        writer.close()
     
-    if not frames:
+    if writer.frame_count == 0:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
         raise Exception("没有读取到任何帧")
     
-    # 计算GIF帧间隔
-    gif_fps = fps / fps_reduction
-    frame_duration = int(1000 / gif_fps)
-    
-    # 保存GIF
-    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
-    frames[0].save(
-        output_path,
-        save_all=True,
-        append_images=frames[1:],
-        duration=frame_duration,
-        loop=0,
-        optimize=True
-    )
-    
+    os.replace(tmp_path, output_path)
     print(f"✅ GIF已保存: {output_path}")
     return output_path
 
@@ -194,16 +387,22 @@ def trim_video(
     input_path: str,
     output_path: str,
     start_frame: int = 0,
-    end_frame: int = None
+    end_frame: int = None,
+    stream_copy: bool = True
 ) -> str:
     """
     裁剪视频的首尾帧
 
+    范围内完整的 GOP（关键帧到下一个关键帧）原样复制，只重新编码首尾不完整的 GOP，
+    耗时取决于 GOP 大小而不是裁剪长度；无法按 GOP 复制（整段只有一个 GOP、开放 GOP、含音轨、
+    没有同格式编码器、重新编码的片段编码参数与原视频不同等）时回退为整段解码重新编码。
+
     Args:
         input_path: 输入视频路径
         output_path: 输出视频路径
         start_frame: 起始帧索引（包含，默认0）
         end_frame: 结束帧索引（包含，None表示到最后一帧）
+        stream_copy: 是否优先复制完整 GOP（默认True）
 
     Returns:
         输出视频路径
@@ -211,16 +410,8 @@ def trim_video(
     if not os.path.exists(input_path):
         raise FileNotFoundError(f"视频文件不存在: {input_path}")
 
-    cap = cv2.VideoCapture(input_path)
-
-    if not cap.isOpened():
-        raise Exception(f"无法打开视频: {input_path}")
-
-    # 获取视频信息
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    info = get_video_info(input_path)
+    total_frames = info["total_frames"]
 
     # 处理结束帧
     if end_frame is None:
@@ -228,133 +419,461 @@ def trim_video(
 
     # 验证帧范围
     if start_frame < 0 or start_frame >= total_frames:
-        cap.release()
         raise ValueError(f"起始帧超出范围: {start_frame}（总帧数: {total_frames}）")
 
     if end_frame < start_frame or end_frame >= total_frames:
-        cap.release()
         raise ValueError(f"结束帧超出范围: {end_frame}（总帧数: {total_frames}）")
 
     # 创建输出目录
     Path(output_path).parent.mkdir(parents=True, exist_ok=True)
 
-    # 创建视频写入器
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-    out = cv2.VideoWriter(output_path, fourcc, fps, (width, height))
+    if stream_copy:
+        try:
+            copied, encoded = _trim_copy_gops(input_path, output_path, start_frame, end_frame, info)
+            print(f"✅ 视频已裁剪: {output_path}")
+            print(f"   原始帧数: {total_frames}, 裁剪后帧数: {copied + encoded}（复制 {copied} 帧，重新编码 {encoded} 帧）")
+            print(f"   裁剪范围: 第 {start_frame} 帧 到 第 {end_frame} 帧")
+            return output_path
+        except Mp4ConcatError as e:
+            print(f"⚠️  无法按 GOP 复制，改为重新编码: {e}")
 
-    # 跳转到起始帧
-    cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+    frames_written = _encode_frame_range(input_path, output_path, start_frame, end_frame, info, "mp4v")
 
-    # 读取并写入帧
-    current_frame = start_frame
-    frames_written = 0
+    print(f"✅ 视频已裁剪: {output_path}")
+    print(f"   原始帧数: {total_frames}, 裁剪后帧数: {frames_written}")
+    print(f"   裁剪范围: 第 {start_frame} 帧 到 第 {end_frame} 帧")
 
-    while current_frame <= end_frame:
+    return output_path
+
+
+def _encode_frame_range(input_path: str, output_path: str, first: int, last: int, info: dict, fourcc: str) -> int:
+    """解码第 first~last 帧（包含）并重新编码，返回写入的帧数"""
+    out = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*fourcc), info["fps"], (info["width"], info["height"]))
+    if not out.isOpened():
+        out.release()
+        raise Mp4ConcatError(f"无法创建 {fourcc} 编码的视频文件: {output_path}")
+
+    cap = cv2.VideoCapture(input_path)
+    if not cap.isOpened():
+        out.release()
+        raise Exception(f"无法打开视频: {input_path}")
+
+    # 跳转到起始帧（解码器从之前的关键帧开始解码，最多多解码一个 GOP）
+    cap.set(cv2.CAP_PROP_POS_FRAMES, first)
+    frames_written = 0
+    while first + frames_written <= last:
         ret, frame = cap.read()
         if not ret:
             break
-
         out.write(frame)
         frames_written += 1
-        current_frame += 1
 
     cap.release()
     out.release()
+    return frames_written
 
-    print(f"✅ 视频已裁剪: {output_path}")
-    print(f"   原始帧数: {total_frames}, 裁剪后帧数: {frames_written}")
-    print(f"   裁剪范围: 第 {start_frame} 帧 到 第 {end_frame} 帧")
 
-    return output_path
+def _video_encoder_available(fourcc: str) -> bool:
+    """OpenCV 能否用该编码器写 MP4（常见的 opencv-python 发行版没有 avc1/hvc1 编码器）"""
+    if fourcc not in _encoder_available:
+        with tempfile.TemporaryDirectory(prefix="encoder_probe_") as tmp_dir:
+            out = cv2.VideoWriter(os.path.join(tmp_dir, "probe.mp4"), cv2.VideoWriter_fourcc(*fourcc), 24, (64, 64))
+            available = out.isOpened()
+            if available:
+                out.write(np.zeros((64, 64, 3), dtype=np.uint8))
+            out.release()
+        _encoder_available[fourcc] = available
+        if not available:
+            print(f"⚠️  OpenCV 没有 {fourcc} 编码器，{fourcc} 视频裁剪到 GOP 中间时只能整段重新编码")
+    return _encoder_available[fourcc]
+
+
+def _trim_copy_gops(input_path: str, output_path: str, start_frame: int, end_frame: int, info: dict):
+    """
+    复制范围内完整的 GOP，首尾不完整的 GOP 用与原视频相同的编码格式重新编码后拼接
+
+    重新编码的片段只有在样本描述（SPS/PPS 等编码参数）与原视频完全一致时才能拼接：
+    同一轨道里写多个不同参数集的样本描述条目，很多播放器（浏览器、移动端）不会切换解码器配置。
+    可灵生成的视频通常整段只有一个 GOP、且是 H.264，这种情况在解码前就判断出来直接回退。
+
+    Returns:
+        (复制的帧数, 重新编码的帧数)
+
+    Raises:
+        Mp4ConcatError: 无法按 GOP 复制
+    """
+    layout = read_video_samples(input_path)
+    presentation = layout["presentation"]
+    keyframes = layout["keyframes"]
+    if not keyframes or keyframes[0] != 0:
+        raise Mp4ConcatError("第一帧不是关键帧")
+    if end_frame >= layout["count"]:
+        raise Mp4ConcatError(f"样本数 {layout['count']} 少于头部记录的帧数")
+    if len(keyframes) == 1 and (start_frame > 0 or end_frame < layout["count"] - 1):
+        raise Mp4ConcatError("整段视频只有一个 GOP")
+
+    # 每个 GOP（解码顺序 [关键帧, 下一个关键帧)）需对应一段连续的显示帧（闭合 GOP），否则不能单独复制
+    gops = []
+    for begin, stop in zip(keyframes, keyframes[1:] + [layout["count"]]):
+        shown = presentation[begin:stop]
+        low, high = int(shown.min()), int(shown.max())
+        if high - low + 1 != stop - begin or (gops and low != gops[-1][3] + 1):
+            raise Mp4ConcatError("视频使用开放 GOP")
+        gops.append((begin, stop, low, high))
+
+    inner = [gop for gop in gops if gop[2] >= start_frame and gop[3] <= end_frame]
+    if not inner:
+        raise Mp4ConcatError("裁剪范围内没有完整的 GOP")
+    copy_first, copy_stop = inner[0][0], inner[-1][1]
+    head = (start_frame, inner[0][2] - 1)
+    tail = (inner[-1][3] + 1, end_frame)
+
+    if head[1] >= head[0] or tail[1] >= tail[0]:
+        fourcc = GOP_TRIM_ENCODERS.get(layout["codec"])
+        if fourcc is None:
+            raise Mp4ConcatError(f"不支持重新编码 {layout['codec']} 片段")
+        if not _video_encoder_available(fourcc):
+            raise Mp4ConcatError(f"没有 {fourcc} 编码器")
+
+    encoded = 0
+    with tempfile.TemporaryDirectory(prefix="trim_") as tmp_dir:
+        segments = []
+        for name, (first, last) in (("head", head), ("tail", tail)):
+            if last < first:
+                continue
+            segment_path = os.path.join(tmp_dir, f"{name}.mp4")
+            written = _encode_frame_range(input_path, segment_path, first, last, info, fourcc)
+            if written != last - first + 1:
+                raise Mp4ConcatError(f"第 {first}~{last} 帧解码失败")
+            encoded += written
+            segments.append((name, segment_path))
+        parts = dict(segments)
+        # 编码参数与原视频不一致时 splice_mp4 抛出 Mp4ConcatError，回退为整段重新编码
+        splice_mp4(
+            ([(parts["head"], None)] if "head" in parts else [])
+            + [(input_path, (copy_first, copy_stop))]
+            + ([(parts["tail"], None)] if "tail" in parts else []),
+            output_path,
+        )
+    return copy_stop - copy_first, encoded
 
 
 def concatenate_videos(
     video_paths: list,
     output_path: str,
-    resize_to_first: bool = True
+    resize_to_first: bool = True,
+    stream_copy: bool = True
 ) -> str:
     """
     拼接多个视频文件
-    
+
+    编码参数（编码器、分辨率、时间基）一致时直接拼接 MP4 容器，样本数据原样复制，不解码不重编码；
+    不一致（或不是可解析的 MP4）时回退为解码 + mp4v 重新编码，解码在后台线程预读，与编码流水并行。
+
     Args:
         video_paths: 视频文件路径列表（按顺序）
         output_path: 输出视频路径
-        resize_to_first: 是否将所有视频调整为第一个视频的尺寸（默认True）
-    
+        resize_to_first: 是否将所有视频调整为第一个视频的尺寸（默认True，仅重新编码时有效）
+        stream_copy: 是否优先无重编码拼接（默认True）
+
     Returns:
         输出视频路径
     """
     if not video_paths:
         raise ValueError("视频路径列表不能为空")
-    
+
     # 检查所有视频文件是否存在
     for video_path in video_paths:
         if not os.path.exists(video_path):
             raise FileNotFoundError(f"视频文件不存在: {video_path}")
-    
-    # 获取第一个视频的信息作为参考
-    first_cap = cv2.VideoCapture(video_paths[0])
-    if not first_cap.isOpened():
-        raise Exception(f"无法打开第一个视频: {video_paths[0]}")
-    
-    fps = first_cap.get(cv2.CAP_PROP_FPS)
-    width = int(first_cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    height = int(first_cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    first_cap.release()
-    
+
     # 创建输出目录
     Path(output_path).parent.mkdir(parents=True, exist_ok=True)
-    
+
+    if stream_copy:
+        try:
+            concat_mp4(video_paths, output_path)
+            print(f"\n✅ 视频拼接完成（无重编码）: {output_path}")
+            print(f"   总视频数: {len(video_paths)}")
+            return output_path
+        except Mp4ConcatError as e:
+            print(f"⚠️  无法直接拼接，改为重新编码: {e}")
+
+    return _concatenate_reencode(video_paths, output_path, resize_to_first)
+
+
+def _concatenate_reencode(video_paths: list, output_path: str, resize_to_first: bool) -> str:
+    """解码后逐帧重新编码拼接（后台线程预读解码，主线程编码）"""
+    # 获取第一个视频的信息作为参考
+    first_info = get_video_info(video_paths[0])
+    fps, width, height = first_info["fps"], first_info["width"], first_info["height"]
+
     # 创建视频写入器
     fourcc = cv2.VideoWriter_fourcc(*'mp4v')
     out = cv2.VideoWriter(output_path, fourcc, fps, (width, height))
-    
+
     if not out.isOpened():
         raise Exception(f"无法创建输出视频文件: {output_path}")
-    
+
+    frames = queue.Queue(maxsize=CONCAT_PREFETCH_FRAMES)
+    stop = threading.Event()
+
+    def decode():
+        # OpenCV 解码/编码时释放 GIL，解码线程与主线程的编码可以同时进行
+        try:
+            for i, video_path in enumerate(video_paths):
+                print(f"📹 处理视频 {i+1}/{len(video_paths)}: {Path(video_path).name}")
+
+                cap = cv2.VideoCapture(video_path)
+                if not cap.isOpened():
+                    print(f"⚠️  警告: 无法打开视频 {video_path}，跳过")
+                    cap.release()
+                    continue
+
+                video_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+                video_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+                print(f"   尺寸: {video_width}x{video_height}, FPS: {cap.get(cv2.CAP_PROP_FPS):.2f}, "
+                      f"帧数: {int(cap.get(cv2.CAP_PROP_FRAME_COUNT))}")
+
+                while not stop.is_set():
+                    ret, frame = cap.read()
+                    if not ret:
+                        break
+                    # 如果需要调整尺寸
+                    if resize_to_first and (video_width != width or video_height != height):
+                        frame = cv2.resize(frame, (width, height))
+                    frames.put(frame)
+                cap.release()
+        finally:
+            frames.put(None)
+
+    decoder = threading.Thread(target=decode, daemon=True)
+    decoder.start()
     total_frames = 0
-    
-    # 逐个处理每个视频
-    for i, video_path in enumerate(video_paths):
-        print(f"📹 处理视频 {i+1}/{len(video_paths)}: {Path(video_path).name}")
-        
-        cap = cv2.VideoCapture(video_path)
-        if not cap.isOpened():
-            print(f"⚠️  警告: 无法打开视频 {video_path}，跳过")
-            cap.release()
-            continue
-        
-        video_fps = cap.get(cv2.CAP_PROP_FPS)
-        video_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        video_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        video_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        
-        print(f"   尺寸: {video_width}x{video_height}, FPS: {video_fps:.2f}, 帧数: {video_frames}")
-        
-        frame_count = 0
-        
+    try:
         while True:
-            ret, frame = cap.read()
-            if not ret:
+            frame = frames.get()
+            if frame is None:
                 break
-            
-            # 如果需要调整尺寸
-            if resize_to_first and (video_width != width or video_height != height):
-                frame = cv2.resize(frame, (width, height))
-            
             out.write(frame)
-            frame_count += 1
             total_frames += 1
-        
-        cap.release()
-        print(f"   ✅ 已写入 {frame_count} 帧")
-    
-    out.release()
-    
+    finally:
+        stop.set()
+        while decoder.is_alive():
+            # 主线程异常退出时清空队列，让解码线程结束
+            try:
+                frames.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        out.release()
+
     print(f"\n✅ 视频拼接完成: {output_path}")
     print(f"   总视频数: {len(video_paths)}")
     print(f"   总帧数: {total_frames}")
     print(f"   输出尺寸: {width}x{height}, FPS: {fps:.2f}")
-    
+
+    return output_path
+
+
+def reverse_video(input_path: str, output_path: str, memory_budget_mb: float = REVERSE_MEMORY_BUDGET_MB) -> str:
+    """
+    视频倒放（用于由单向过渡视频本地生成反向过渡，如 sit2walk → walk2sit）
+
+    解码后的帧总大小不超过内存预算时直接在内存中倒序；否则顺序解码写入临时原始帧文件，
+    再按预算大小的块从文件末尾往前读回写出，峰值内存与视频长度/分辨率无关。
+    （1080p 每帧约 6MB，5秒 pro 模式视频全部读入内存约 900MB）
+
+    Args:
+        input_path: 输入视频路径
+        output_path: 输出视频路径
+        memory_budget_mb: 帧缓冲的内存预算（MB），至少保留一帧
+
+    Returns:
+        输出视频路径
+    """
+    if not os.path.exists(input_path):
+        raise FileNotFoundError(f"视频文件不存在: {input_path}")
+
+    cap = cv2.VideoCapture(input_path)
+    if not cap.isOpened():
+        raise Exception(f"无法打开视频: {input_path}")
+
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    # 实际帧数（CAP_PROP_FRAME_COUNT 按时长估算，偏小时会把超出预算的视频整段读进内存）
+    total_frames = video_probe.probe(input_path)["total_frames"]
+    frame_bytes = width * height * 3
+    budget_frames = max(1, int(memory_budget_mb * 1024 * 1024 // max(frame_bytes, 1)))
+
+    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+    out = cv2.VideoWriter(output_path, fourcc, fps, (width, height))
+    if not out.isOpened():
+        cap.release()
+        raise Exception(f"无法创建输出视频文件: {output_path}")
+
+    try:
+        if 0 < total_frames <= budget_frames:
+            # 小视频：直接在内存中倒序
+            frames = []
+            while True:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                frames.append(frame)
+            for frame in reversed(frames):
+                out.write(frame)
+            frame_count = len(frames)
+            mode = "内存"
+        else:
+            frame_count = _reverse_via_spill_file(cap, out, (height, width, 3), budget_frames, output_path)
+            mode = f"临时文件，每块 {budget_frames} 帧"
+    finally:
+        cap.release()
+        out.release()
+
+    if frame_count == 0:
+        os.remove(output_path)
+        raise Exception(f"视频没有可读取的帧: {input_path}")
+
+    print(f"✅ 视频已倒放: {output_path}（{frame_count} 帧，{mode}）")
     return output_path
 
+
+def _reverse_via_spill_file(cap, out, shape: tuple, chunk_frames: int, output_path: str) -> int:
+    """顺序解码写入原始帧文件，再按块从后往前读回倒序写出，返回帧数"""
+    frame_bytes = shape[0] * shape[1] * shape[2]
+    fd, spill_path = tempfile.mkstemp(suffix=".frames", dir=str(Path(output_path).parent))
+    try:
+        with os.fdopen(fd, "w+b") as spill:
+            frame_count = 0
+            while True:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                if frame.shape != shape:
+                    frame = cv2.resize(frame, (shape[1], shape[0]))
+                spill.write(np.ascontiguousarray(frame).data)
+                frame_count += 1
+
+            # 复用同一块缓冲区，峰值内存 ≈ chunk_frames 帧
+            buffer = np.empty((chunk_frames,) + shape, dtype=np.uint8)
+            end = frame_count
+            while end > 0:
+                start = max(0, end - chunk_frames)
+                count = end - start
+                spill.seek(start * frame_bytes)
+                spill.readinto(memoryview(buffer[:count]).cast("B"))
+                for i in range(count - 1, -1, -1):
+                    out.write(buffer[i])
+                end = start
+        return frame_count
+    finally:
+        os.remove(spill_path)
+
+
+def _gray_thumbnail(image: np.ndarray, aspect: float = None, size: int = 64) -> np.ndarray:
+    """
+    缩成灰度小图用于相似度比较
+
+    Args:
+        image: BGR 图片
+        aspect: 先按该宽高比居中裁剪（视频帧与 1:1 的姿势图比较时使用）
+        size: 缩略图边长
+    """
+    if aspect:
+        h, w = image.shape[:2]
+        if w / h > aspect:
+            crop_w = int(h * aspect)
+            x0 = (w - crop_w) // 2
+            image = image[:, x0:x0 + crop_w]
+        else:
+            crop_h = int(w / aspect)
+            y0 = (h - crop_h) // 2
+            image = image[y0:y0 + crop_h, :]
+    if image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    return cv2.resize(image, (size, size), interpolation=cv2.INTER_AREA).astype(np.float32) / 255.0
+
+
+def frame_difference(frame: np.ndarray, image_path: str) -> float:
+    """视频帧与图片的差异（灰度小图平均绝对差，0 表示相同，1 表示完全相反）"""
+    image = cv2.imread(image_path, cv2.IMREAD_UNCHANGED)
+    if image is None:
+        raise Exception(f"无法读取图片: {image_path}")
+    if image.ndim == 3 and image.shape[2] == 4:
+        # 透明背景按白色合成（与视频里的背景一致）
+        alpha = image[:, :, 3:4].astype(np.float32) / 255.0
+        image = (image[:, :, :3].astype(np.float32) * alpha + 255.0 * (1 - alpha)).astype(np.uint8)
+    aspect = image.shape[1] / image.shape[0]
+    return float(np.mean(np.abs(_gray_thumbnail(frame, aspect) - _gray_thumbnail(image))))
+
+
+def reversal_quality(
+    reversed_path: str,
+    start_image: str,
+    end_image: str,
+    max_endpoint_diff: float = 0.08,
+    max_cut_ratio: float = 6.0,
+) -> dict:
+    """
+    倒放过渡视频的质量检查
+
+    倒放后的 X2Y 要能和其他视频无缝衔接：首帧应接近 X 姿势图，尾帧应接近 Y 姿势图；
+    原视频中如果有突变（镜头切换/闪帧），倒放后会很明显，也判为不合格。
+
+    Args:
+        reversed_path: 倒放后的视频
+        start_image: 起始姿势图（X.png）
+        end_image: 结束姿势图（Y.png）
+        max_endpoint_diff: 首尾帧与姿势图允许的最大差异
+        max_cut_ratio: 相邻帧最大差异 / 相邻帧差异中位数 的上限（超过视为突变）
+
+    Returns:
+        {"passed", "start_diff", "end_diff", "cut_ratio", "reason"}
+    """
+    cap = cv2.VideoCapture(reversed_path)
+    if not cap.isOpened():
+        raise Exception(f"无法打开视频: {reversed_path}")
+
+    first = last = previous = None
+    steps = []
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        thumb = _gray_thumbnail(frame)
+        if first is None:
+            first = frame
+        else:
+            steps.append(float(np.mean(np.abs(thumb - previous))))
+        previous = thumb
+        last = frame
+    cap.release()
+
+    if first is None:
+        return {"passed": False, "start_diff": None, "end_diff": None, "cut_ratio": None, "reason": "视频无法解码"}
+
+    start_diff = frame_difference(first, start_image)
+    end_diff = frame_difference(last, end_image)
+    # 中位数设下限，避免几乎静止的视频里一点噪声就被放大成“突变”
+    median_step = float(np.median(steps)) if steps else 0.0
+    max_step = max(steps) if steps else 0.0
+    cut_ratio = max_step / max(median_step, 0.005)
+
+    reasons = []
+    if start_diff > max_endpoint_diff:
+        reasons.append(f"首帧与{Path(start_image).stem}差异 {start_diff:.3f}")
+    if end_diff > max_endpoint_diff:
+        reasons.append(f"尾帧与{Path(end_image).stem}差异 {end_diff:.3f}")
+    if cut_ratio > max_cut_ratio and max_step > 0.05:
+        reasons.append(f"存在突变帧（{cut_ratio:.1f}倍）")
+
+    return {
+        "passed": not reasons,
+        "start_diff": round(start_diff, 4),
+        "end_diff": round(end_diff, 4),
+        "cut_ratio": round(cut_ratio, 2),
+        "reason": "；".join(reasons) if reasons else "ok",
+    }